@@ -0,0 +1,234 @@
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from app.ai.batching import run_batched, run_batched_async
+from app.ai.gateway import AI_MAX_CONCURRENCY, create_completion, create_completion_async
+from app.ai.result_cache import get_cached_many, store_results
+from app.ai.local_classifier import classify_local
+from app.ai.summarizer import summarize_email, summarize_email_async
+from app.ai.runner import run_bounded
+from app.ai.preprocess import prepare_body
+from app.metrics import record_fallback, record_results
+from app.ai.classifier import (
+    CLASSIFICATION_RULES,
+    CLASSIFY_BATCH_MAX_TOKENS,
+    CLASSIFY_BATCH_MAX_ITEMS,
+    CLASSIFY_BATCH_MAX_RETRIES,
+    _fallback_result,
+    _validate_result,
+)
+
+MODEL_VERSION = "gpt-4o-mini-v1"
+PROMPT_VERSION = "analyze-v1"
+
+# Cached results are only reused while both model and prompt are unchanged.
+CACHE_VERSION = f"{MODEL_VERSION}/{PROMPT_VERSION}"
+
+SUMMARY_RULES = """
+Also summarize each email in one or two short sentences:
+- Be neutral and factual
+- Do NOT add advice, urgency or interpretation
+- Do NOT exceed 25 words
+- Use null as the summary if the email has no meaningful content
+"""
+
+
+def _fallback(error) -> dict:
+    result = _fallback_result(error)
+    result["summary"] = None
+    return result
+
+
+def _validate(item) -> dict | None:
+    """
+    Validate classification and summary fields of one analysis result.
+    """
+    result = _validate_result(item)
+    if result is None:
+        return None
+
+    summary = item.get("summary")
+    if summary is not None and not isinstance(summary, str):
+        return None
+
+    result["summary"] = summary.strip() if summary else None
+    return result
+
+
+def _request(bodies: list) -> dict:
+    emails_block = "\n\n".join(
+        f'Email {index}:\n"""{body}"""'
+        for index, body in enumerate(bodies)
+    )
+
+    prompt = f"""{CLASSIFICATION_RULES}{SUMMARY_RULES}
+You will receive {len(bodies)} emails, numbered from 0.
+Analyze each one independently and return one result per email.
+
+Return JSON in this format:
+{{
+  "results": [
+    {{
+      "id": <email number>,
+      "email_type": "<newsletter | support | marketing>",
+      "confidence": <float>,
+      "reason": "<short explanation referencing the rules above>",
+      "summary": "<short summary or null>"
+    }}
+  ]
+}}
+
+{emails_block}
+"""
+
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "system", "content": "You classify and summarize emails for a backend."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.2,
+        "max_tokens": 130 * len(bodies) + 50,
+        "response_format": {"type": "json_object"}
+    }
+
+
+def _parse(content: str, count: int) -> list:
+    items = json.loads(content).get("results", [])
+
+    results = [None] * count
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("id")
+        if isinstance(index, int) and 0 <= index < count:
+            results[index] = _validate(item)
+
+    return results
+
+
+def _analyze_batch(bodies: list) -> list:
+    response = create_completion("analyzer", _request(bodies))
+    return _parse(response.choices[0].message.content, len(bodies))
+
+
+async def _analyze_batch_async(bodies: list) -> list:
+    response = await create_completion_async("analyzer", _request(bodies))
+    return _parse(response.choices[0].message.content, len(bodies))
+
+
+def _local_results(bodies: list, results: list) -> list:
+    """
+    Fill in confident local classifications for emails the cache missed.
+    Returns their indexes; those emails still need a summary.
+    """
+    local = []
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = classify_local(bodies[index])
+            if results[index] is not None:
+                local.append(index)
+    return local
+
+
+def _with_summary(result: dict, summary: dict) -> dict:
+    # summary_model_version tells a failed summary apart from an empty one
+    return dict(
+        result,
+        summary=summary["summary"],
+        summary_model_version=summary["model_version"],
+    )
+
+
+def _merge_fresh(bodies: list, results: list, missing: list, fresh: list) -> list:
+    merged = []
+    for index, result in zip(missing, fresh):
+        if result is None:
+            record_fallback("analyze_emails")
+            result = _fallback("no valid result after batch retries")
+        else:
+            merged.append((bodies[index], result))
+        results[index] = result
+    return merged
+
+
+def analyze_emails(bodies: list) -> list:
+    """
+    Classify and summarize emails in one pass.
+
+    Each result carries email_type, confidence, reason, summary and
+    model_version. Emails share batched requests exactly like
+    classify_emails, so every email costs one slot in one LLM call
+    instead of a classification call plus a summarization call.
+
+    Cached results are used first. Emails the local pre-classifier is
+    confident about are only summarized; the rest go to the LLM.
+    """
+    if not bodies:
+        return []
+
+    record_results("analyze_emails", len(bodies))
+    results = get_cached_many("analyze", bodies, CACHE_VERSION)
+    local = _local_results(bodies, results)
+    missing = [index for index, result in enumerate(results) if result is None]
+
+    if local:
+        with ThreadPoolExecutor(max_workers=min(AI_MAX_CONCURRENCY, len(local))) as executor:
+            summaries = executor.map(summarize_email, [bodies[index] for index in local])
+            for index, summary in zip(local, summaries):
+                results[index] = _with_summary(results[index], summary)
+
+    if missing:
+        fresh = run_batched(
+            [prepare_body(bodies[index]) for index in missing],
+            _analyze_batch,
+            max_tokens=CLASSIFY_BATCH_MAX_TOKENS,
+            max_items=CLASSIFY_BATCH_MAX_ITEMS,
+            max_retries=CLASSIFY_BATCH_MAX_RETRIES,
+        )
+
+        store_results("analyze", _merge_fresh(bodies, results, missing, fresh), CACHE_VERSION)
+
+    return results
+
+
+def analyze_email(body: str) -> dict:
+    return analyze_emails([body])[0]
+
+
+async def analyze_emails_async(bodies: list, *, concurrency: int | None = None) -> list:
+    """
+    Async variant of analyze_emails on the shared AsyncOpenAI client.
+    """
+    if not bodies:
+        return []
+
+    record_results("analyze_emails", len(bodies))
+    results = await asyncio.to_thread(get_cached_many, "analyze", bodies, CACHE_VERSION)
+    local = _local_results(bodies, results)
+    missing = [index for index, result in enumerate(results) if result is None]
+
+    if local:
+        summaries = await run_bounded(
+            [bodies[index] for index in local],
+            summarize_email_async,
+            concurrency=concurrency,
+        )
+        for index, summary in zip(local, summaries):
+            results[index] = _with_summary(results[index], summary)
+
+    if missing:
+        fresh = await run_batched_async(
+            [prepare_body(bodies[index]) for index in missing],
+            _analyze_batch_async,
+            max_tokens=CLASSIFY_BATCH_MAX_TOKENS,
+            max_items=CLASSIFY_BATCH_MAX_ITEMS,
+            max_retries=CLASSIFY_BATCH_MAX_RETRIES,
+            concurrency=concurrency or AI_MAX_CONCURRENCY,
+        )
+
+        stored = _merge_fresh(bodies, results, missing, fresh)
+        await asyncio.to_thread(store_results, "analyze", stored, CACHE_VERSION)
+
+    return results
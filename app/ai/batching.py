@@ -0,0 +1,155 @@
+import asyncio
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token for English text).
+    Good enough for sizing requests; not meant to be exact.
+    """
+    if not text:
+        return 0
+    return len(text) // 4 + 1
+
+
+def pack_batches(texts: list, *, max_tokens: int, max_items: int) -> list:
+    """
+    Greedily group text indices into batches bounded by an estimated
+    token budget and an item count. A single oversized text still gets
+    its own batch rather than being dropped.
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+
+    for index, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+
+        if current and (
+            current_tokens + tokens > max_tokens
+            or len(current) >= max_items
+        ):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+
+        current.append(index)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+def run_batched(
+    texts: list,
+    request_batch,
+    *,
+    max_tokens: int,
+    max_items: int,
+    max_retries: int = 2,
+) -> list:
+    """
+    Run request_batch over packed batches of texts.
+
+    request_batch(batch_texts) must return a list of the same length with
+    a validated result or None per item. Items that come back as None are
+    re-packed into smaller batches and retried on their own, up to
+    max_retries extra rounds; anything still missing is returned as None
+    for the caller to handle.
+    """
+    results = [None] * len(texts)
+    pending = list(range(len(texts)))
+
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+
+        # Shrink batches on each retry so one bad item stops sinking the rest
+        round_max_items = max(1, max_items >> attempt)
+
+        pending_texts = [texts[i] for i in pending]
+        failed = []
+
+        for batch in pack_batches(
+            pending_texts,
+            max_tokens=max_tokens,
+            max_items=round_max_items,
+        ):
+            indices = [pending[i] for i in batch]
+
+            try:
+                batch_results = request_batch([texts[i] for i in indices])
+            except Exception:
+                batch_results = [None] * len(indices)
+
+            if len(batch_results) != len(indices):
+                batch_results = [None] * len(indices)
+
+            for index, result in zip(indices, batch_results):
+                if result is None:
+                    failed.append(index)
+                else:
+                    results[index] = result
+
+        pending = failed
+
+    return results
+
+
+async def run_batched_async(
+    texts: list,
+    request_batch,
+    *,
+    max_tokens: int,
+    max_items: int,
+    max_retries: int = 2,
+    concurrency: int = 4,
+) -> list:
+    """
+    Async counterpart of run_batched: request_batch is a coroutine function
+    and the batches of each round run concurrently, bounded by concurrency.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = [None] * len(texts)
+    pending = list(range(len(texts)))
+
+    async def _request(indices):
+        try:
+            async with semaphore:
+                batch_results = await request_batch([texts[i] for i in indices])
+        except Exception:
+            return [None] * len(indices)
+
+        if len(batch_results) != len(indices):
+            return [None] * len(indices)
+        return batch_results
+
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+
+        round_max_items = max(1, max_items >> attempt)
+
+        batches = [
+            [pending[i] for i in batch]
+            for batch in pack_batches(
+                [texts[i] for i in pending],
+                max_tokens=max_tokens,
+                max_items=round_max_items,
+            )
+        ]
+
+        batch_results = await asyncio.gather(*(_request(batch) for batch in batches))
+
+        failed = []
+        for indices, round_results in zip(batches, batch_results):
+            for index, result in zip(indices, round_results):
+                if result is None:
+                    failed.append(index)
+                else:
+                    results[index] = result
+
+        pending = failed
+
+    return results
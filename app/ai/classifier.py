@@ -1,22 +1,32 @@
 import os
-import json 
-from openai import OpenAI
+import json
+import asyncio
 from dotenv import load_dotenv
 
+from app.ai.batching import run_batched, run_batched_async
+from app.ai.gateway import AI_MAX_CONCURRENCY, create_completion, create_completion_async
+from app.ai.result_cache import get_cached, store_result, get_cached_many, store_results
+from app.ai.local_classifier import classify_local
+from app.ai.preprocess import prepare_body
+from app.metrics import record_fallback, record_results
+
 load_dotenv()
 
-client=OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+MODEL_VERSION = "gpt-4o-mini-v1"
+PROMPT_VERSION = "classify-v3"
 
+# Cached results are only reused while both model and prompt are unchanged.
+CACHE_VERSION = f"{MODEL_VERSION}/{PROMPT_VERSION}"
 
 ALLOWED_TYPES = {"newsletter", "support", "marketing"}
 
-def classify_email(email: str) -> dict:
-    """
-    Real LLM-powered email classifier.
-    Returns deterministic, structured output.
-    """
+# Batch sizing for classify_emails: estimated input tokens and emails per request.
+CLASSIFY_BATCH_MAX_TOKENS = int(os.getenv("CLASSIFY_BATCH_MAX_TOKENS", "6000"))
+CLASSIFY_BATCH_MAX_ITEMS = int(os.getenv("CLASSIFY_BATCH_MAX_ITEMS", "10"))
+CLASSIFY_BATCH_MAX_RETRIES = int(os.getenv("CLASSIFY_BATCH_MAX_RETRIES", "2"))
+
 
-    prompt = f"""
+CLASSIFICATION_RULES = """
 You are a strict email classification system for a backend product.
 
 Your task is to classify the email into EXACTLY ONE of the following categories:
@@ -45,7 +55,44 @@ Rules:
 - Return ONLY valid JSON
 - No explanations outside JSON
 - Confidence must be a number between 0 and 1
+"""
+
+
+def _fallback_result(error) -> dict:
+    return{
+        "email_type":"support",
+        "confidence":0.0,
+        "reason":f"AI classification model failed:{str(error)}",
+        "model_version":"fallback-v1"
+    }
+
+
+def _validate_result(result) -> dict | None:
+    """
+    Normalize one model result, or return None if it is unusable.
+    """
+    if not isinstance(result, dict):
+        return None
+
+    email_type=result.get("email_type")
+    if email_type not in ALLOWED_TYPES:
+        return None
+
+    try:
+        confidence=float(result.get("confidence",0))
+    except (TypeError, ValueError):
+        return None
+
+    return{
+        "email_type":email_type,
+        "confidence":min(max(confidence,0.0),1.0),
+        "reason":result.get("reason",""),
+        "model_version":MODEL_VERSION
+    }
+
 
+def _single_prompt(email: str) -> str:
+    return f"""{CLASSIFICATION_RULES}
 Return JSON in this format:
 {{
   "email_type": "<newsletter | support | marketing>",
@@ -57,39 +104,235 @@ Email content:
 \"\"\"{email}\"\"\"
 """
 
+
+def _single_request(email: str) -> dict:
+    return {
+        "model":"gpt-4o-mini",
+        "messages":[
+            {"role":"system","content":"You classify emails for a backend."},
+            {"role":"user","content":_single_prompt(prepare_body(email))}
+        ],
+        "temperature":0.2,
+        "max_tokens":150
+    }
+
+
+def _parse_single(content: str) -> dict:
+    result=_validate_result(json.loads(content))
+
+    if result is None:
+        raise ValueError("Invalid email type returned by model")
+
+    return result
+
+
+def classify_email(email: str) -> dict:
+    """
+    Real LLM-powered email classifier.
+    Returns deterministic, structured output.
+    """
+    record_results("classify_email")
+
+    local = classify_local(email)
+    if local is not None:
+        return local
+
+    cached = get_cached("classify", email, CACHE_VERSION)
+    if cached is not None:
+        return cached
+
     try:
-        response=client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role":"system","content":"You classify emails for a backend."},
-                {"role":"user","content":prompt}
-            ],
-            temperature=0.2,
-            max_tokens=150
-        )
+        response=create_completion("classifier", _single_request(email))
 
-        content =response.choices[0].message.content
-        result=json.loads(content)
+        result=_parse_single(response.choices[0].message.content)
+
+        store_result("classify", email, CACHE_VERSION, result)
+        return result
 
-        email_type=result.get("email_type")
-        confidence=float(result.get("confidence",0))
-        reason=result.get("reason","")
-
-
-        if(email_type) not in ALLOWED_TYPES:
-            raise ValueError("Invalid email type returned by model")
-        
-        return{
-            "email_type":email_type,
-            "confidence":confidence,
-            "reason":reason,
-            "model_version":"gpt-4o-mini-v1"
-        }
-    
     except Exception as e:
-        return{
-            "email_type":"support",
-            "confidence":0.0,
-            "reason":f"AI classification model failed:{str(e)}",
-            "model_version":"fallback-v1"
-        }
+        record_fallback("classify_email")
+        return _fallback_result(e)
+
+
+async def classify_email_async(email: str) -> dict:
+    """
+    Async variant of classify_email on the shared AsyncOpenAI client.
+    """
+    record_results("classify_email")
+
+    local = classify_local(email)
+    if local is not None:
+        return local
+
+    cached = await asyncio.to_thread(get_cached, "classify", email, CACHE_VERSION)
+    if cached is not None:
+        return cached
+
+    try:
+        response=await create_completion_async("classifier", _single_request(email))
+
+        result=_parse_single(response.choices[0].message.content)
+
+        await asyncio.to_thread(store_result, "classify", email, CACHE_VERSION, result)
+        return result
+
+    except Exception as e:
+        record_fallback("classify_email")
+        return _fallback_result(e)
+
+
+def _batch_request(bodies: list) -> dict:
+    emails_block = "\n\n".join(
+        f'Email {index}:\n"""{body}"""'
+        for index, body in enumerate(bodies)
+    )
+
+    prompt = f"""{CLASSIFICATION_RULES}
+You will receive {len(bodies)} emails, numbered from 0.
+Classify each one independently and return one result per email.
+
+Return JSON in this format:
+{{
+  "results": [
+    {{
+      "id": <email number>,
+      "email_type": "<newsletter | support | marketing>",
+      "confidence": <float>,
+      "reason": "<short explanation referencing the rules above>"
+    }}
+  ]
+}}
+
+{emails_block}
+"""
+
+    return {
+        "model":"gpt-4o-mini",
+        "messages":[
+            {"role":"system","content":"You classify emails for a backend."},
+            {"role":"user","content":prompt}
+        ],
+        "temperature":0.2,
+        "max_tokens":80 * len(bodies) + 50,
+        "response_format":{"type":"json_object"}
+    }
+
+
+def _parse_batch(content: str, count: int) -> list:
+    """
+    Returns one validated result or None per email, in input order.
+    """
+    items=json.loads(content).get("results",[])
+
+    results=[None] * count
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index=item.get("id")
+        if isinstance(index, int) and 0 <= index < count:
+            results[index]=_validate_result(item)
+
+    return results
+
+
+def _classify_batch(bodies: list) -> list:
+    """
+    Classify several emails in one request.
+    """
+    response=create_completion("classifier", _batch_request(bodies))
+    return _parse_batch(response.choices[0].message.content, len(bodies))
+
+
+async def _classify_batch_async(bodies: list) -> list:
+    response=await create_completion_async("classifier", _batch_request(bodies))
+    return _parse_batch(response.choices[0].message.content, len(bodies))
+
+
+def _merge_fresh(bodies: list, results: list, missing: list, fresh: list) -> list:
+    """
+    Fill fresh model results into results (fallback where missing) and
+    return the (body, result) pairs that should be cached.
+    """
+    merged = []
+    for index, result in zip(missing, fresh):
+        if result is None:
+            record_fallback("classify_emails")
+            result = _fallback_result("no valid result after batch retries")
+        else:
+            merged.append((bodies[index], result))
+        results[index] = result
+    return merged
+
+
+def _known_results(bodies: list) -> list:
+    """
+    Local pre-classifier results, then cached ones (one lookup for the
+    whole batch); None where the LLM is still needed.
+    """
+    results = [classify_local(body) for body in bodies]
+    unknown = [index for index, result in enumerate(results) if result is None]
+
+    cached = get_cached_many("classify", [bodies[index] for index in unknown], CACHE_VERSION)
+    for index, result in zip(unknown, cached):
+        results[index] = result
+
+    return results
+
+
+def classify_emails(bodies: list) -> list:
+    """
+    Classify many emails with as few LLM requests as possible.
+
+    Confident local pre-classifier results and cached results are used
+    first. The remaining emails are packed into
+    token-bounded batches sharing a single rules preamble. Each result is
+    validated on its own; only the items that failed are retried, and
+    anything still failing gets the fallback.
+    """
+    if not bodies:
+        return []
+
+    record_results("classify_emails", len(bodies))
+    results = _known_results(bodies)
+    missing = [index for index, result in enumerate(results) if result is None]
+
+    if missing:
+        fresh = run_batched(
+            [prepare_body(bodies[index]) for index in missing],
+            _classify_batch,
+            max_tokens=CLASSIFY_BATCH_MAX_TOKENS,
+            max_items=CLASSIFY_BATCH_MAX_ITEMS,
+            max_retries=CLASSIFY_BATCH_MAX_RETRIES,
+        )
+
+        store_results("classify", _merge_fresh(bodies, results, missing, fresh), CACHE_VERSION)
+
+    return results
+
+
+async def classify_emails_async(bodies: list, *, concurrency: int | None = None) -> list:
+    """
+    Async variant of classify_emails; batches are sent concurrently on the
+    shared AsyncOpenAI client, at most `concurrency` at a time.
+    """
+    if not bodies:
+        return []
+
+    record_results("classify_emails", len(bodies))
+    results = await asyncio.to_thread(_known_results, bodies)
+    missing = [index for index, result in enumerate(results) if result is None]
+
+    if missing:
+        fresh = await run_batched_async(
+            [prepare_body(bodies[index]) for index in missing],
+            _classify_batch_async,
+            max_tokens=CLASSIFY_BATCH_MAX_TOKENS,
+            max_items=CLASSIFY_BATCH_MAX_ITEMS,
+            max_retries=CLASSIFY_BATCH_MAX_RETRIES,
+            concurrency=concurrency or AI_MAX_CONCURRENCY,
+        )
+
+        stored = _merge_fresh(bodies, results, missing, fresh)
+        await asyncio.to_thread(store_results, "classify", stored, CACHE_VERSION)
+
+    return results
@@ -1,32 +1,63 @@
 import os
 import json
-from openai import OpenAI
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-load_dotenv()
+from app.ai.batching import estimate_tokens
+from app.ai.gateway import AI_MAX_CONCURRENCY, INTERACTIVE, create_completion, create_completion_async, record_usage
+from app.ai.preprocess import prepare_body
+from app.ai.runner import run_bounded
+from app.metrics import track_openai_call, record_fallback, record_results
+from app.tracing import start_span, end_span, in_current_trace
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+load_dotenv()
 
 MODEL_VERSION = "gpt-4o-mini-v1"
 
+# Summaries should already be short; this only guards against outliers.
+DIGEST_ITEM_TOKEN_BUDGET = 120
 
-def generate_digest(summaries: list, categories: list) -> dict:
-    """
-    Generates a time-window inbox digest.
-    Safe, deterministic, production-ready.
-    """
+# Largest context a single digest prompt may carry. Bigger windows are
+# digested hierarchically: one partial digest per category/day chunk,
+# then partials are reduced until they fit one final request.
+DIGEST_CONTEXT_TOKEN_BUDGET = int(os.getenv("DIGEST_CONTEXT_TOKEN_BUDGET", "3000"))
 
-    if not summaries:
-        return {
-            "digest": "No emails found for this time period.",
-            "model_version": MODEL_VERSION
-        }
+# Partial digests are capped on output and again when fed back in.
+PARTIAL_MAX_TOKENS = 180
+PARTIAL_ITEM_TOKEN_BUDGET = 200
+
+# Smallest per-partial budget the final request cuts partials down to
+# before it starts leaving partials out.
+PARTIAL_MIN_ITEM_TOKEN_BUDGET = 25
+
+# Each reduce pass must fit at least two partials per request, or it
+# never shrinks the list (label and bullet overhead included).
+MIN_DIGEST_CONTEXT_TOKEN_BUDGET = 2 * (PARTIAL_ITEM_TOKEN_BUDGET + 20)
+
+if DIGEST_CONTEXT_TOKEN_BUDGET < MIN_DIGEST_CONTEXT_TOKEN_BUDGET:
+    raise ValueError(
+        f"DIGEST_CONTEXT_TOKEN_BUDGET must be at least {MIN_DIGEST_CONTEXT_TOKEN_BUDGET}"
+    )
 
-    joined_context = "\n".join(
-        f"- [{cat}] {summary}"
+
+def _empty_digest() -> dict:
+    return {
+        "digest": "No emails found for this time period.",
+        "model_version": MODEL_VERSION
+    }
+
+
+def _context(summaries: list, categories: list, item_budget: int = DIGEST_ITEM_TOKEN_BUDGET) -> str:
+    return "\n".join(
+        f"- [{cat}] {prepare_body(summary, item_budget)}"
         for summary, cat in zip(summaries, categories)
     )
 
+
+def _request(summaries: list, categories: list, item_budget: int = DIGEST_ITEM_TOKEN_BUDGET) -> dict:
+    joined_context = _context(summaries, categories, item_budget)
+
     prompt = f"""
 You are an inbox intelligence system.
 
@@ -48,29 +79,433 @@ Email summaries:
 {joined_context}
 """
 
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "system", "content": "You generate inbox intelligence digests."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.2,
+        "max_tokens": 250
+    }
+
+
+def _partial_request(chunk: dict) -> dict:
+    prompt = f"""
+You are an inbox intelligence system.
+
+The notes below cover {chunk["label"]}.
+Condense them into 2 to 4 short bullet points describing the main patterns.
+
+Rules:
+- No email-by-email repetition
+- Neutral, analytical tone
+- RETURN ONLY JSON
+
+JSON format:
+{{
+  "digest": "<bullet points>"
+}}
+
+Notes:
+{_context(chunk["texts"], chunk["labels"], chunk["item_budget"])}
+"""
+
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "system", "content": "You generate inbox intelligence digests."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.2,
+        "max_tokens": PARTIAL_MAX_TOKENS,
+        "response_format": {"type": "json_object"}
+    }
+
+
+def _parse(content: str) -> dict:
+    result = json.loads(content.strip())
+
+    return {
+        "digest": result.get("digest", "Digest could not be generated."),
+        "model_version": MODEL_VERSION
+    }
+
+
+def _fallback(function: str) -> dict:
+    record_fallback(function)
+    return {
+        "digest": "AI digest generation failed. Please retry later.",
+        "model_version": "fallback-v1"
+    }
+
+
+def _fits(texts: list, labels: list, item_budget: int) -> bool:
+    return estimate_tokens(_context(texts, labels, item_budget)) <= DIGEST_CONTEXT_TOKEN_BUDGET
+
+
+def _pack(entries: list, item_budget: int) -> list:
+    """
+    Pack consecutive (label, text) entries into groups whose context
+    stays under DIGEST_CONTEXT_TOKEN_BUDGET.
+    """
+    groups = []
+    current = []
+    current_tokens = 0
+
+    for label, text in entries:
+        tokens = min(estimate_tokens(text), item_budget) + estimate_tokens(label) + 4
+        if current and current_tokens + tokens > DIGEST_CONTEXT_TOKEN_BUDGET:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append((label, text))
+        current_tokens += tokens
+
+    if current:
+        groups.append(current)
+
+    return groups
+
+
+def _chunk(label: str, entries: list, item_budget: int) -> dict:
+    return {
+        "label": label,
+        "labels": [entry_label for entry_label, _ in entries],
+        "texts": [text for _, text in entries],
+        "item_budget": item_budget,
+    }
+
+
+def _map_chunks(summaries: list, categories: list, dates: list) -> list:
+    """
+    Group summaries by category and pack consecutive days of each
+    category into chunks small enough for one request.
+    """
+    by_category = defaultdict(list)
+    for summary, category, received_at in zip(summaries, categories, dates):
+        day = received_at.date().isoformat() if received_at else "undated"
+        by_category[category or "uncategorized"].append((day, summary))
+
+    chunks = []
+    for category in sorted(by_category):
+        entries = sorted(by_category[category], key=lambda entry: entry[0])
+        for group in _pack(entries, DIGEST_ITEM_TOKEN_BUDGET):
+            first, last = group[0][0], group[-1][0]
+            span = first if first == last else f"{first} to {last}"
+            chunks.append(_chunk(f"{category}, {span}", group, DIGEST_ITEM_TOKEN_BUDGET))
+
+    return chunks
+
+
+def _reduce_chunks(partials: list) -> list:
+    return [
+        _chunk("several partial digests", group, PARTIAL_ITEM_TOKEN_BUDGET)
+        for group in _pack(partials, PARTIAL_ITEM_TOKEN_BUDGET)
+    ]
+
+
+def _partials_fit(partials: list) -> bool:
+    return _fits(
+        [text for _, text in partials],
+        [label for label, _ in partials],
+        PARTIAL_ITEM_TOKEN_BUDGET,
+    )
+
+
+def _needs_reduce(partials: list, chunks: list) -> bool:
+    # A pass that would not shrink the list could repeat forever; the
+    # final request then cuts the partials down instead (_final_inputs).
+    return bool(partials) and not _partials_fit(partials) and len(chunks) < len(partials)
+
+
+def _collect(chunks: list, results: list) -> list:
+    # Failed chunks are dropped; the digest is built from what succeeded
+    return [
+        (chunk["label"], result["digest"])
+        for chunk, result in zip(chunks, results)
+        if result is not None
+    ]
+
+
+def _run_partial(chunk: dict) -> dict | None:
+    record_results("partial_digest")
+    try:
+        response = create_completion("digest_generator", _partial_request(chunk), priority=INTERACTIVE)
+        return _parse(response.choices[0].message.content)
+    except Exception:
+        record_fallback("partial_digest")
+        return None
+
+
+async def _run_partial_async(chunk: dict) -> dict | None:
+    record_results("partial_digest")
+    try:
+        response = await create_completion_async("digest_generator", _partial_request(chunk), priority=INTERACTIVE)
+        return _parse(response.choices[0].message.content)
+    except Exception:
+        record_fallback("partial_digest")
+        return None
+
+
+def _final_inputs(partials: list | None) -> tuple | None:
+    """
+    Arguments for the final request over the reduced partials, always
+    within DIGEST_CONTEXT_TOKEN_BUDGET: partials that still do not fit
+    are truncated (down to PARTIAL_MIN_ITEM_TOKEN_BUDGET each), then the
+    last ones are left out. Returns None if nothing is left.
+    """
+    texts = [text for _, text in partials or []]
+    labels = [label for label, _ in partials or []]
+    item_budget = PARTIAL_ITEM_TOKEN_BUDGET
+
+    while texts and not _fits(texts, labels, item_budget):
+        if item_budget > PARTIAL_MIN_ITEM_TOKEN_BUDGET:
+            item_budget = max(item_budget // 2, PARTIAL_MIN_ITEM_TOKEN_BUDGET)
+        else:
+            texts.pop()
+            labels.pop()
+
+    if not texts:
+        return None
+    return texts, labels, item_budget
+
+
+def _digest_inputs(summaries: list, categories: list, dates: list) -> tuple | None:
+    """
+    Arguments for the final digest request, running the map/reduce
+    levels first when the window is over budget. Returns None if every
+    partial digest failed.
+    """
+    if _fits(summaries, categories, DIGEST_ITEM_TOKEN_BUDGET):
+        return summaries, categories, DIGEST_ITEM_TOKEN_BUDGET
+
+    chunks = _map_chunks(summaries, categories, dates)
+
+    with ThreadPoolExecutor(max_workers=AI_MAX_CONCURRENCY) as executor:
+        partials = _collect(chunks, list(executor.map(in_current_trace(_run_partial), chunks)))
+
+        while _needs_reduce(partials, chunks := _reduce_chunks(partials)):
+            partials = _collect(chunks, list(executor.map(in_current_trace(_run_partial), chunks)))
+
+    return _final_inputs(partials)
+
+
+async def _reduce_partials_async(partials: list) -> list:
+    while _needs_reduce(partials, chunks := _reduce_chunks(partials)):
+        partials = _collect(chunks, await run_bounded(chunks, _run_partial_async))
+    return partials
+
+
+async def _digest_inputs_async(summaries: list, categories: list, dates: list) -> tuple | None:
+    if _fits(summaries, categories, DIGEST_ITEM_TOKEN_BUDGET):
+        return summaries, categories, DIGEST_ITEM_TOKEN_BUDGET
+
+    chunks = _map_chunks(summaries, categories, dates)
+    partials = _collect(chunks, await run_bounded(chunks, _run_partial_async))
+
+    return _final_inputs(await _reduce_partials_async(partials))
+
+
+async def partial_digest_async(label: str, summaries: list, categories: list) -> dict | None:
+    """
+    Condense summaries into one partial digest (a few bullets) that can
+    later be combined with others. Returns None on failure.
+    """
+    if not summaries:
+        return None
+
+    inputs = await _digest_inputs_async(summaries, categories, [None] * len(summaries))
+    if inputs is None:
+        return None
+
+    texts, labels, item_budget = inputs
+    return await _run_partial_async(_chunk(label, list(zip(labels, texts)), item_budget))
+
+
+def generate_digest(summaries: list, categories: list, dates: list | None = None) -> dict:
+    """
+    Generates a time-window inbox digest.
+    Safe, deterministic, production-ready.
+
+    Windows too large for one prompt are digested per category and day
+    in parallel, and the partial digests are reduced into the final one.
+    """
+
+    if not summaries:
+        return _empty_digest()
+
+    record_results("generate_digest")
+    try:
+        inputs = _digest_inputs(summaries, categories, dates or [None] * len(summaries))
+        if inputs is None:
+            return _fallback("generate_digest")
+
+        response = create_completion("digest_generator", _request(*inputs), priority=INTERACTIVE)
+
+        return _parse(response.choices[0].message.content)
+
+    except Exception as e:
+
+        return _fallback("generate_digest")
+
+
+async def generate_digest_async(summaries: list, categories: list, dates: list | None = None) -> dict:
+    """
+    Async variant of generate_digest on the shared AsyncOpenAI client.
+    """
+
+    if not summaries:
+        return _empty_digest()
+
+    record_results("generate_digest")
+    try:
+        inputs = await _digest_inputs_async(
+            summaries, categories, dates or [None] * len(summaries)
+        )
+        if inputs is None:
+            return _fallback("generate_digest")
+
+        response = await create_completion_async("digest_generator", _request(*inputs), priority=INTERACTIVE)
+
+        return _parse(response.choices[0].message.content)
+
+    except Exception as e:
+
+        return _fallback("generate_digest")
+
+
+async def combine_digests_async(partials: list) -> dict:
+    """
+    Final digest from stored partial digests, given as (label, text)
+    pairs, reducing them further first if they do not fit one request.
+    """
+
+    if not partials:
+        return _empty_digest()
+
+    record_results("combine_digests")
+    try:
+        inputs = _final_inputs(await _reduce_partials_async(partials))
+        if inputs is None:
+            return _fallback("combine_digests")
+
+        response = await create_completion_async("digest_generator", _request(*inputs), priority=INTERACTIVE)
+
+        return _parse(response.choices[0].message.content)
+
+    except Exception as e:
+
+        return _fallback("combine_digests")
+
+
+def _stream_request(summaries: list, categories: list, item_budget: int = DIGEST_ITEM_TOKEN_BUDGET) -> dict:
+    # Plain-text output so tokens can be shown as they arrive
+    prompt = f"""
+You are an inbox intelligence system.
+
+Based on the following email summaries, extract patterns and trends.
+
+Rules:
+- 4 to 6 bullet points, each on its own line starting with "- "
+- No email-by-email repetition
+- Neutral, analytical tone
+- Focus on patterns
+- Return ONLY the bullet points, no preamble
+
+Email summaries:
+{_context(summaries, categories, item_budget)}
+"""
+
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "system", "content": "You generate inbox intelligence digests."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.2,
+        "max_tokens": 250,
+        "stream": True,
+        "stream_options": {"include_usage": True}
+    }
+
+
+async def _stream_inputs(inputs: tuple):
+    request = _stream_request(*inputs)
+
+    # Timed until the last chunk; usage arrives on the final event
+    current = start_span("openai", module="digest_generator", model=request["model"], stream=True)
+    error = None
+    try:
+        with track_openai_call("digest_generator", request["model"]):
+            stream = await create_completion_async("digest_generator", request, priority=INTERACTIVE)
+
+            async for event in stream:
+                if event.usage is not None:
+                    record_usage("digest_generator", request, event.usage)
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if delta:
+                    yield delta, MODEL_VERSION
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        end_span(current, error)
+
+
+async def stream_digest(summaries: list, categories: list, dates: list | None = None):
+    """
+    Stream the digest as text chunks via the OpenAI streaming API.
+
+    Yields (chunk, model_version) tuples. On failure the fallback message
+    is yielded as a final chunk with the fallback model version. For large
+    windows the map/reduce levels run first and only the final digest is
+    streamed.
+    """
+
+    if not summaries:
+        empty = _empty_digest()
+        yield empty["digest"], empty["model_version"]
+        return
+
+    record_results("stream_digest")
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You generate inbox intelligence digests."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-            max_tokens=250
+        inputs = await _digest_inputs_async(
+            summaries, categories, dates or [None] * len(summaries)
         )
+        if inputs is None:
+            raise RuntimeError("every partial digest failed")
+
+        async for chunk in _stream_inputs(inputs):
+            yield chunk
+
+    except Exception as e:
+        fallback = _fallback("stream_digest")
+        yield fallback["digest"], fallback["model_version"]
 
-        content = response.choices[0].message.content.strip()
 
-        result = json.loads(content)
+async def stream_combined_digest(partials: list):
+    """
+    Streaming variant of combine_digests_async, yielding the same
+    (chunk, model_version) tuples as stream_digest.
+    """
+
+    if not partials:
+        empty = _empty_digest()
+        yield empty["digest"], empty["model_version"]
+        return
+
+    record_results("stream_digest")
+    try:
+        inputs = _final_inputs(await _reduce_partials_async(partials))
+        if inputs is None:
+            raise RuntimeError("every partial digest failed")
 
-        return {
-            "digest": result.get("digest", "Digest could not be generated."),
-            "model_version": MODEL_VERSION
-        }
+        async for chunk in _stream_inputs(inputs):
+            yield chunk
 
     except Exception as e:
-       
-        return {
-            "digest": "AI digest generation failed. Please retry later.",
-            "model_version": "fallback-v1"
-        }
+        fallback = _fallback("stream_digest")
+        yield fallback["digest"], fallback["model_version"]
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import openai
+from openai import OpenAI, AsyncOpenAI
+from dotenv import load_dotenv
+
+from app.ai.batching import estimate_tokens
+from app.ai.rate_limit import SharedTokenBuckets, INTERACTIVE, BULK
+from app.metrics import track_openai_call, record_openai_usage
+from app.tracing import span
+
+load_dotenv()
+
+# Host-wide OpenAI limits, shared by every API and worker process through
+# OPENAI_RATE_LIMIT_FILE. Set them a little under the account's limits.
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+OPENAI_BURST_SECONDS = float(os.getenv("OPENAI_BURST_SECONDS", "10"))
+OPENAI_RATE_LIMIT_FILE = os.getenv(
+    "OPENAI_RATE_LIMIT_FILE",
+    os.path.join(tempfile.gettempdir(), "email-classifier-openai-limits.json"),
+)
+
+# Share of the buckets that only interactive requests may use.
+OPENAI_BULK_RESERVE = float(os.getenv("OPENAI_BULK_RESERVE", "0.2"))
+
+# Attempts after a 429, 5xx or connection error before giving up.
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+
+# Default number of in-flight OpenAI requests for the async runners.
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+
+# The only OpenAI clients in the app. SDK retries are off so every retry
+# goes back through the shared limiter.
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+limiter = SharedTokenBuckets(
+    OPENAI_RATE_LIMIT_FILE,
+    requests_per_minute=OPENAI_RPM_LIMIT,
+    tokens_per_minute=OPENAI_TPM_LIMIT,
+    burst_seconds=OPENAI_BURST_SECONDS,
+    bulk_reserve=OPENAI_BULK_RESERVE,
+)
+
+_RETRYABLE = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def _estimate(request: dict) -> int:
+    """
+    Tokens a request may use: its prompt plus the completion cap.
+    """
+    prompt = sum(estimate_tokens(message["content"]) for message in request["messages"])
+    return prompt + request.get("max_tokens", 0)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+
+    return min(2 ** attempt, 30) * random.uniform(0.5, 1.0)
+
+
+def _backoff(error: Exception, attempt: int) -> float:
+    """
+    Seconds this caller should wait before retrying. A 429 pauses the
+    shared buckets instead, so every process backs off.
+    """
+    delay = _retry_delay(error, attempt)
+    if isinstance(error, openai.RateLimitError):
+        limiter.pause(delay)
+        return 0.0
+    return delay
+
+
+def record_usage(module: str, request: dict, usage) -> None:
+    """
+    Token metrics for a finished request; the difference from the
+    estimate charged up front goes back to the shared bucket.
+    """
+    record_openai_usage(module, request["model"], usage)
+    if usage is not None:
+        limiter.refund(_estimate(request) - usage.total_tokens)
+
+
+def create_completion(module: str, request: dict, *, priority: str = BULK):
+    """
+    chat.completions.create through the shared rate limiter, retrying
+    rate limits and transient errors, with metrics and a trace span per
+    attempt. Interactive requests go ahead of bulk ones.
+    """
+    estimated = _estimate(request)
+
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        limiter.acquire(estimated, priority)
+        try:
+            with span("openai", module=module, model=request["model"]), track_openai_call(module, request["model"]):
+                response = client.chat.completions.create(**request)
+        except _RETRYABLE as e:
+            if attempt == OPENAI_MAX_RETRIES:
+                raise
+            time.sleep(_backoff(e, attempt))
+            continue
+
+        record_usage(module, request, response.usage)
+        return response
+
+
+async def create_completion_async(module: str, request: dict, *, priority: str = BULK):
+    """
+    create_completion on the shared async client. With "stream": True the
+    opened stream is returned; the caller records its usage.
+    """
+    estimated = _estimate(request)
+    stream = request.get("stream", False)
+
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        await limiter.acquire_async(estimated, priority)
+        try:
+            if stream:
+                return await async_client.chat.completions.create(**request)
+
+            with span("openai", module=module, model=request["model"]), track_openai_call(module, request["model"]):
+                response = await async_client.chat.completions.create(**request)
+        except _RETRYABLE as e:
+            if attempt == OPENAI_MAX_RETRIES:
+                raise
+            await asyncio.sleep(_backoff(e, attempt))
+            continue
+
+        record_usage(module, request, response.usage)
+        return response
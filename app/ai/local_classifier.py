@@ -0,0 +1,330 @@
+"""
+CPU-only pre-classifier that runs before the LLM.
+
+Scores are the sum of a small multinomial logistic regression over token
+features (trained from stored classifications and manual overrides) and a
+set of hand-written rules. Only results whose confidence clears
+LOCAL_CLASSIFIER_THRESHOLD are used; everything else goes on to the LLM.
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+import random
+from collections import Counter
+from datetime import datetime
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.email import Email
+from app.models.email_body import EmailBody, decode_body
+from app.logger import logger
+
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "true").lower() == "true"
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+# Shared by every API and worker process; train with
+# python -m app.ai.local_classifier and each process picks the new file
+# up within LOCAL_MODEL_CHECK_SECONDS (it compares the file's mtime).
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH", "local_classifier.json")
+LOCAL_MODEL_CHECK_SECONDS = float(os.getenv("LOCAL_MODEL_CHECK_SECONDS", "10"))
+
+RULES_MODEL_VERSION = "local-rules-v1"
+LINEAR_MODEL_VERSION = "local-linear-v1"
+
+CLASSES = ("newsletter", "support", "marketing")
+
+# Vocabulary cap keeps the stored model small and scoring fast.
+MAX_VOCABULARY = 5000
+MAX_TRAINING_EXAMPLES = 20000
+TRAINING_EPOCHS = 8
+LEARNING_RATE = 0.5
+
+# Manual overrides are stronger evidence than model labels.
+OVERRIDE_WEIGHT = 3
+OVERRIDE_REASON = "Manually overridden by user"
+
+_TOKEN = re.compile(r"\d+%|[a-z][a-z0-9']{1,24}")
+
+# (pattern, class, log-odds weight)
+RULES = [
+    (re.compile(r"\d+\s?%\s?off", re.I), "marketing", 3.0),
+    (re.compile(r"\b(promo|coupon|discount)\s?code\b", re.I), "marketing", 3.0),
+    (re.compile(r"\b(shop|buy|order) now\b", re.I), "marketing", 2.5),
+    (re.compile(r"\blimited[- ]time\b|\bsale ends\b|\blast chance\b", re.I), "marketing", 2.0),
+    (re.compile(r"\bfree shipping\b", re.I), "marketing", 2.0),
+    (re.compile(r"\bview (this email )?in (your )?browser\b", re.I), "newsletter", 1.5),
+    (re.compile(r"\bnewsletter\b|\bweekly digest\b|\bthis week in\b", re.I), "newsletter", 2.5),
+    (re.compile(r"\b(can't|cannot|unable to) (log ?in|sign ?in|access)\b", re.I), "support", 3.0),
+    (re.compile(r"\b(error|bug|crash(es|ed)?|not working)\b", re.I), "support", 1.5),
+    (re.compile(r"\b(please help|need help|support ticket|ticket #?\d+)\b", re.I), "support", 2.5),
+]
+
+_model = None
+_model_mtime = None
+_checked_at = 0.0
+_lock = threading.Lock()
+_stats = {"local": 0, "forwarded": 0}
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall((text or "").lower())
+
+
+def _softmax(scores: dict) -> dict:
+    top = max(scores.values())
+    exp = {label: math.exp(score - top) for label, score in scores.items()}
+    total = sum(exp.values())
+    return {label: value / total for label, value in exp.items()}
+
+
+def _features(tokens, vocab: set) -> dict:
+    """
+    Binary features for in-vocabulary tokens, scaled to unit length.
+    """
+    if isinstance(tokens, str):
+        tokens = tokenize(tokens)
+    tokens = set(tokens) & vocab
+    if not tokens:
+        return {}
+    value = 1 / math.sqrt(len(tokens))
+    return {token: value for token in tokens}
+
+
+def train(examples) -> dict:
+    """
+    Fit a softmax regression from (text, label, weight) examples with a
+    few epochs of plain SGD.
+    """
+    rows = []
+    vocabulary = Counter()
+
+    for text, label, weight in examples:
+        if label not in CLASSES:
+            continue
+        tokens = set(tokenize(text))
+        vocabulary.update(tokens)
+        rows.append((tokens, label, weight))
+        if len(rows) >= MAX_TRAINING_EXAMPLES:
+            break
+
+    vocab = {token for token, _ in vocabulary.most_common(MAX_VOCABULARY)}
+
+    data = []
+    for tokens, label, weight in rows:
+        features = _features(tokens, vocab)
+        if features:
+            data.append((features, label, weight))
+
+    weights = {label: {} for label in CLASSES}
+    bias = {label: 0.0 for label in CLASSES}
+    rng = random.Random(0)
+
+    for epoch in range(TRAINING_EPOCHS):
+        rng.shuffle(data)
+        rate = LEARNING_RATE / (1 + epoch)
+
+        for features, label, weight in data:
+            scores = {
+                c: bias[c] + sum(weights[c].get(t, 0.0) * v for t, v in features.items())
+                for c in CLASSES
+            }
+            probabilities = _softmax(scores)
+
+            for c in CLASSES:
+                gradient = (probabilities[c] - (1.0 if c == label else 0.0)) * weight * rate
+                bias[c] -= gradient
+                class_weights = weights[c]
+                for token, value in features.items():
+                    class_weights[token] = class_weights.get(token, 0.0) - gradient * value
+
+    return {
+        "version": LINEAR_MODEL_VERSION,
+        "trained_at": datetime.utcnow().isoformat(),
+        "examples": len(data),
+        "bias": bias,
+        "weights": {
+            c: {t: round(w, 5) for t, w in class_weights.items() if abs(w) > 1e-4}
+            for c, class_weights in weights.items()
+        },
+    }
+
+
+def _training_examples(db: Session):
+    rows = (
+        db.query(EmailBody.data, EmailBody.codec, Email.ai_email_type, Email.ai_reason)
+        .join(EmailBody, EmailBody.email_id == Email.id)
+        .filter(
+            Email.ai_email_type.isnot(None),
+            (Email.ai_reason == OVERRIDE_REASON)
+            | (
+                (Email.confidence_score >= 0.8)
+                & Email.model_version.notlike("local-%")
+                & (Email.model_version != "fallback-v1")
+            ),
+        )
+        .yield_per(500)
+    )
+
+    for data, codec, label, reason in rows:
+        weight = OVERRIDE_WEIGHT if reason == OVERRIDE_REASON else 1
+        yield decode_body(data, codec), label, weight
+
+
+def train_from_db(db: Session, path: str = LOCAL_MODEL_PATH) -> dict:
+    """
+    Retrain from confident LLM labels and manual overrides, save the model
+    to `path` and start using it in this process. The file is replaced
+    atomically, so processes reloading it never read a partial model.
+    """
+    model = train(_training_examples(db))
+
+    partial = f"{path}.tmp"
+    with open(partial, "w") as f:
+        json.dump(model, f)
+    os.replace(partial, path)
+
+    set_model(model)
+
+    return {
+        "version": model["version"],
+        "trained_at": model["trained_at"],
+        "examples": model["examples"],
+    }
+
+
+def set_model(model: dict | None) -> None:
+    global _model
+
+    if model is not None:
+        model = dict(model, vocab=set().union(*model["weights"].values()))
+
+    with _lock:
+        _model = model
+
+
+def load_model(path: str = LOCAL_MODEL_PATH) -> None:
+    global _model_mtime
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return
+
+    try:
+        with open(path) as f:
+            set_model(json.load(f))
+    except Exception:
+        logger.exception("Failed to load local classifier model from %s", path)
+    finally:
+        # A broken file is not retried until it changes again
+        _model_mtime = mtime
+
+
+def _reload_if_changed() -> None:
+    """
+    Load LOCAL_MODEL_PATH again if it changed since it was last loaded;
+    checks the file at most every LOCAL_MODEL_CHECK_SECONDS.
+    """
+    global _checked_at
+
+    now = time.monotonic()
+    if now - _checked_at < LOCAL_MODEL_CHECK_SECONDS:
+        return
+    _checked_at = now
+
+    try:
+        mtime = os.stat(LOCAL_MODEL_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return
+
+    if mtime != _model_mtime:
+        logger.info("Reloading local classifier model from %s", LOCAL_MODEL_PATH)
+        load_model(LOCAL_MODEL_PATH)
+
+
+def predict(body: str) -> dict | None:
+    """
+    Score an email locally. Returns a classifier-shaped result, or None
+    when neither the rules nor the model have any signal.
+    """
+    model = _model
+    scores = {label: 0.0 for label in CLASSES}
+    matched = []
+
+    for pattern, label, weight in RULES:
+        if pattern.search(body or ""):
+            scores[label] += weight
+            matched.append(label)
+
+    if model is not None:
+        features = _features(body, model["vocab"])
+        if not features and not matched:
+            return None
+        for label in CLASSES:
+            class_weights = model["weights"][label]
+            scores[label] += model["bias"][label] + sum(
+                class_weights.get(token, 0.0) * value
+                for token, value in features.items()
+            )
+        version = model["version"]
+    else:
+        if not matched:
+            return None
+        version = RULES_MODEL_VERSION
+
+    probabilities = _softmax(scores)
+    email_type = max(probabilities, key=probabilities.get)
+
+    return {
+        "email_type": email_type,
+        "confidence": round(probabilities[email_type], 4),
+        "reason": "Local pre-classifier"
+        + (f" (rules: {', '.join(sorted(set(matched)))})" if matched else ""),
+        "model_version": version,
+    }
+
+
+def classify_local(body: str) -> dict | None:
+    """
+    Return a local result if it clears the confidence threshold, else None
+    (the caller should ask the LLM). Updates the local/forwarded counters.
+    """
+    result = None
+    if LOCAL_CLASSIFIER_ENABLED:
+        _reload_if_changed()
+        result = predict(body)
+
+    if result is not None and result["confidence"] >= LOCAL_CLASSIFIER_THRESHOLD:
+        with _lock:
+            _stats["local"] += 1
+        return result
+
+    with _lock:
+        _stats["forwarded"] += 1
+    return None
+
+
+def local_classifier_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        model = _model
+
+    total = stats["local"] + stats["forwarded"]
+    stats["local_fraction"] = stats["local"] / total if total else 0.0
+    stats["threshold"] = LOCAL_CLASSIFIER_THRESHOLD
+    stats["model_version"] = model["version"] if model else RULES_MODEL_VERSION
+    stats["trained_at"] = model["trained_at"] if model else None
+    return stats
+
+
+load_model()
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        print(train_from_db(db))
+    finally:
+        db.close()
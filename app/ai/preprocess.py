@@ -0,0 +1,218 @@
+"""
+Body cleanup applied before any email text is put into a prompt.
+"""
+import html
+import os
+import re
+import threading
+from urllib.parse import urlparse
+
+from app.ai.batching import estimate_tokens
+from app.logger import logger
+
+# Estimated token budget for one email body inside a prompt.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+
+# Share of the budget kept from the start of an over-long body; the rest
+# comes from the end, where sign-offs and action items tend to live.
+TRUNCATE_HEAD_RATIO = 0.7
+TRUNCATION_MARKER = "\n[...]\n"
+
+_HTML_HINT = re.compile(r"<(html|body|div|p|br|table|span|a)\b", re.I)
+_HTML_DROP = re.compile(r"<(script|style|head)\b.*?</\1>", re.I | re.S)
+_HTML_BREAK = re.compile(r"<\s*(br|/p|/div|/tr|/li|/h\d)\b[^>]*>", re.I)
+_HTML_TAG = re.compile(r"<[^>]+>")
+
+_URL = re.compile(r"https?://[^\s<>\"')\]]+", re.I)
+
+# Signatures and footers are only looked for this many non-blank lines
+# from the end, so separators and words like "unsubscribe" in the body
+# are kept.
+SIGNATURE_MAX_LINES = int(os.getenv("PREPROCESS_SIGNATURE_MAX_LINES", "8"))
+FOOTER_MAX_LINES = int(os.getenv("PREPROCESS_FOOTER_MAX_LINES", "10"))
+
+# A line that introduces quoted reply history. It only counts when the
+# quoted block itself follows (see _QUOTE_START); forwarded messages are
+# content and are kept.
+_QUOTE_HEADER = re.compile(
+    r"^\s*(On .{5,200} wrote:|-{2,}\s*Original Message\s*-{2,})\s*$",
+    re.I,
+)
+_QUOTE_START = re.compile(r"^\s*(>|From: .+)")
+
+# A line that starts the sender's signature.
+_SIGNATURE = re.compile(
+    r"^\s*(--|-- |Sent from my \w+.*|Get Outlook for \w+.*)\s*$",
+    re.I,
+)
+
+# Footer / legal lines that carry no meaning for classification or summaries.
+_BOILERPLATE = re.compile(
+    r"(^\s*unsubscribe\b|(click|tap) here to unsubscribe|\bto unsubscribe,? (click|visit|go|use)|"
+    r"\bunsubscribe here\b|manage (your )?(email )?preferences|you are receiving this|"
+    r"you received this|view (this email )?in (your )?browser|all rights reserved|"
+    r"privacy policy|this (e-?mail|message) (and any attachments )?(is|are|may be) confidential|"
+    r"if you are not the intended recipient)",
+    re.I,
+)
+
+_stats = {
+    "emails": 0,
+    "original_tokens": 0,
+    "final_tokens": 0,
+    "truncated": 0,
+}
+_lock = threading.Lock()
+
+
+def _strip_html(text: str) -> str:
+    if not _HTML_HINT.search(text):
+        return text
+    text = _HTML_DROP.sub(" ", text)
+    text = _HTML_BREAK.sub("\n", text)
+    text = _HTML_TAG.sub(" ", text)
+    return html.unescape(text)
+
+
+def _tail_start(lines: list, count: int) -> int:
+    """
+    Index of the first of the last `count` non-blank lines.
+    """
+    seen = 0
+    for index in range(len(lines) - 1, -1, -1):
+        if lines[index].strip():
+            seen += 1
+            if seen == count:
+                return index
+    return 0
+
+
+def _quote_follows(lines: list, index: int) -> bool:
+    for line in lines[index + 1:]:
+        if line.strip():
+            return bool(_QUOTE_START.match(line))
+    return False
+
+
+def _strip_quoted(lines: list) -> list:
+    kept = []
+    for index, line in enumerate(lines):
+        if _QUOTE_HEADER.match(line) and _quote_follows(lines, index):
+            break
+        if line.lstrip().startswith(">"):
+            continue
+        kept.append(line)
+    return kept
+
+
+def _strip_signature(lines: list) -> list:
+    # Only treat it as a signature once some content has been seen
+    start = max(_tail_start(lines, SIGNATURE_MAX_LINES), 1)
+    for index in range(start, len(lines)):
+        if _SIGNATURE.match(lines[index]):
+            return lines[:index]
+    return lines
+
+
+def _strip_boilerplate(lines: list) -> list:
+    footer = _tail_start(lines, FOOTER_MAX_LINES)
+    return lines[:footer] + [line for line in lines[footer:] if not _BOILERPLATE.search(line)]
+
+
+def _collapse_url(match) -> str:
+    host = urlparse(match.group(0)).netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return f"[link: {host}]" if host else "[link]"
+
+
+def _collapse_whitespace(lines: list) -> str:
+    out = []
+    blank = False
+    for line in lines:
+        line = re.sub(r"[ \t\u00a0]+", " ", line).strip()
+        if not line:
+            if out and not blank:
+                out.append("")
+            blank = True
+            continue
+        out.append(line)
+        blank = False
+    return "\n".join(out).strip()
+
+
+def _truncate(text: str, token_budget: int) -> tuple:
+    if estimate_tokens(text) <= token_budget:
+        return text, False
+
+    max_chars = token_budget * 4
+    head = int(max_chars * TRUNCATE_HEAD_RATIO)
+    tail = max(max_chars - head - len(TRUNCATION_MARKER), 0)
+
+    return text[:head].rstrip() + TRUNCATION_MARKER + text[len(text) - tail:].lstrip(), True
+
+
+def preprocess_body(body: str, token_budget: int | None = None) -> dict:
+    """
+    Clean an email body for prompting and report what it saved.
+
+    Strips HTML, quoted reply history, signatures and footer boilerplate,
+    collapses URLs to their host, and truncates to token_budget keeping
+    the head and tail. Returns the text plus a per-email token report.
+    """
+    token_budget = token_budget or PROMPT_TOKEN_BUDGET
+    body = body or ""
+
+    text = _strip_html(body)
+    text = _URL.sub(_collapse_url, text)
+
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    lines = _strip_quoted(lines)
+    lines = _strip_signature(lines)
+    lines = _strip_boilerplate(lines)
+
+    text = _collapse_whitespace(lines)
+
+    # Never send an empty prompt because the cleanup was too aggressive
+    if not text:
+        text = _collapse_whitespace(body.split("\n"))
+
+    text, truncated = _truncate(text, token_budget)
+
+    original_tokens = estimate_tokens(body)
+    final_tokens = estimate_tokens(text)
+
+    with _lock:
+        _stats["emails"] += 1
+        _stats["original_tokens"] += original_tokens
+        _stats["final_tokens"] += final_tokens
+        _stats["truncated"] += int(truncated)
+
+    report = {
+        "original_tokens": original_tokens,
+        "final_tokens": final_tokens,
+        "tokens_saved": original_tokens - final_tokens,
+        "truncated": truncated,
+    }
+    logger.debug("Prompt preprocessing report: %s", report)
+
+    return {"text": text, **report}
+
+
+def prepare_body(body: str, token_budget: int | None = None) -> str:
+    """
+    Convenience wrapper returning only the cleaned text.
+    """
+    return preprocess_body(body, token_budget)["text"]
+
+
+def preprocess_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+
+    stats["tokens_saved"] = stats["original_tokens"] - stats["final_tokens"]
+    stats["saved_ratio"] = (
+        stats["tokens_saved"] / stats["original_tokens"]
+        if stats["original_tokens"] else 0.0
+    )
+    return stats
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: limits are then per process only
+    fcntl = None
+
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+class SharedTokenBuckets:
+    """
+    Request and token buckets shared by every process on the host.
+
+    State lives in a small JSON file guarded by an exclusive flock, so
+    all uvicorn workers and background workers draw from the same
+    budget. Each bucket refills continuously at limit/60 per second and
+    holds at most burst_seconds worth.
+
+    Bulk callers may not take the last `bulk_reserve` fraction of either
+    bucket and are held back entirely while an interactive caller is
+    waiting, so interactive requests go first.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        burst_seconds: float = 10.0,
+        bulk_reserve: float = 0.2,
+    ):
+        self.path = path
+        self.rates = {
+            "requests": requests_per_minute / 60,
+            "tokens": tokens_per_minute / 60,
+        }
+        self.capacity = {
+            name: max(rate * burst_seconds, 1.0)
+            for name, rate in self.rates.items()
+        }
+        self.bulk_reserve = bulk_reserve
+        self._lock = threading.Lock()
+
+    def _update(self, change):
+        """
+        Run change(state, now) on the refilled state under the file lock
+        and save the result. Returns what change returns.
+        """
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+
+                raw = os.read(fd, 4096)
+                now = time.time()
+                try:
+                    state = json.loads(raw)
+                except ValueError:
+                    state = {}
+                state = self._refill(state, now)
+
+                result = change(state, now)
+
+                data = json.dumps(state).encode()
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, data)
+                return result
+            finally:
+                os.close(fd)
+
+    def _refill(self, state: dict, now: float) -> dict:
+        elapsed = max(now - state.get("updated", now), 0.0)
+        levels = state.get("levels", dict(self.capacity))
+
+        return {
+            "levels": {
+                name: min(levels.get(name, capacity) + self.rates[name] * elapsed, capacity)
+                for name, capacity in self.capacity.items()
+            },
+            "updated": now,
+            "paused_until": state.get("paused_until", 0.0),
+            "interactive_until": state.get("interactive_until", 0.0),
+        }
+
+    def try_acquire(self, tokens: int, priority: str = BULK) -> float:
+        """
+        Take one request and `tokens` tokens if available. Returns 0 on
+        success, otherwise the seconds to wait before trying again.
+        """
+        reserve = self.bulk_reserve if priority == BULK else 0.0
+        # A request bigger than the bucket is let through once it is full
+        cost = {
+            name: min(float(amount), self.capacity[name] * (1 - reserve))
+            for name, amount in (("requests", 1), ("tokens", tokens))
+        }
+
+        def change(state, now):
+            if state["paused_until"] > now:
+                return state["paused_until"] - now
+
+            if priority == BULK and state["interactive_until"] > now:
+                return state["interactive_until"] - now
+
+            wait = max(
+                (cost[name] + reserve * self.capacity[name] - state["levels"][name])
+                / self.rates[name]
+                for name in cost
+            )
+
+            if wait <= 0:
+                for name in cost:
+                    state["levels"][name] -= cost[name]
+                if priority == INTERACTIVE:
+                    # Other waiting interactive callers set it again
+                    state["interactive_until"] = 0.0
+                return 0.0
+
+            if priority == INTERACTIVE:
+                # Keep bulk callers off the buckets until this one is served
+                state["interactive_until"] = max(state["interactive_until"], now + wait)
+            return wait
+
+        return self._update(change)
+
+    def refund(self, tokens: int) -> None:
+        """
+        Return estimated tokens that a request did not use (negative
+        values charge extra).
+        """
+
+        def change(state, now):
+            level = state["levels"]["tokens"] + tokens
+            state["levels"]["tokens"] = min(level, self.capacity["tokens"])
+
+        self._update(change)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stop every process from sending for `seconds`, e.g. after a 429.
+        """
+
+        def change(state, now):
+            state["paused_until"] = max(state["paused_until"], now + seconds)
+
+        self._update(change)
+
+    def acquire(self, tokens: int, priority: str = BULK) -> None:
+        while (wait := self.try_acquire(tokens, priority)) > 0:
+            time.sleep(min(wait, 5.0))
+
+    async def acquire_async(self, tokens: int, priority: str = BULK) -> None:
+        # flock and the file I/O block, so they run on a worker thread
+        while (wait := await asyncio.to_thread(self.try_acquire, tokens, priority)) > 0:
+            await asyncio.sleep(min(wait, 5.0))
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app.database import SessionLocal
+from app.models.ai_result_cache import AIResultCache
+from app.logger import logger
+
+# Entries kept in the in-process LRU in front of the ai_result_cache table.
+AI_CACHE_LRU_SIZE = int(os.getenv("AI_CACHE_LRU_SIZE", "2048"))
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+
+_WHITESPACE = re.compile(r"\s+")
+
+_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+_lru = OrderedDict()
+_lock = threading.Lock()
+_stats = {"lru_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+
+
+def _normalize(body: str) -> str:
+    return _WHITESPACE.sub(" ", body or "").strip().lower()
+
+
+def cache_key(kind: str, body: str, version: str) -> str:
+    raw = f"{kind}\0{version}\0{_normalize(body)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _lru_get(key: str):
+    with _lock:
+        if key not in _lru:
+            return None
+        _lru.move_to_end(key)
+        return _lru[key]
+
+
+def _lru_put(key: str, result: dict) -> None:
+    with _lock:
+        _lru[key] = result
+        _lru.move_to_end(key)
+        while len(_lru) > AI_CACHE_LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _stats[name] += 1
+
+
+def get_cached(kind: str, body: str, version: str) -> dict | None:
+    """
+    Look up a stored result for this body, checking the LRU then the table.
+    """
+    if not AI_CACHE_ENABLED:
+        return None
+
+    key = cache_key(kind, body, version)
+
+    result = _lru_get(key)
+    if result is not None:
+        _count("lru_hits")
+        return dict(result)
+
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(AIResultCache)
+            .filter(AIResultCache.cache_key == key)
+            .first()
+        )
+    except Exception:
+        logger.exception("AI result cache lookup failed")
+        row = None
+    finally:
+        db.close()
+
+    if row is None:
+        _count("misses")
+        return None
+
+    result = json.loads(row.result)
+    _lru_put(key, result)
+    _count("db_hits")
+    return dict(result)
+
+
+def store_result(kind: str, body: str, version: str, result: dict) -> None:
+    if not AI_CACHE_ENABLED:
+        return
+
+    key = cache_key(kind, body, version)
+    _lru_put(key, dict(result))
+
+    db = SessionLocal()
+    try:
+        exists = (
+            db.query(AIResultCache.id)
+            .filter(AIResultCache.cache_key == key)
+            .first()
+        )
+        if exists is None:
+            db.add(
+                AIResultCache(
+                    cache_key=key,
+                    kind=kind,
+                    model_version=version,
+                    result=json.dumps(result),
+                )
+            )
+            db.commit()
+        _count("stores")
+    except IntegrityError:
+        # Another worker stored the same key first
+        db.rollback()
+    except Exception:
+        db.rollback()
+        logger.exception("AI result cache store failed")
+    finally:
+        db.close()
+
+
+def get_cached_many(kind: str, bodies: list, version: str) -> list:
+    """
+    get_cached for many bodies: LRU first, then one IN (...) lookup for
+    the rest. Returns a result or None per body, in input order.
+    """
+    if not AI_CACHE_ENABLED or not bodies:
+        return [None] * len(bodies)
+
+    keys = [cache_key(kind, body, version) for body in bodies]
+    found = {}
+    for key in keys:
+        result = _lru_get(key)
+        if result is not None:
+            found[key] = result
+            _count("lru_hits")
+
+    missing = list({key for key in keys if key not in found})
+    if missing:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(AIResultCache.cache_key, AIResultCache.result)
+                .filter(AIResultCache.cache_key.in_(missing))
+                .all()
+            )
+        except Exception:
+            logger.exception("AI result cache lookup failed")
+            rows = []
+        finally:
+            db.close()
+
+        for key, raw in rows:
+            result = json.loads(raw)
+            _lru_put(key, result)
+            found[key] = result
+            _count("db_hits")
+
+        for key in missing:
+            if key not in found:
+                _count("misses")
+
+    return [dict(found[key]) if key in found else None for key in keys]
+
+
+def store_results(kind: str, pairs: list, version: str) -> None:
+    """
+    store_result for many (body, result) pairs with one multi-row
+    INSERT ... ON CONFLICT (cache_key) DO NOTHING.
+    """
+    if not AI_CACHE_ENABLED or not pairs:
+        return
+
+    rows = {}
+    for body, result in pairs:
+        key = cache_key(kind, body, version)
+        _lru_put(key, dict(result))
+        rows[key] = {
+            "cache_key": key,
+            "kind": kind,
+            "model_version": version,
+            "result": json.dumps(result),
+        }
+
+    db = SessionLocal()
+    try:
+        insert = _INSERTS[db.get_bind().dialect.name]
+        db.execute(
+            insert(AIResultCache)
+            .values(list(rows.values()))
+            .on_conflict_do_nothing(index_elements=["cache_key"])
+        )
+        db.commit()
+        with _lock:
+            _stats["stores"] += len(rows)
+    except Exception:
+        db.rollback()
+        logger.exception("AI result cache store failed")
+    finally:
+        db.close()
+
+
+def invalidate(kind: str | None = None, keep_version: str | None = None) -> int:
+    """
+    Drop cached results. With keep_version, only entries from other
+    versions are removed; use this after bumping MODEL_VERSION.
+    """
+    with _lock:
+        _lru.clear()
+
+    db = SessionLocal()
+    try:
+        query = db.query(AIResultCache)
+        if kind is not None:
+            query = query.filter(AIResultCache.kind == kind)
+        if keep_version is not None:
+            query = query.filter(AIResultCache.model_version != keep_version)
+        deleted = query.delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+def cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["lru_size"] = len(_lru)
+
+    lookups = stats["lru_hits"] + stats["db_hits"] + stats["misses"]
+    stats["hit_rate"] = (
+        (stats["lru_hits"] + stats["db_hits"]) / lookups if lookups else 0.0
+    )
+    return stats
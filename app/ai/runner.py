@@ -0,0 +1,28 @@
+import asyncio
+
+from app.ai.gateway import AI_MAX_CONCURRENCY
+
+
+async def run_bounded(items: list, worker, on_result=None, *, concurrency: int | None = None) -> list:
+    """
+    Await worker(item) for every item with at most `concurrency` running
+    at once. on_result(item, result) is called as each one completes, in
+    completion order, so callers can write results back incrementally.
+    Returns the results in input order.
+    """
+    semaphore = asyncio.Semaphore(concurrency or AI_MAX_CONCURRENCY)
+    results = [None] * len(items)
+
+    async def _run(index, item):
+        async with semaphore:
+            return index, await worker(item)
+
+    tasks = [_run(index, item) for index, item in enumerate(items)]
+
+    for next_done in asyncio.as_completed(tasks):
+        index, result = await next_done
+        results[index] = result
+        if on_result is not None:
+            on_result(items[index], result)
+
+    return results
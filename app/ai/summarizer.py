@@ -1,26 +1,29 @@
-import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+import asyncio
 
-load_dotenv()
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from app.ai.gateway import create_completion, create_completion_async
+from app.ai.result_cache import get_cached, store_result
+from app.ai.preprocess import prepare_body
+from app.metrics import record_fallback, record_results
 
 MODEL_VERSION = "gpt-4o-mini-v1"
+PROMPT_VERSION = "summarize-v2"
+
+# Cached results are only reused while both model and prompt are unchanged.
+CACHE_VERSION = f"{MODEL_VERSION}/{PROMPT_VERSION}"
 
-def summarize_email(body: str) -> dict:
-    """
-    Generates a short, neutral summary for an email.
-    """
 
+def _too_short(body: str) -> dict | None:
     if not body or len(body.strip()) < 30:
         return {
             "summary": None,
             "model_version": MODEL_VERSION,
             "reason": "Email body too short to summarize"
         }
+    return None
 
+
+def _request(body: str) -> dict:
     prompt = f"""
 You are an email summarization system.
 
@@ -39,32 +42,89 @@ JSON format:
 }}
 
 Email:
-\"\"\"{body}\"\"\"
+\"\"\"{prepare_body(body)}\"\"\"
 """
 
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "system", "content": "You summarize emails for an inbox UI."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.2,
+        "max_tokens": 80
+    }
+
+
+def _parse(content: str) -> dict:
+    result = json.loads(content)
+
+    return {
+        "summary": result.get("summary"),
+        "model_version": MODEL_VERSION,
+        "reason": "success"
+    }
+
+
+def _fallback(error) -> dict:
+    return {
+        "summary": None,
+        "model_version": "fallback-v1",
+        "reason": f"summarization failed: {str(error)}"
+    }
+
+
+def summarize_email(body: str) -> dict:
+    """
+    Generates a short, neutral summary for an email.
+    """
+
+    record_results("summarize_email")
+
+    short = _too_short(body)
+    if short:
+        return short
+
+    cached = get_cached("summarize", body, CACHE_VERSION)
+    if cached is not None:
+        return cached
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You summarize emails for an inbox UI."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-            max_tokens=80
-        )
-
-        content = response.choices[0].message.content
-        result = json.loads(content)
+        response = create_completion("summarizer", _request(body))
 
-        return {
-            "summary": result.get("summary"),
-            "model_version": MODEL_VERSION,
-            "reason": "success"
-        }
+        summary = _parse(response.choices[0].message.content)
+
+        store_result("summarize", body, CACHE_VERSION, summary)
+        return summary
 
     except Exception as e:
-        return {
-            "summary": None,
-            "model_version": "fallback-v1",
-            "reason": f"summarization failed: {str(e)}"
-        }
+        record_fallback("summarize_email")
+        return _fallback(e)
+
+
+async def summarize_email_async(body: str) -> dict:
+    """
+    Async variant of summarize_email on the shared AsyncOpenAI client.
+    """
+
+    record_results("summarize_email")
+
+    short = _too_short(body)
+    if short:
+        return short
+
+    cached = await asyncio.to_thread(get_cached, "summarize", body, CACHE_VERSION)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await create_completion_async("summarizer", _request(body))
+
+        summary = _parse(response.choices[0].message.content)
+
+        await asyncio.to_thread(store_result, "summarize", body, CACHE_VERSION, summary)
+        return summary
+
+    except Exception as e:
+        record_fallback("summarize_email")
+        return _fallback(e)
@@ -0,0 +1,58 @@
+"""
+Move inline emails.body values into compressed email_bodies rows.
+
+Run between migrations 0004 and 0005:
+    python -m app.core.body_backfill
+"""
+import os
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.email_body import EmailBody, encode_body
+from app.logger import logger
+
+BACKFILL_BATCH_SIZE = int(os.getenv("BODY_BACKFILL_BATCH_SIZE", "500"))
+
+
+def backfill_email_bodies(db: Session, *, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    Copy inline bodies without an email_bodies row, in id order, one
+    commit per batch so the backfill can be stopped and resumed.
+    Returns the number of bodies moved.
+    """
+    moved = 0
+    last_id = 0
+
+    while True:
+        rows = db.execute(
+            text(
+                "SELECT e.id, e.body FROM emails e "
+                "LEFT JOIN email_bodies b ON b.email_id = e.id "
+                "WHERE e.id > :last_id AND b.email_id IS NULL AND e.body IS NOT NULL "
+                "ORDER BY e.id LIMIT :batch_size"
+            ),
+            {"last_id": last_id, "batch_size": batch_size},
+        ).all()
+
+        if not rows:
+            return moved
+
+        db.add_all(
+            EmailBody(email_id=email_id, **encode_body(body))
+            for email_id, body in rows
+        )
+        db.commit()
+
+        moved += len(rows)
+        last_id = rows[-1][0]
+        logger.info("Backfilled %d email bodies (up to id %d)", moved, last_id)
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        total = backfill_email_bodies(db)
+    finally:
+        db.close()
+    logger.info("Body backfill finished: %d rows", total)
@@ -0,0 +1,306 @@
+import asyncio
+import os
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models.email import Email
+from app.models.email_digest import EmailDigest, DailyDigest
+from app.ai.digest_generator import partial_digest_async, MODEL_VERSION
+from app.ai.runner import run_bounded
+from app.utils.time_filter import get_time_cutoff
+
+
+_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+# Window digests are served from the cache for at most this long, even
+# if nothing invalidated them.
+DIGEST_CACHE_TTL_SECONDS = int(os.getenv("DIGEST_CACHE_TTL_SECONDS", "21600"))
+
+# Newest window digests kept per user; older rows are evicted.
+DIGEST_CACHE_MAX_PER_USER = int(os.getenv("DIGEST_CACHE_MAX_PER_USER", "20"))
+
+# Daily partials older than this can no longer be part of any window.
+DAILY_DIGEST_RETENTION_DAYS = int(os.getenv("DAILY_DIGEST_RETENTION_DAYS", "45"))
+
+
+def digest_window_start(range_str: str) -> datetime:
+    """
+    Start of the window for range_str, aligned to midnight UTC so the
+    window is made of whole days.
+    """
+    return datetime.combine(get_time_cutoff(range_str).date(), time.min)
+
+
+def _as_day(value) -> date | None:
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def invalidate_digests(db: Session, *, user_id: int, days=None) -> None:
+    """
+    Drop cached digests affected by changes to a user's mail.
+
+    days holds the dates (or datetimes) of the changed emails; None
+    drops everything cached for the user. Only the daily partials for
+    those days and the window digests covering them are removed. The
+    caller commits.
+    """
+    digests = db.query(EmailDigest).filter(EmailDigest.user_id == user_id)
+    daily = db.query(DailyDigest).filter(DailyDigest.user_id == user_id)
+
+    if days is not None:
+        days = {_as_day(day) for day in days if day is not None}
+        if not days:
+            return
+
+        latest = datetime.combine(max(days) + timedelta(days=1), time.min)
+        digests = digests.filter(
+            or_(
+                EmailDigest.window_start.is_(None),
+                EmailDigest.window_start < latest,
+            )
+        )
+        daily = daily.filter(DailyDigest.day.in_(days))
+
+    digests.delete(synchronize_session=False)
+    daily.delete(synchronize_session=False)
+
+
+def invalidate_for_emails(db: Session, emails) -> None:
+    """
+    invalidate_digests for every user owning one of the changed emails.
+    """
+    days_by_user = defaultdict(set)
+    for email in emails:
+        if email.user_id is not None:
+            days_by_user[email.user_id].add(email.received_at)
+
+    for user_id, days in days_by_user.items():
+        invalidate_digests(db, user_id=user_id, days=days)
+
+
+def evict_digests(db: Session, *, user_id: int | None = None) -> int:
+    """
+    Remove expired window digests, window digests beyond the per-user
+    limit and daily partials past retention. The caller commits.
+    """
+    now = datetime.utcnow()
+
+    expired = db.query(EmailDigest).filter(
+        EmailDigest.created_at < now - timedelta(seconds=DIGEST_CACHE_TTL_SECONDS)
+    )
+    old_days = db.query(DailyDigest).filter(
+        DailyDigest.day < (now - timedelta(days=DAILY_DIGEST_RETENTION_DAYS)).date()
+    )
+
+    if user_id is None:
+        user_ids = [
+            row[0]
+            for row in db.query(EmailDigest.user_id).distinct()
+            if row[0] is not None
+        ]
+    else:
+        user_ids = [user_id]
+        expired = expired.filter(EmailDigest.user_id == user_id)
+        old_days = old_days.filter(DailyDigest.user_id == user_id)
+
+    removed = expired.delete(synchronize_session=False)
+    removed += old_days.delete(synchronize_session=False)
+
+    for owner_id in user_ids:
+        overflow = [
+            row[0]
+            for row in (
+                db.query(EmailDigest.id)
+                .filter(EmailDigest.user_id == owner_id)
+                .order_by(EmailDigest.created_at.desc(), EmailDigest.id.desc())
+                .offset(DIGEST_CACHE_MAX_PER_USER)
+            )
+        ]
+        if overflow:
+            removed += (
+                db.query(EmailDigest)
+                .filter(EmailDigest.id.in_(overflow))
+                .delete(synchronize_session=False)
+            )
+
+    return removed
+
+
+def get_cached_digest(db: Session, *, user_id: int, range_str: str) -> EmailDigest | None:
+    fresh_after = datetime.utcnow() - timedelta(seconds=DIGEST_CACHE_TTL_SECONDS)
+
+    return (
+        db.query(EmailDigest)
+        .filter(
+            EmailDigest.user_id == user_id,
+            EmailDigest.range == range_str,
+            EmailDigest.model_version == MODEL_VERSION,
+            EmailDigest.created_at >= fresh_after,
+        )
+        .order_by(EmailDigest.created_at.desc())
+        .first()
+    )
+
+
+def store_digest(
+    db: Session,
+    *,
+    user_id: int,
+    range_str: str,
+    window_start: datetime,
+    result: dict,
+) -> EmailDigest:
+    digest = EmailDigest(
+        user_id=user_id,
+        range=range_str,
+        window_start=window_start,
+        content=result["digest"],
+        model_version=result["model_version"],
+        created_at=datetime.utcnow(),
+    )
+
+    db.add(digest)
+    db.flush()
+    evict_digests(db, user_id=user_id)
+    db.commit()
+
+    return digest
+
+
+def _load_days(db: Session, *, user_id: int, window_start: datetime) -> tuple[dict, dict]:
+    """
+    (summaries by day, stored DailyDigest by day) for the window.
+    """
+    rows = (
+        db.query(Email.received_at, Email.ai_summary, Email.ai_email_type)
+        .filter(
+            Email.user_id == user_id,
+            Email.is_active == True,
+            Email.received_at >= window_start,
+            Email.ai_summary.isnot(None),
+            # Emails with nothing to summarize are stored with ""
+            Email.ai_summary != "",
+        )
+        .all()
+    )
+
+    by_day = defaultdict(list)
+    for received_at, summary, email_type in rows:
+        by_day[received_at.date()].append((summary, email_type))
+
+    if not by_day:
+        return {}, {}
+
+    stored = {
+        daily.day: daily
+        for daily in (
+            db.query(DailyDigest)
+            .filter(
+                DailyDigest.user_id == user_id,
+                DailyDigest.day.in_(list(by_day)),
+            )
+        )
+    }
+
+    return by_day, stored
+
+
+def _store_partials(db: Session, *, user_id: int, by_day: dict, results: dict) -> None:
+    """
+    Upsert the new partials. Another request may be storing the same days
+    concurrently; the last write wins instead of failing on
+    uq_daily_digests_user_day.
+    """
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_id": user_id,
+            "day": day,
+            "content": result["digest"],
+            "email_count": len(by_day[day]),
+            "model_version": result["model_version"],
+            "created_at": now,
+        }
+        for day, result in results.items()
+        if result is not None
+    ]
+    if not rows:
+        return
+
+    insert = _INSERTS[db.get_bind().dialect.name](DailyDigest).values(rows)
+    db.execute(
+        insert.on_conflict_do_update(
+            index_elements=["user_id", "day"],
+            set_={
+                column: insert.excluded[column]
+                for column in ("content", "email_count", "model_version", "created_at")
+            },
+        )
+    )
+    db.commit()
+
+
+async def daily_partials(db: Session, *, user_id: int, window_start: datetime) -> list:
+    """
+    Partial digests for every day in the window that has summarized mail,
+    as (day, text) pairs in day order.
+
+    Stored partials are reused; days without one (or whose email count
+    changed) are digested in parallel and stored for the next window.
+    The session is only used from worker threads.
+    """
+    by_day, stored = await asyncio.to_thread(
+        _load_days, db, user_id=user_id, window_start=window_start
+    )
+
+    if not by_day:
+        return []
+
+    missing = [
+        day
+        for day in sorted(by_day)
+        if day not in stored
+        or stored[day].model_version != MODEL_VERSION
+        or stored[day].email_count != len(by_day[day])
+    ]
+
+    # Read before a commit expires them
+    partials = {day: daily.content for day, daily in stored.items()}
+
+    if missing:
+        results = await run_bounded(
+            missing,
+            lambda day: partial_digest_async(
+                day.isoformat(),
+                [summary for summary, _ in by_day[day]],
+                [email_type for _, email_type in by_day[day]],
+            ),
+        )
+
+        for day, result in zip(missing, results):
+            if result is None:
+                partials.pop(day, None)
+            else:
+                partials[day] = result["digest"]
+
+        await asyncio.to_thread(
+            _store_partials,
+            db,
+            user_id=user_id,
+            by_day=by_day,
+            results=dict(zip(missing, results)),
+        )
+
+    return [
+        (day.isoformat(), partials[day])
+        for day in sorted(by_day)
+        if day in partials
+    ]
@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+from app.database import SessionLocal
+from app.ai.digest_generator import combine_digests_async, stream_combined_digest, MODEL_VERSION
+from app.core.digest_cache import daily_partials, store_digest
+from app.logger import logger
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def build_digest(db, *, user_id: int, range_str: str, window_start) -> dict:
+    """
+    Digest for a user's window, assembled from cached daily partials.
+    A successful digest is stored for reuse; fallback output is not.
+    """
+    partials = await daily_partials(db, user_id=user_id, window_start=window_start)
+    result = await combine_digests_async(partials)
+
+    if result["model_version"] == MODEL_VERSION:
+        await asyncio.to_thread(
+            store_digest,
+            db,
+            user_id=user_id,
+            range_str=range_str,
+            window_start=window_start,
+            result=result,
+        )
+
+    return result
+
+
+async def stream_window_digest(user_id: int, window_start):
+    """
+    stream_digest-style chunks for a user's window, built from daily
+    partials. Uses its own session since it outlives the request's.
+    """
+    db = SessionLocal()
+    try:
+        partials = await daily_partials(db, user_id=user_id, window_start=window_start)
+    finally:
+        await asyncio.to_thread(db.close)
+
+    async for chunk in stream_combined_digest(partials):
+        yield chunk
+
+
+def _store_streamed_digest(*, user_id: int, range_str: str, window_start, result: dict) -> None:
+    db = SessionLocal()
+    try:
+        store_digest(
+            db,
+            user_id=user_id,
+            range_str=range_str,
+            window_start=window_start,
+            result=result,
+        )
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to store streamed digest")
+    finally:
+        db.close()
+
+
+async def digest_event_stream(
+    chunks,
+    *,
+    range_str: str,
+    user_id: int | None = None,
+    window_start=None,
+):
+    """
+    Server-Sent Events for a digest being generated from `chunks`, an
+    async iterator of (chunk, model_version) tuples.
+
+    Emits a `start` event straight away (before `chunks` does any work,
+    e.g. generating daily partials), a `token` event per streamed chunk
+    and a final `done` event with the full text; a `reset` event replaces
+    the text shown so far if generation fails part way. A successful digest for a user is stored
+    in the digest cache once the stream ends; fallback output is sent to
+    the client but not stored.
+    """
+    yield sse_event("start", {"range": range_str})
+
+    parts = []
+    model_version = MODEL_VERSION
+
+    async for chunk, chunk_version in chunks:
+        if chunk_version != MODEL_VERSION:
+            # Generation failed part way: replace anything sent so far
+            parts = [chunk]
+            model_version = chunk_version
+            yield sse_event("reset", {"text": chunk})
+            continue
+
+        parts.append(chunk)
+        yield sse_event("token", {"text": chunk})
+
+    digest = "".join(parts).strip()
+
+    if model_version == MODEL_VERSION and user_id is not None:
+        await asyncio.to_thread(
+            _store_streamed_digest,
+            user_id=user_id,
+            range_str=range_str,
+            window_start=window_start,
+            result={"digest": digest, "model_version": model_version},
+        )
+
+    yield sse_event(
+        "done",
+        {
+            "range": range_str,
+            "digest": digest,
+            "model_version": model_version,
+            "cached": False
+        }
+    )
@@ -0,0 +1,119 @@
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models.email import Email
+from app.models.email_body import EmailBody, encode_body
+from app.ai.analyzer import analyze_emails
+from app.core.email_service import ai_fields
+from app.core.digest_cache import invalidate_digests
+from app.logger import logger
+
+_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+# Stored until analysis fills in the real type; rows waiting for
+# analysis are the ones with ai_email_type IS NULL.
+PLACEHOLDER_EMAIL_TYPE = "newsletter"
+
+
+def bulk_insert_emails(db: Session, *, user_id: int, messages: list) -> list:
+    """
+    Insert parsed messages with one multi-row
+    INSERT ... ON CONFLICT (user_id, gmail_message_id) DO NOTHING.
+
+    Bodies of the new rows are compressed into email_bodies with one
+    executemany INSERT. Returns the messages that were newly inserted,
+    each with its new `id`. Messages already stored (or repeated in the
+    batch) are skipped. The caller commits.
+    """
+    by_message_id = {}
+    for message in messages:
+        gmail_message_id = message.get("gmail_message_id")
+        if gmail_message_id and gmail_message_id not in by_message_id:
+            by_message_id[gmail_message_id] = message
+
+    if not by_message_id:
+        return []
+
+    insert = _INSERTS[db.get_bind().dialect.name]
+
+    statement = (
+        insert(Email)
+        .values([
+            {
+                "user_id": user_id,
+                "gmail_message_id": gmail_message_id,
+                "email": message["sender"],
+                "email_type": PLACEHOLDER_EMAIL_TYPE,
+                "is_ai_generated": False,
+                "needs_review": False,
+                "is_active": True,
+                "received_at": message.get("received_at") or datetime.utcnow(),
+            }
+            for gmail_message_id, message in by_message_id.items()
+        ])
+        .on_conflict_do_nothing(index_elements=["user_id", "gmail_message_id"])
+        .returning(Email.id, Email.gmail_message_id, Email.received_at)
+    )
+
+    inserted = []
+    for email_id, gmail_message_id, received_at in db.execute(statement):
+        message = dict(by_message_id[gmail_message_id])
+        message["id"] = email_id
+        message["received_at"] = received_at
+        inserted.append(message)
+
+    if inserted:
+        db.execute(
+            insert(EmailBody),
+            [
+                {"email_id": message["id"], **encode_body(message["body"])}
+                for message in inserted
+            ],
+        )
+
+    return inserted
+
+
+def ingest_emails(db: Session, *, user_id: int, messages: list) -> list:
+    """
+    Store a batch of parsed messages and analyze only the new ones.
+
+    The insert is committed before analysis, so if analysis fails the
+    rows stay in the classify/analyze work queues instead of being lost.
+    The AI results are then written in one executemany UPDATE. Returns
+    the ids of newly inserted emails.
+    """
+    inserted = bulk_insert_emails(db, user_id=user_id, messages=messages)
+    if not inserted:
+        return []
+
+    db.commit()
+
+    try:
+        results = analyze_emails([message["body"] for message in inserted])
+    except Exception:
+        logger.exception("Analysis failed for %d new emails", len(inserted))
+        results = None
+
+    if results is not None:
+        db.execute(
+            update(Email),
+            [
+                {"id": message["id"], **ai_fields(ai)}
+                for message, ai in zip(inserted, results)
+            ],
+        )
+
+    invalidate_digests(
+        db,
+        user_id=user_id,
+        days=[message["received_at"] for message in inserted],
+    )
+    db.commit()
+
+    return [message["id"] for message in inserted]
@@ -0,0 +1,141 @@
+from datetime import datetime
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, Query, selectinload
+
+from app.models.email import Email
+from app.utils.pagination import keyset_page, parse_fields
+
+# Columns a list endpoint may project; the body is only served by the
+# detail endpoints.
+EMAIL_LIST_FIELDS = {
+    "id",
+    "email",
+    "email_type",
+    "ai_email_type",
+    "ai_summary",
+    "confidence_score",
+    "ai_reason",
+    "model_version",
+    "is_ai_generated",
+    "needs_review",
+    "is_active",
+    "created_at",
+    "received_at",
+}
+
+DEFAULT_EMAIL_LIST_FIELDS = [
+    "id",
+    "email",
+    "email_type",
+    "ai_summary",
+    "confidence_score",
+    "needs_review",
+    "received_at",
+]
+
+
+def user_emails(db: Session, user_id: int, *filters) -> Query:
+    """
+    Base query for one user's emails. Every read path starts here so the
+    (user_id, ...) indexes apply.
+    """
+    return db.query(Email).filter(Email.user_id == user_id, *filters)
+
+
+def emails_since(db: Session, *, user_id: int, cutoff: datetime) -> Query:
+    return (
+        user_emails(db, user_id, Email.received_at >= cutoff)
+        .order_by(Email.received_at.desc())
+    )
+
+
+# Work queues below match the partial indexes on Email, so they only
+# touch rows that still need work.
+
+def unclassified_emails(db: Session, *, user_id: int, cutoff: datetime) -> Query:
+    return (
+        user_emails(
+            db,
+            user_id,
+            Email.received_at >= cutoff,
+            Email.ai_email_type.is_(None),
+        )
+        .options(selectinload(Email.body_record))
+    )
+
+
+def unsummarized_emails(db: Session, *, user_id: int, cutoff: datetime) -> Query:
+    return (
+        user_emails(
+            db,
+            user_id,
+            Email.received_at >= cutoff,
+            Email.ai_summary.is_(None),
+        )
+        .options(selectinload(Email.body_record))
+    )
+
+
+def unanalyzed_emails(db: Session, *, user_id: int, cutoff: datetime) -> Query:
+    return (
+        user_emails(
+            db,
+            user_id,
+            Email.received_at >= cutoff,
+            or_(
+                Email.ai_email_type.is_(None),
+                Email.ai_summary.is_(None),
+            ),
+        )
+        .options(selectinload(Email.body_record))
+    )
+
+
+REVIEW_FILTER = Email.needs_review == True
+
+
+def list_emails_page(
+    db: Session,
+    *filters,
+    user_id: int,
+    cursor: str | None = None,
+    limit: int,
+    fields: str | None = None,
+) -> dict:
+    """
+    One page of a user's emails matching `filters`, newest first,
+    projected to the requested columns. Raises ValueError for bad fields
+    or cursors.
+    """
+    selected = parse_fields(fields, EMAIL_LIST_FIELDS, DEFAULT_EMAIL_LIST_FIELDS)
+
+    # The cursor is built from these, so they are always selected
+    columns = list(dict.fromkeys(selected + ["received_at", "id"]))
+
+    rows, next_cursor = keyset_page(
+        db.query(*[getattr(Email, column) for column in columns])
+        .filter(Email.user_id == user_id, *filters),
+        sort_column=Email.received_at,
+        id_column=Email.id,
+        cursor=cursor,
+        limit=limit,
+    )
+
+    return {
+        "items": [
+            {field: getattr(row, field) for field in selected}
+            for row in rows
+        ],
+        "next_cursor": next_cursor,
+    }
+
+
+def get_email(db: Session, email_id: int, *filters, user_id: int) -> Email | None:
+    """
+    A single email of the user, with its body loaded.
+    """
+    return (
+        user_emails(db, user_id, Email.id == email_id, *filters)
+        .options(selectinload(Email.body_record))
+        .first()
+    )
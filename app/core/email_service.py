@@ -1,7 +1,44 @@
 from datetime import datetime
 from sqlalchemy.orm import Session
 from app.models.email import Email
-from app.ai.classifier import classify_email
+from app.ai.analyzer import analyze_emails
+from app.core.digest_cache import invalidate_for_emails
+
+
+def ai_fields(ai: dict) -> dict:
+    """
+    Email columns set from one analyze_emails result.
+    """
+    return {
+        "email_type": ai["email_type"],
+        "ai_email_type": ai["email_type"],
+        "ai_summary": ai["summary"],
+        "confidence_score": ai["confidence"],
+        "ai_reason": ai["reason"],
+        "model_version": ai["model_version"],
+        "is_ai_generated": True,
+        "needs_review": ai["confidence"] < 0.8,
+    }
+
+
+def _build_email(
+    *,
+    user_id: int,
+    gmail_message_id: str,
+    sender: str,
+    body: str,
+    received_at,
+    ai: dict,
+) -> Email:
+    return Email(
+        user_id=user_id,
+        gmail_message_id=gmail_message_id,
+        email=sender,
+        body=body,
+        received_at=received_at or datetime.utcnow(),
+        is_active=True,
+        **ai_fields(ai),
+    )
 
 
 def create_email(
@@ -13,25 +50,19 @@ def create_email(
     body: str,
     received_at=None,
 ):
-    ai = classify_email(body)
+    ai = analyze_emails([body])[0]
 
-    email = Email(
+    email = _build_email(
         user_id=user_id,
         gmail_message_id=gmail_message_id,
-        email=sender,
+        sender=sender,
         body=body,
-        email_type=ai["email_type"],
-        ai_email_type=ai["email_type"],
-        confidence_score=ai["confidence"],
-        ai_reason=ai["reason"],
-        model_version=ai["model_version"],
-        is_ai_generated=True,
-        needs_review=ai["confidence"] < 0.8,
-        received_at=received_at or datetime.utcnow(),
-        is_active=True,
+        received_at=received_at,
+        ai=ai,
     )
 
     db.add(email)
+    invalidate_for_emails(db, [email])
     db.commit()
     db.refresh(email)
 
@@ -1,24 +1,423 @@
-import requests 
+import os
+import random
+import threading
+import time
+from datetime import datetime,timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.logger import logger
+from app.metrics import track_gmail_call,GMAIL_RETRIES
+from app.tracing import span,in_current_trace
+from app.utils.ttl_cache import TTLCache
+
 GMAIL_API_BASE="https://gmail.googleapis.com/gmail/v1"
 
-def list_messages(access_token:str,max_results:int =10):
-    url=f"{GMAIL_API_BASE}/users/me/messages"
-    headers={
+# Upper bound on in-flight message fetches per call to get_messages.
+GMAIL_FETCH_CONCURRENCY=int(os.getenv("GMAIL_FETCH_CONCURRENCY","10"))
+
+# One keep-alive session for the whole process so repeated calls reuse
+# TLS connections instead of paying a handshake per message.
+_session=requests.Session()
+_adapter=HTTPAdapter(
+    pool_connections=GMAIL_FETCH_CONCURRENCY,
+    pool_maxsize=GMAIL_FETCH_CONCURRENCY,
+)
+_session.mount("https://",_adapter)
+
+GMAIL_REQUEST_TIMEOUT=float(os.getenv("GMAIL_REQUEST_TIMEOUT","30"))
+
+# Gmail allows each user 250 quota units per second.
+GMAIL_USER_QUOTA_PER_SECOND=float(os.getenv("GMAIL_USER_QUOTA_PER_SECOND","250"))
+
+# Quota units charged per call, from the Gmail API usage limits.
+QUOTA_UNITS={
+    "messages.list":5,
+    "messages.get":5,
+    "history.list":2,
+    "profile":1,
+}
+
+# Retries for 429s, 5xx and connection errors, with full-jitter
+# exponential backoff unless Gmail sends Retry-After.
+GMAIL_MAX_RETRIES=int(os.getenv("GMAIL_MAX_RETRIES","5"))
+GMAIL_BACKOFF_BASE=float(os.getenv("GMAIL_BACKOFF_BASE","0.5"))
+GMAIL_BACKOFF_MAX=float(os.getenv("GMAIL_BACKOFF_MAX","32"))
+GMAIL_RETRY_AFTER_MAX=float(os.getenv("GMAIL_RETRY_AFTER_MAX","120"))
+
+RETRY_STATUSES={429,500,502,503,504}
+RATE_LIMIT_REASONS={"rateLimitExceeded","userRateLimitExceeded"}
+
+
+class HistoryExpiredError(Exception):
+    """
+    Raised when Gmail no longer has history for the given startHistoryId.
+    Callers should fall back to a full resync.
+    """
+
+
+class UserQuota:
+    """
+    Token bucket of Gmail quota units for one user. Calls wait for their
+    units, and everyone waits while the bucket is paused after throttling.
+    A call costing more than one second of quota is charged the full
+    bucket, so it still goes through once the bucket is full.
+    """
+
+    def __init__(self,units_per_second:float):
+        self.rate=units_per_second
+        self.level=units_per_second
+        self.updated=time.monotonic()
+        self.paused_until=0.0
+        self._lock=threading.Lock()
+
+    def acquire(self,units:int)->None:
+        units=min(units,self.rate)
+        while True:
+            with self._lock:
+                now=time.monotonic()
+                self.level=min(self.rate,self.level+(now-self.updated)*self.rate)
+                self.updated=now
+
+                wait=max(self.paused_until-now,(units-self.level)/self.rate)
+                if wait<=0:
+                    self.level-=units
+                    return
+            time.sleep(wait)
+
+    def pause(self,seconds:float)->None:
+        with self._lock:
+            self.paused_until=max(self.paused_until,time.monotonic()+seconds)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on in-flight requests: grows by one per `limit` successful
+    requests and halves when Gmail throttles (at most once per cooldown,
+    since one burst of 429s should only count once).
+    """
+
+    def __init__(self,maximum:int,minimum:int=1,cooldown:float=1.0):
+        self.maximum=maximum
+        self.minimum=minimum
+        self.cooldown=cooldown
+        self.limit=float(maximum)
+        self.in_flight=0
+        self._last_decrease=0.0
+        self._cond=threading.Condition()
+
+    def acquire(self)->None:
+        with self._cond:
+            while self.in_flight>=int(self.limit):
+                self._cond.wait()
+            self.in_flight+=1
+
+    def release(self,succeeded:bool=True)->None:
+        with self._cond:
+            self.in_flight-=1
+            if succeeded:
+                self.limit=min(self.maximum,self.limit+1/self.limit)
+            self._cond.notify_all()
+
+    def throttled(self)->None:
+        with self._cond:
+            now=time.monotonic()
+            if now-self._last_decrease<self.cooldown:
+                return
+            self._last_decrease=now
+            self.limit=max(self.minimum,self.limit/2)
+
+        logger.warning("Gmail throttled; fetch concurrency lowered to %d",int(self.limit))
+
+
+class _UserState:
+    def __init__(self):
+        self.quota=UserQuota(GMAIL_USER_QUOTA_PER_SECOND)
+        self.concurrency=AdaptiveConcurrency(GMAIL_FETCH_CONCURRENCY)
+
+
+# Per-user limiter state, keyed by user id so it survives token refreshes.
+# It lives in this process only: each API or worker process budgets the
+# full per-user quota on its own, and the retries absorb the overlap.
+_user_states=TTLCache(maxsize=1024,ttl=3600)
+_user_states_lock=threading.Lock()
+
+
+def _user_state(user_id:int)->_UserState:
+    with _user_states_lock:
+        state=_user_states.get(user_id)
+        if state is None:
+            state=_UserState()
+        # Re-set on every use so active users don't expire mid-backfill
+        _user_states.set(user_id,state)
+        return state
+
+
+def concurrency_for(user_id:int)->AdaptiveConcurrency:
+    """
+    The adaptive fetch concurrency get_messages uses for this user.
+    """
+    return _user_state(user_id).concurrency
+
+
+def _auth_headers(access_token:str)->dict:
+    return {
         "Authorization":f"Bearer {access_token}"
     }
+
+
+def _is_throttled(response)->bool:
+    if response.status_code==429:
+        return True
+    if response.status_code!=403:
+        return False
+
+    try:
+        errors=response.json().get("error",{}).get("errors",[])
+    except ValueError:
+        return False
+    return any(error.get("reason") in RATE_LIMIT_REASONS for error in errors)
+
+
+def _retry_after(response)->float | None:
+    value=response.headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        seconds=float(value)
+    except ValueError:
+        try:
+            seconds=(parsedate_to_datetime(value)-datetime.now(timezone.utc)).total_seconds()
+        except (TypeError,ValueError):
+            return None
+
+    return min(max(seconds,0.0),GMAIL_RETRY_AFTER_MAX)
+
+
+def _backoff(attempt:int)->float:
+    return random.uniform(0,min(GMAIL_BACKOFF_MAX,GMAIL_BACKOFF_BASE*2**attempt))
+
+
+def _get(endpoint:str,url:str,access_token:str,user_id:int,params:dict | None=None):
+    """
+    GET on the shared session within user_id's quota, recorded under
+    `endpoint` in the Gmail API metrics.
+
+    Throttling, 5xx and connection errors are retried up to
+    GMAIL_MAX_RETRIES times; throttling also pauses the user's quota and
+    lowers their fetch concurrency. The last response is returned as-is
+    for the caller to check.
+    """
+    state=_user_state(user_id)
+
+    for attempt in range(GMAIL_MAX_RETRIES+1):
+        state.quota.acquire(QUOTA_UNITS.get(endpoint,5))
+
+        try:
+            with span("gmail",endpoint=endpoint,attempt=attempt),track_gmail_call(endpoint) as call:
+                response=_session.get(
+                    url,
+                    headers=_auth_headers(access_token),
+                    params=params,
+                    timeout=GMAIL_REQUEST_TIMEOUT,
+                )
+                call["status"]=response.status_code
+        except (requests.ConnectionError,requests.Timeout):
+            if attempt==GMAIL_MAX_RETRIES:
+                raise
+            reason="connection"
+            delay=_backoff(attempt)
+        else:
+            throttled=_is_throttled(response)
+            if attempt==GMAIL_MAX_RETRIES or not (throttled or response.status_code in RETRY_STATUSES):
+                return response
+
+            reason=str(response.status_code)
+            delay=_retry_after(response)
+            if delay is None:
+                delay=_backoff(attempt)
+            if throttled:
+                state.quota.pause(delay)
+                state.concurrency.throttled()
+
+        GMAIL_RETRIES.labels(endpoint,reason).inc()
+        time.sleep(delay)
+
+
+def list_messages(access_token:str,max_results:int =10,*,user_id:int):
+    messages,_=list_messages_page(access_token,max_results=max_results,user_id=user_id)
+    return messages
+
+
+def list_messages_page(
+    access_token:str,
+    max_results:int=100,
+    page_token:str | None=None,
+    query:str | None=None,
+    *,
+    user_id:int,
+):
+    """
+    Fetch one page of message ids.
+    Returns (messages, next_page_token); the token is None on the last page.
+    """
+    url=f"{GMAIL_API_BASE}/users/me/messages"
     params={
         "maxResults":max_results
     }
-    response=requests.get(url,headers=headers,params=params)
+    if page_token:
+        params["pageToken"]=page_token
+    if query:
+        params["q"]=query
+
+    response=_get("messages.list",url,access_token,user_id,params)
     response.raise_for_status()
-    return response.json().get("messages",[])
+    data=response.json()
+    return data.get("messages",[]),data.get("nextPageToken")
+
+
+def iter_message_ids(
+    access_token:str,
+    after:datetime | None=None,
+    query:str | None=None,
+    page_size:int=500,
+    *,
+    user_id:int,
+):
+    """
+    Lazily yield message ids page by page, following nextPageToken.
+    `after` is pushed into the Gmail search query so only the window is listed.
+    """
+    terms=[]
+    if query:
+        terms.append(query)
+    if after is not None:
+        if after.tzinfo is None:
+            after=after.replace(tzinfo=timezone.utc)
+        terms.append(f"after:{int(after.timestamp())}")
+
+    search=" ".join(terms) or None
+    page_token=None
+
+    while True:
+        messages,page_token=list_messages_page(
+            access_token,
+            max_results=page_size,
+            page_token=page_token,
+            query=search,
+            user_id=user_id,
+        )
+        for message in messages:
+            yield message["id"]
 
-def get_message(access_token:str,message_id:str):
+        if not page_token:
+            return
+
+def get_message(access_token:str,message_id:str,*,user_id:int):
     url=f"{GMAIL_API_BASE}/users/me/messages/{message_id}"
-    headers={
-        "Authorization":f"Bearer {access_token}"
-    }
 
-    response=requests.get(url,headers=headers)
+    response=_get("messages.get",url,access_token,user_id)
+    response.raise_for_status()
+    return response.json()
+
+
+def get_profile(access_token:str,*,user_id:int)->dict:
+    url=f"{GMAIL_API_BASE}/users/me/profile"
+
+    response=_get("profile",url,access_token,user_id)
     response.raise_for_status()
-    return response.json()
\ No newline at end of file
+    return response.json()
+
+
+def list_history(access_token:str,start_history_id:str,*,user_id:int)->dict:
+    """
+    Collect mailbox changes since start_history_id across all pages.
+    Returns added and deleted message ids plus the latest historyId.
+    """
+    url=f"{GMAIL_API_BASE}/users/me/history"
+    params={
+        "startHistoryId":start_history_id,
+        "historyTypes":["messageAdded","messageDeleted"],
+        "maxResults":500,
+    }
+
+    added=[]
+    deleted=set()
+    history_id=start_history_id
+
+    while True:
+        response=_get("history.list",url,access_token,user_id,params)
+        if response.status_code==404:
+            raise HistoryExpiredError(start_history_id)
+        response.raise_for_status()
+        data=response.json()
+
+        for record in data.get("history",[]):
+            for item in record.get("messagesAdded",[]):
+                added.append(item["message"]["id"])
+            for item in record.get("messagesDeleted",[]):
+                deleted.add(item["message"]["id"])
+
+        history_id=data.get("historyId",history_id)
+
+        page_token=data.get("nextPageToken")
+        if not page_token:
+            break
+        params["pageToken"]=page_token
+
+    # A message added and deleted inside the same window never needs fetching
+    added=[message_id for message_id in dict.fromkeys(added) if message_id not in deleted]
+
+    return {
+        "added":added,
+        "deleted":sorted(deleted),
+        "history_id":history_id,
+    }
+
+
+def get_messages(
+    access_token:str,
+    message_ids:list,
+    max_workers:int | None=None,
+    *,
+    user_id:int,
+)->list:
+    """
+    Fetch many messages concurrently over the shared session.
+    Results are returned in the same order as message_ids.
+
+    In-flight fetches are capped by the user's adaptive concurrency, so
+    a throttled user is slowed down rather than failed, and speeds back
+    up as requests succeed.
+    """
+    if not message_ids:
+        return []
+
+    workers=min(max_workers or GMAIL_FETCH_CONCURRENCY,len(message_ids))
+
+    if workers<=1:
+        return [get_message(access_token,message_id,user_id=user_id) for message_id in message_ids]
+
+    concurrency=concurrency_for(user_id)
+
+    def fetch(message_id):
+        concurrency.acquire()
+        succeeded=False
+        try:
+            message=get_message(access_token,message_id,user_id=user_id)
+            succeeded=True
+            return message
+        finally:
+            concurrency.release(succeeded)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(
+            executor.map(
+                in_current_trace(fetch),
+                message_ids,
+            )
+        )
@@ -0,0 +1,208 @@
+from datetime import datetime
+from typing import Callable
+from sqlalchemy.orm import Session
+
+from app.models.email import Email
+from app.models.google_account import GoogleAccount
+from app.core.gmail_client import (
+    HistoryExpiredError,
+    get_messages,
+    get_profile,
+    iter_message_ids,
+    list_history,
+    list_messages,
+)
+from app.core.gmail_parser import parse_message
+from app.core.email_ingest import ingest_emails
+from app.core.digest_cache import invalidate_digests
+from app.utils.time_filter import get_time_cutoff
+from app.utils.chunking import chunked
+from app.logger import logger
+
+
+SYNC_MODES = {"incremental", "full"}
+
+# Messages fetched and ingested per step of a backfill.
+BACKFILL_CHUNK_SIZE = 50
+
+
+def _ingest_messages(db: Session, *, user_id: int, raw_messages: list) -> int:
+    created = ingest_emails(
+        db,
+        user_id=user_id,
+        messages=[parse_message(raw_message) for raw_message in raw_messages],
+    )
+
+    return len(created)
+
+
+def _deactivate_messages(db: Session, *, user_id: int, gmail_message_ids: list) -> int:
+    if not gmail_message_ids:
+        return 0
+
+    emails = db.query(Email).filter(
+        Email.user_id == user_id,
+        Email.gmail_message_id.in_(gmail_message_ids),
+    )
+
+    days = [row[0] for row in emails.with_entities(Email.received_at)]
+    if days:
+        invalidate_digests(db, user_id=user_id, days=days)
+
+    return emails.update({Email.is_active: False}, synchronize_session=False)
+
+
+def _full_sync(
+    db: Session,
+    google_account: GoogleAccount,
+    access_token: str,
+    max_results: int,
+) -> dict:
+    # Read the cursor before listing so changes made while we list are
+    # picked up by the next incremental run rather than lost.
+    user_id = google_account.user_id
+    history_id = get_profile(access_token, user_id=user_id).get("historyId")
+
+    messages = list_messages(access_token, max_results=max_results, user_id=user_id)
+    raw_messages = get_messages(access_token, [msg["id"] for msg in messages], user_id=user_id)
+
+    created = _ingest_messages(
+        db,
+        user_id=google_account.user_id,
+        raw_messages=raw_messages,
+    )
+
+    return {
+        "mode": "full",
+        "fetched": len(raw_messages),
+        "created": created,
+        "deleted": 0,
+        "history_id": history_id,
+    }
+
+
+def _incremental_sync(
+    db: Session,
+    google_account: GoogleAccount,
+    access_token: str,
+) -> dict:
+    user_id = google_account.user_id
+    changes = list_history(access_token, google_account.history_id, user_id=user_id)
+
+    raw_messages = get_messages(access_token, changes["added"], user_id=user_id)
+
+    created = _ingest_messages(
+        db,
+        user_id=google_account.user_id,
+        raw_messages=raw_messages,
+    )
+    deleted = _deactivate_messages(
+        db,
+        user_id=google_account.user_id,
+        gmail_message_ids=changes["deleted"],
+    )
+
+    return {
+        "mode": "incremental",
+        "fetched": len(raw_messages),
+        "created": created,
+        "deleted": deleted,
+        "history_id": changes["history_id"],
+    }
+
+
+def sync_account(
+    db: Session,
+    google_account: GoogleAccount,
+    *,
+    access_token: str | None = None,
+    mode: str = "incremental",
+    max_results: int = 50,
+) -> dict:
+    """
+    Bring the local mailbox copy up to date with Gmail.
+
+    Incremental mode replays history since the stored historyId and only
+    touches added/deleted messages. It falls back to a full resync of the
+    newest max_results messages when there is no cursor yet or Gmail has
+    expired the history.
+    """
+    if mode not in SYNC_MODES:
+        raise ValueError("Invalid sync mode. Allowed incremental, full")
+
+    access_token = access_token or google_account.access_token
+
+    result = None
+
+    if mode == "incremental" and google_account.history_id:
+        try:
+            result = _incremental_sync(db, google_account, access_token)
+        except HistoryExpiredError:
+            logger.info(
+                "Gmail history expired for account %s, running full resync",
+                google_account.id,
+            )
+
+    if result is None:
+        result = _full_sync(db, google_account, access_token, max_results)
+
+    google_account.history_id = result["history_id"]
+    google_account.last_synced_at = datetime.utcnow()
+    db.commit()
+
+    return result
+
+
+def backfill_account(
+    db: Session,
+    google_account: GoogleAccount,
+    *,
+    range_str: str = "30d",
+    access_token: str | None = None,
+    chunk_size: int = BACKFILL_CHUNK_SIZE,
+    heartbeat: Callable[[], None] | None = None,
+) -> dict:
+    """
+    Ingest every message in the time window, following Gmail pagination.
+
+    Message ids are streamed from the listing generator and processed one
+    chunk at a time, so ingestion starts with the first page and memory
+    stays bounded by chunk_size regardless of mailbox size. heartbeat is
+    called after each committed chunk (the job queue renews its lease).
+    """
+    cutoff = get_time_cutoff(range_str)
+    access_token = access_token or google_account.access_token
+
+    # Capture the cursor up front so the next incremental sync covers
+    # anything that arrives while the backfill is running.
+    user_id = google_account.user_id
+    history_id = get_profile(access_token, user_id=user_id).get("historyId")
+
+    fetched = 0
+    created = 0
+
+    message_ids = iter_message_ids(access_token, after=cutoff, user_id=user_id)
+
+    for chunk in chunked(message_ids, chunk_size):
+        raw_messages = get_messages(access_token, chunk, user_id=user_id)
+        created += _ingest_messages(
+            db,
+            user_id=google_account.user_id,
+            raw_messages=raw_messages,
+        )
+        fetched += len(raw_messages)
+        db.commit()
+        if heartbeat is not None:
+            heartbeat()
+
+    if not google_account.history_id:
+        google_account.history_id = history_id
+    google_account.last_synced_at = datetime.utcnow()
+    db.commit()
+
+    return {
+        "mode": "backfill",
+        "range": range_str,
+        "fetched": fetched,
+        "created": created,
+    }
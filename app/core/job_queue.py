@@ -0,0 +1,291 @@
+import json
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.models.ingestion_job import IngestionJob
+from app.models.google_account import GoogleAccount
+from app.core.gmail_sync import sync_account, backfill_account
+from app.logger import logger
+from app.tracing import trace
+
+
+# How long a worker owns a job before another worker may take it over.
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+
+# Retry delay is JOB_RETRY_BASE_SECONDS * 2^(attempt-1), capped.
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+JOB_RETRY_MAX_SECONDS = int(os.getenv("JOB_RETRY_MAX_SECONDS", "1800"))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class LeaseLostError(Exception):
+    """
+    Raised by a job's heartbeat when another worker has taken over the
+    job (its lease expired). The handler must stop without writing more.
+    """
+
+
+def enqueue_job(
+    db: Session,
+    *,
+    user_id: int,
+    google_account_id: int,
+    kind: str = "sync",
+    payload: dict | None = None,
+) -> IngestionJob:
+    """
+    Queue an ingestion job for an account.
+    An identical job that is still pending is reused instead of duplicated.
+    """
+    encoded = json.dumps(payload or {}, sort_keys=True)
+
+    existing = (
+        db.query(IngestionJob)
+        .filter(
+            IngestionJob.google_account_id == google_account_id,
+            IngestionJob.kind == kind,
+            IngestionJob.payload == encoded,
+            IngestionJob.status == "queued",
+        )
+        .first()
+    )
+    if existing:
+        return existing
+
+    job = IngestionJob(
+        user_id=user_id,
+        google_account_id=google_account_id,
+        kind=kind,
+        payload=encoded,
+        status="queued",
+        attempts=0,
+        run_after=datetime.utcnow(),
+    )
+
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    return job
+
+
+def claim_next_job(db: Session, *, worker_id: str) -> IngestionJob | None:
+    """
+    Lease the next runnable job to worker_id.
+
+    A job is runnable when it is queued and due, or when a previous worker's
+    lease on it has expired. Accounts that already have a job under a live
+    lease are skipped, so one mailbox is never ingested by two workers.
+    """
+    now = datetime.utcnow()
+
+    leased_accounts = (
+        db.query(IngestionJob.google_account_id)
+        .filter(
+            IngestionJob.status == "running",
+            IngestionJob.lease_expires_at > now,
+        )
+    )
+
+    job = (
+        db.query(IngestionJob)
+        .filter(
+            or_(
+                and_(
+                    IngestionJob.status == "queued",
+                    IngestionJob.run_after <= now,
+                ),
+                and_(
+                    IngestionJob.status == "running",
+                    IngestionJob.lease_expires_at <= now,
+                ),
+            ),
+            IngestionJob.google_account_id.not_in(leased_accounts),
+        )
+        .order_by(IngestionJob.run_after, IngestionJob.id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+
+    if job is None:
+        db.rollback()
+        return None
+
+    # Serialize claims per account: lock the account row and re-check that
+    # no other worker took a lease on it since the query above.
+    (
+        db.query(GoogleAccount)
+        .filter(GoogleAccount.id == job.google_account_id)
+        .with_for_update()
+        .first()
+    )
+    if leased_accounts.filter(
+        IngestionJob.google_account_id == job.google_account_id,
+        IngestionJob.id != job.id,
+    ).first():
+        db.rollback()
+        return None
+
+    job.status = "running"
+    job.attempts += 1
+    job.lease_owner = worker_id
+    job.lease_expires_at = now + timedelta(seconds=JOB_LEASE_SECONDS)
+
+    db.commit()
+    db.refresh(job)
+
+    return job
+
+
+def _owned_by(db: Session, job_id: int, worker_id: str):
+    return db.query(IngestionJob).filter(
+        IngestionJob.id == job_id,
+        IngestionJob.status == "running",
+        IngestionJob.lease_owner == worker_id,
+    )
+
+
+def _release(db: Session, job: IngestionJob, worker_id: str, values: dict) -> bool:
+    """
+    Apply values to the job only if worker_id still holds its lease.
+    Returns False (and changes nothing) if another worker took it over.
+    """
+    updated = _owned_by(db, job.id, worker_id).update(
+        {**values, IngestionJob.lease_owner: None, IngestionJob.lease_expires_at: None},
+        synchronize_session=False,
+    )
+    db.commit()
+
+    if not updated:
+        logger.warning("Worker %s lost the lease on job %s; result dropped", worker_id, job.id)
+    return bool(updated)
+
+
+def renew_lease(db: Session, job_id: int, worker_id: str) -> bool:
+    """
+    Extend worker_id's lease on a running job by JOB_LEASE_SECONDS.
+    Returns False if the worker no longer owns the job.
+    """
+    updated = _owned_by(db, job_id, worker_id).update(
+        {IngestionJob.lease_expires_at: datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)},
+        synchronize_session=False,
+    )
+    db.commit()
+    return bool(updated)
+
+
+def job_heartbeat(db: Session, job: IngestionJob):
+    """
+    A callable for long handlers to call after each chunk of work. It
+    renews the job's lease, or raises LeaseLostError once another worker
+    has taken the job over.
+    """
+    job_id = job.id
+    worker_id = job.lease_owner
+
+    def heartbeat() -> None:
+        if not renew_lease(db, job_id, worker_id):
+            raise LeaseLostError(f"job {job_id} is no longer leased to {worker_id}")
+
+    return heartbeat
+
+
+def complete_job(db: Session, job: IngestionJob, result: dict, *, worker_id: str) -> bool:
+    return _release(db, job, worker_id, {
+        IngestionJob.status: "succeeded",
+        IngestionJob.result: json.dumps(result, default=str),
+        IngestionJob.last_error: None,
+        IngestionJob.finished_at: datetime.utcnow(),
+    })
+
+
+def fail_job(db: Session, job: IngestionJob, error: str, *, worker_id: str) -> bool:
+    """
+    Record a failed attempt and schedule a retry with exponential backoff,
+    or mark the job failed once max_attempts is reached.
+    """
+    values = {IngestionJob.last_error: error}
+
+    if job.attempts >= job.max_attempts:
+        values[IngestionJob.status] = "failed"
+        values[IngestionJob.finished_at] = datetime.utcnow()
+    else:
+        delay = min(
+            JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1),
+            JOB_RETRY_MAX_SECONDS,
+        )
+        values[IngestionJob.status] = "queued"
+        values[IngestionJob.run_after] = datetime.utcnow() + timedelta(seconds=delay)
+
+    return _release(db, job, worker_id, values)
+
+
+def run_job(db: Session, job: IngestionJob) -> dict:
+    payload = json.loads(job.payload or "{}")
+
+    google_account = (
+        db.query(GoogleAccount)
+        .filter(GoogleAccount.id == job.google_account_id)
+        .first()
+    )
+    if google_account is None:
+        raise ValueError("Google account no longer exists")
+
+    heartbeat = job_heartbeat(db, job)
+
+    if job.kind == "sync":
+        return sync_account(db, google_account, **payload)
+
+    if job.kind == "backfill":
+        return backfill_account(db, google_account, heartbeat=heartbeat, **payload)
+
+    if job.kind == "process_run":
+        # Imported here: processing_runs enqueues its runs through this module
+        from app.core.processing_runs import run_queued
+        return run_queued(db, heartbeat=heartbeat, **payload)
+
+    raise ValueError(f"Unknown job kind: {job.kind}")
+
+
+def process_next_job(db: Session, *, worker_id: str) -> IngestionJob | None:
+    """
+    Claim and run a single job. Returns the job, or None if the queue is idle.
+    """
+    job = claim_next_job(db, worker_id=worker_id)
+    if job is None:
+        return None
+
+    logger.info("Worker %s running job %s (%s)", worker_id, job.id, job.kind)
+
+    try:
+        with trace("job", job_id=job.id, kind=job.kind):
+            result = run_job(db, job)
+    except LeaseLostError:
+        # The job now belongs to another worker, which records its outcome
+        db.rollback()
+        logger.warning("Worker %s stopped job %s after losing its lease", worker_id, job.id)
+        return job
+    except Exception as e:
+        db.rollback()
+        logger.exception("Job %s failed on attempt %s", job.id, job.attempts)
+        fail_job(db, job, str(e), worker_id=worker_id)
+        return job
+
+    complete_job(db, job, result, worker_id=worker_id)
+    return job
+
+
+def job_status(job: IngestionJob) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "last_error": job.last_error,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
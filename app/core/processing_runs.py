@@ -0,0 +1,434 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+from sqlalchemy import bindparam, tuple_, update
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.email import Email
+from app.models.processing_run import ProcessingRun
+from app.models.google_account import GoogleAccount
+from app.ai.classifier import classify_emails_async, CLASSIFY_BATCH_MAX_ITEMS
+from app.ai.summarizer import summarize_email_async
+from app.ai.analyzer import analyze_emails_async
+from app.ai.runner import run_bounded
+from app.core.email_queries import (
+    unclassified_emails,
+    unsummarized_emails,
+    unanalyzed_emails,
+)
+from app.core.digest_cache import invalidate_for_emails
+from app.core.job_queue import enqueue_job, LeaseLostError
+from app.utils.time_filter import get_time_cutoff
+from app.utils.chunking import chunked
+from app.logger import logger
+
+
+# A run in one of these is (or is about to be) processed by a worker.
+ACTIVE_RUN_STATUSES = ("queued", "running")
+
+# Emails streamed, processed and committed together.
+PROCESSING_CHUNK_SIZE = int(os.getenv("PROCESSING_CHUNK_SIZE", "100"))
+
+# A "running" run without progress for this long is treated as
+# interrupted and may be resumed.
+PROCESSING_STALE_SECONDS = int(os.getenv("PROCESSING_STALE_SECONDS", "300"))
+
+FALLBACK_MODEL_VERSION = "fallback-v1"
+
+# Stored for an email with nothing to summarize, so it leaves the work
+# queue (ai_summary IS NULL means "not summarized yet").
+EMPTY_SUMMARY = ""
+
+
+class RunInProgressError(Exception):
+    """
+    A run's job was picked up while the run still shows recent progress
+    from another worker. The job is retried later instead of processing
+    the same emails twice.
+    """
+
+# Results only fill columns that are still empty: a manual override (which
+# always sets ai_email_type) or a value written since the chunk was read
+# is never replaced.
+_SET_CLASSIFICATION = (
+    update(Email.__table__)
+    .where(Email.id == bindparam("email_id"), Email.ai_email_type.is_(None))
+    .values(
+        ai_email_type=bindparam("label"),
+        confidence_score=bindparam("confidence"),
+        ai_reason=bindparam("reason"),
+        model_version=bindparam("version"),
+        needs_review=bindparam("review"),
+    )
+)
+_SET_SUMMARY = (
+    update(Email.__table__)
+    .where(Email.id == bindparam("email_id"), Email.ai_summary.is_(None))
+    .values(ai_summary=bindparam("summary"))
+)
+
+
+def _classification(email, result: dict) -> dict | None:
+    # Fallbacks are not written, so the email stays queued for the next run
+    if email.ai_email_type is not None or result["model_version"] == FALLBACK_MODEL_VERSION:
+        return None
+
+    return {
+        "email_id": email.id,
+        "label": result["email_type"],
+        "confidence": result["confidence"],
+        "reason": result["reason"],
+        "version": result["model_version"],
+        "review": result["confidence"] < 0.6,
+    }
+
+
+def _summary(email, result: dict) -> dict | None:
+    version = result.get("summary_model_version", result["model_version"])
+    if email.ai_summary is not None or version == FALLBACK_MODEL_VERSION:
+        return None
+
+    return {"email_id": email.id, "summary": result["summary"] or EMPTY_SUMMARY}
+
+
+def _writes(emails: list, results: list, *fields) -> list:
+    """
+    (statement, rows) pairs writing the given fields of each result.
+    """
+    writes = []
+    for statement, field in fields:
+        rows = [field(email, result) for email, result in zip(emails, results)]
+        rows = [row for row in rows if row is not None]
+        if rows:
+            writes.append((statement, rows))
+    return writes
+
+
+async def _classify_chunk(emails: list) -> list:
+    # One batched request per group, several groups in flight at once
+    groups = list(chunked(emails, CLASSIFY_BATCH_MAX_ITEMS))
+    results = await run_bounded(
+        groups,
+        lambda group: classify_emails_async([email.body for email in group]),
+    )
+
+    return _writes(
+        emails,
+        [result for group_results in results for result in group_results],
+        (_SET_CLASSIFICATION, _classification),
+    )
+
+
+async def _summarize_chunk(emails: list) -> list:
+    results = await run_bounded(
+        emails,
+        lambda email: summarize_email_async(email.body),
+    )
+
+    return _writes(emails, results, (_SET_SUMMARY, _summary))
+
+
+async def _analyze_chunk(emails: list) -> list:
+    # Classification and summary come back from the same request
+    groups = list(chunked(emails, CLASSIFY_BATCH_MAX_ITEMS))
+    results = await run_bounded(
+        groups,
+        lambda group: analyze_emails_async([email.body for email in group]),
+    )
+
+    return _writes(
+        emails,
+        [result for group_results in results for result in group_results],
+        (_SET_CLASSIFICATION, _classification),
+        (_SET_SUMMARY, _summary),
+    )
+
+
+# kind -> (work queue query, chunk handler)
+RUN_KINDS = {
+    "classify": (unclassified_emails, _classify_chunk),
+    "summarize": (unsummarized_emails, _summarize_chunk),
+    "analyze": (unanalyzed_emails, _analyze_chunk),
+}
+
+
+def _pending(db: Session, run: ProcessingRun):
+    """
+    Emails the run still has to process, in checkpoint order.
+    """
+    work_queue, _ = RUN_KINDS[run.kind]
+    query = work_queue(db, user_id=run.user_id, cutoff=run.cutoff)
+
+    if run.checkpoint_id is not None:
+        query = query.filter(
+            tuple_(Email.received_at, Email.id)
+            > tuple_(run.checkpoint_received_at, run.checkpoint_id)
+        )
+
+    return query.order_by(Email.received_at, Email.id)
+
+
+def start_run(
+    db: Session,
+    *,
+    user_id: int,
+    kind: str,
+    range_str: str,
+    status: str = "running",
+) -> ProcessingRun:
+    """
+    Create a run over the user's emails in range_str. Raises ValueError
+    for an unknown kind or range.
+    """
+    if kind not in RUN_KINDS:
+        raise ValueError(f"Unknown run kind: {kind}")
+
+    now = datetime.utcnow()
+    run = ProcessingRun(
+        user_id=user_id,
+        kind=kind,
+        range=range_str,
+        cutoff=get_time_cutoff(range_str),
+        status=status,
+        processed=0,
+        active_seconds=0.0,
+        created_at=now,
+        updated_at=now,
+    )
+    run.total = _pending(db, run).count()
+
+    db.add(run)
+    db.commit()
+
+    return run
+
+
+def _enqueue(db: Session, run: ProcessingRun, google_account_id: int) -> None:
+    enqueue_job(
+        db,
+        user_id=run.user_id,
+        google_account_id=google_account_id,
+        kind="process_run",
+        payload={"run_id": run.id},
+    )
+
+
+def queue_run(
+    db: Session,
+    *,
+    user_id: int,
+    google_account_id: int,
+    kind: str,
+    range_str: str,
+) -> ProcessingRun:
+    """
+    Create a queued run and hand it to the job worker. A queued or running
+    run of the same kind and range for the user is returned instead of
+    starting a second one over the same emails. Raises ValueError for an
+    unknown kind or range.
+    """
+    # Serialize concurrent requests for the user on the account row
+    (
+        db.query(GoogleAccount)
+        .filter(GoogleAccount.id == google_account_id)
+        .with_for_update()
+        .first()
+    )
+
+    existing = (
+        db.query(ProcessingRun)
+        .filter(
+            ProcessingRun.user_id == user_id,
+            ProcessingRun.kind == kind,
+            ProcessingRun.range == range_str,
+            ProcessingRun.status.in_(ACTIVE_RUN_STATUSES),
+        )
+        .order_by(ProcessingRun.id.desc())
+        .first()
+    )
+    if existing is not None:
+        # A worker that died mid-run loses its job lease; the job is
+        # picked up again and the run continues from its checkpoint.
+        db.rollback()
+        return existing
+
+    run = start_run(db, user_id=user_id, kind=kind, range_str=range_str, status="queued")
+    _enqueue(db, run, google_account_id)
+
+    return run
+
+
+def resume_run(db: Session, run: ProcessingRun, google_account_id: int) -> ProcessingRun:
+    """
+    Queue an interrupted or failed run again; it continues from its
+    checkpoint.
+    """
+    run.status = "queued"
+    run.last_error = None
+    run.updated_at = datetime.utcnow()
+    db.commit()
+
+    _enqueue(db, run, google_account_id)
+
+    return run
+
+
+def can_resume(run: ProcessingRun) -> bool:
+    if run.status == "failed":
+        return True
+
+    stale_before = datetime.utcnow() - timedelta(seconds=PROCESSING_STALE_SECONDS)
+    return run.status == "running" and run.updated_at < stale_before
+
+
+def _open_run(db: Session, reader: Session, run: ProcessingRun):
+    """
+    Mark the run running; returns its chunk handler and an iterator over
+    chunks of its pending emails, read through `reader`.
+    """
+    run.status = "running"
+    run.last_error = None
+    run.updated_at = datetime.utcnow()
+    db.commit()
+
+    _, handle_chunk = RUN_KINDS[run.kind]
+    rows = _pending(reader, run).yield_per(PROCESSING_CHUNK_SIZE)
+
+    return handle_chunk, chunked(rows, PROCESSING_CHUNK_SIZE)
+
+
+def _save_chunk(
+    db: Session,
+    run: ProcessingRun,
+    chunk: list,
+    writes: list,
+    started: float,
+    heartbeat: Callable[[], None] | None = None,
+) -> None:
+    for statement, rows in writes:
+        db.execute(statement, rows)
+    invalidate_for_emails(db, chunk)
+
+    run.checkpoint_received_at = chunk[-1].received_at
+    run.checkpoint_id = chunk[-1].id
+    run.processed += len(chunk)
+    run.active_seconds += time.perf_counter() - started
+    run.updated_at = datetime.utcnow()
+    db.commit()
+
+    # Keeps the job leased to this worker while the run makes progress
+    if heartbeat is not None:
+        heartbeat()
+
+
+def _finish_run(db: Session, run: ProcessingRun, error: Exception | None = None) -> None:
+    if error is None:
+        run.status = "succeeded"
+        run.finished_at = datetime.utcnow()
+        run.updated_at = run.finished_at
+        db.commit()
+        return
+
+    db.rollback()
+    logger.error("Processing run %s failed", run.id, exc_info=error)
+
+    run.status = "failed"
+    run.last_error = str(error)
+    run.updated_at = datetime.utcnow()
+    db.commit()
+
+
+async def process_run(
+    db: Session,
+    run: ProcessingRun,
+    heartbeat: Callable[[], None] | None = None,
+) -> ProcessingRun:
+    """
+    Process a run from its checkpoint to the end, one chunk at a time.
+
+    Rows are streamed through a server-side cursor on a separate read
+    session, so only one chunk is in memory. Each chunk's results, its
+    checkpoint and the run's counters are committed together on `db`.
+    A failure keeps everything committed so far and marks the run failed
+    so it can be resumed.
+
+    Both sessions are only used from worker threads; the event loop just
+    awaits the AI calls in between. heartbeat is called after each saved
+    chunk; if it raises LeaseLostError the run is left to the worker that
+    took over the job and is not marked failed.
+    """
+    reader = SessionLocal()
+    try:
+        handle_chunk, chunks = await asyncio.to_thread(_open_run, db, reader, run)
+
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            started = time.perf_counter()
+            writes = await handle_chunk(chunk)
+            await asyncio.to_thread(_save_chunk, db, run, chunk, writes, started, heartbeat)
+
+        await asyncio.to_thread(_finish_run, db, run)
+
+    except LeaseLostError:
+        await asyncio.to_thread(db.rollback)
+        raise
+
+    except Exception as e:
+        await asyncio.to_thread(_finish_run, db, run, e)
+
+    finally:
+        await asyncio.to_thread(reader.close)
+
+    return run
+
+
+def run_queued(db: Session, run_id: int, heartbeat: Callable[[], None] | None = None) -> dict:
+    """
+    Job handler for "process_run" jobs. A failed run is recorded on the
+    run (and can be resumed), not retried by the job queue.
+
+    A run that is still "running" with progress newer than
+    PROCESSING_STALE_SECONDS belongs to a worker that is still going (its
+    job lease expired during a slow chunk); RunInProgressError makes the
+    job queue retry later rather than start a second execution.
+    """
+    run = db.query(ProcessingRun).filter(ProcessingRun.id == run_id).first()
+    if run is None:
+        raise ValueError(f"Processing run {run_id} no longer exists")
+
+    if run.status == "succeeded":
+        return run_progress(db, run)
+
+    if run.status == "running" and not can_resume(run):
+        raise RunInProgressError(f"Processing run {run_id} is still making progress")
+
+    run = asyncio.run(process_run(db, run, heartbeat))
+
+    return run_progress(db, run)
+
+
+def run_progress(db: Session, run: ProcessingRun) -> dict:
+    remaining = 0 if run.status == "succeeded" else _pending(db, run).count()
+    throughput = run.processed / run.active_seconds if run.active_seconds else None
+
+    return {
+        "id": run.id,
+        "kind": run.kind,
+        "range": run.range,
+        "status": run.status,
+        "total": run.total,
+        "processed": run.processed,
+        "remaining": remaining,
+        "throughput_per_second": round(throughput, 2) if throughput else None,
+        "eta_seconds": round(remaining / throughput) if throughput and remaining else None,
+        "checkpoint": {
+            "received_at": run.checkpoint_received_at,
+            "id": run.checkpoint_id,
+        },
+        "last_error": run.last_error,
+        "created_at": run.created_at,
+        "updated_at": run.updated_at,
+        "finished_at": run.finished_at,
+    }
@@ -1,11 +1,28 @@
 from datetime import datetime,timedelta
 from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import threading
 
 from jose import JWTError,jwt
 from passlib.context import CryptContext
 import os
 
-pwd_context=CryptContext(schemes=["bcrypt"],deprecated="auto")
+# bcrypt cost factor. Hashes made with a different cost are upgraded the
+# next time their owner logs in.
+BCRYPT_ROUNDS=int(os.getenv("BCRYPT_ROUNDS","12"))
+
+# Processes doing password hashing; 0 hashes on the default thread pool
+# instead.
+PASSWORD_HASH_WORKERS=int(os.getenv("PASSWORD_HASH_WORKERS","2"))
+
+pwd_context=CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 SECRET_KEY =os.getenv("SECRET_KEY","change_this_secret")
 ALGORITHM="HS256"
@@ -26,6 +43,69 @@ def verify_password(plain_password:str,hashed_password:str)->bool:
     return pwd_context.verify(plain_password,hashed_password)
 
 
+def verify_and_update_password(
+        plain_password:str,
+        hashed_password:str
+)->tuple[bool,Optional[str]]:
+    """
+    Verify a password; also returns a replacement hash when the stored one
+    was made with a different cost (None if it is current)
+    """
+    return pwd_context.verify_and_update(plain_password,hashed_password)
+
+
+_hash_pool=None
+_hash_pool_lock=threading.Lock()
+
+
+def _get_hash_pool()->Optional[ProcessPoolExecutor]:
+    global _hash_pool
+
+    if PASSWORD_HASH_WORKERS<=0:
+        return None
+
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool=ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        return _hash_pool
+
+
+async def _run_hash(func,*args):
+    """
+    Await func on the hashing pool. The event loop keeps serving other
+    requests meanwhile and no request thread is held while it waits
+    """
+    pool=_get_hash_pool()
+    loop=asyncio.get_running_loop()
+    return await loop.run_in_executor(pool,func,*args)
+
+
+async def hash_password_async(password:str)->str:
+    """
+    hash_password on the password hashing pool
+    """
+    return await _run_hash(hash_password,password)
+
+
+async def verify_and_update_password_async(
+        plain_password:str,
+        hashed_password:str
+)->tuple[bool,Optional[str]]:
+    """
+    verify_and_update_password on the password hashing pool
+    """
+    return await _run_hash(verify_and_update_password,plain_password,hashed_password)
+
+
+def shutdown_hash_pool()->None:
+    global _hash_pool
+
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(wait=False,cancel_futures=True)
+            _hash_pool=None
+
+
 
 def create_access_token(
         data:dict,
@@ -1,13 +1,97 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker,declarative_base
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from contextvars import ContextVar
+import threading
+import time
 import os
 from dotenv import load_dotenv
 
+from app.metrics import instrument_engine
+from app.tracing import trace_engine
+
 load_dotenv()
 
 DATABASE_URL=os.getenv("DATABASE_URL")
 
-engine=create_engine(DATABASE_URL)
+# Pool tuning; size these for the number of API and worker processes
+# sharing the database.
+DB_POOL_SIZE=int(os.getenv("DB_POOL_SIZE","5"))
+DB_MAX_OVERFLOW=int(os.getenv("DB_MAX_OVERFLOW","10"))
+DB_POOL_TIMEOUT=float(os.getenv("DB_POOL_TIMEOUT","30"))
+DB_POOL_RECYCLE=int(os.getenv("DB_POOL_RECYCLE","1800"))
+DB_POOL_PRE_PING=os.getenv("DB_POOL_PRE_PING","true").lower()=="true"
+
+# There is only this sync engine. Async routes run their Session work
+# through asyncio.to_thread, so every checkout shows up in pool_stats().
+
+
+_pool_totals={
+    "checkouts":0,
+    "wait_seconds":0.0,
+    "max_wait_seconds":0.0,
+    "exhausted":0,
+    "timeouts":0,
+}
+_pool_lock=threading.Lock()
+
+# Stats for the current request; set by track_pool_stats()
+_request_pool_stats:ContextVar[dict | None]=ContextVar("request_pool_stats",default=None)
+
+
+def _record_checkout(wait:float,exhausted:bool,timed_out:bool)->None:
+    with _pool_lock:
+        _pool_totals["checkouts"]+=1
+        _pool_totals["wait_seconds"]+=wait
+        _pool_totals["max_wait_seconds"]=max(_pool_totals["max_wait_seconds"],wait)
+        _pool_totals["exhausted"]+=exhausted
+        _pool_totals["timeouts"]+=timed_out
+
+    stats=_request_pool_stats.get()
+    if stats is not None:
+        stats["checkouts"]+=1
+        stats["wait_seconds"]+=wait
+        stats["exhausted"]+=exhausted
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited and whether the
+    pool was exhausted (every connection, overflow included, in use).
+    """
+
+    def _do_get(self):
+        exhausted=self.checkedout()>=self.size()+max(self._max_overflow,0)
+        start=time.perf_counter()
+        timed_out=False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timed_out=True
+            raise
+        finally:
+            _record_checkout(time.perf_counter()-start,exhausted,timed_out)
+
+
+def _engine_options(url:str)->dict:
+    if url.startswith("sqlite"):
+        # SQLite uses its own single-connection pools
+        return {}
+
+    return {
+        "poolclass":TimedQueuePool,
+        "pool_size":DB_POOL_SIZE,
+        "max_overflow":DB_MAX_OVERFLOW,
+        "pool_timeout":DB_POOL_TIMEOUT,
+        "pool_recycle":DB_POOL_RECYCLE,
+        "pool_pre_ping":DB_POOL_PRE_PING,
+    }
+
+
+engine=create_engine(DATABASE_URL,**_engine_options(DATABASE_URL))
+instrument_engine(engine)
+trace_engine(engine)
 
 SessionLocal=sessionmaker(
     autocommit=False,
@@ -18,6 +102,38 @@ SessionLocal=sessionmaker(
 Base=declarative_base()
 
 
-from app.models import email,user
+def get_db():
+    db=SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def track_pool_stats()->dict:
+    """
+    Start collecting pool stats for the current request; returns the
+    dict that checkouts made while handling it are added to.
+    """
+    stats={"checkouts":0,"wait_seconds":0.0,"exhausted":0}
+    _request_pool_stats.set(stats)
+    return stats
+
+
+def pool_stats()->dict:
+    with _pool_lock:
+        totals=dict(_pool_totals)
+
+    pool=engine.pool
+    if isinstance(pool,QueuePool):
+        totals.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            checked_in=pool.checkedin(),
+        )
+
+    return totals
+
 
-    
\ No newline at end of file
+from app.models import email,user,google_account,ingestion_job,ai_result_cache,email_digest,email_body,processing_run
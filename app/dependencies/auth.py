@@ -1,25 +1,53 @@
+import os
+from dataclasses import dataclass
 from fastapi import Depends,HTTPException,status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session 
 
-from app.database import SessionLocal
+from app.database import get_db
 from app.models.user import User
 from app.core.security import decode_access_token
+from app.utils.ttl_cache import TTLCache
 
 oauth2_scheme=OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def get_db():
-    db=SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Authenticated users are cached by token subject so polling requests
+# skip the users lookup. Tokens are still decoded and checked every time.
+# The cached principal is only id and email, and nothing in the app
+# changes or deletes a user row, so AUTH_USER_CACHE_TTL is the only bound
+# on staleness (e.g. for rows removed by hand). A future path that
+# updates or deletes users must call invalidate_user.
+AUTH_USER_CACHE_SIZE=int(os.getenv("AUTH_USER_CACHE_SIZE","1024"))
+AUTH_USER_CACHE_TTL=float(os.getenv("AUTH_USER_CACHE_TTL","60"))
+
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """
+    The authenticated user as seen by routes; detached from any session.
+    """
+    id:int
+    email:str
+
+
+_user_cache=TTLCache(AUTH_USER_CACHE_SIZE,AUTH_USER_CACHE_TTL)
+
+
+def invalidate_user(email:str)->None:
+    """
+    Drop a cached principal; call whenever the user row changes.
+    """
+    _user_cache.invalidate(email)
+
+
+def user_cache_stats()->dict:
+    return _user_cache.stats()
 
 
 def get_current_user(
         token:str=Depends(oauth2_scheme),
         db:Session=Depends(get_db)
-)-> User:
+)-> UserPrincipal:
     payload=decode_access_token(token)
 
     if payload is None:
@@ -34,11 +62,19 @@ def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token"
         )
-    user=db.query(User).filter(User.email==email).first()
+
+    principal=_user_cache.get(email)
+    if principal is not None:
+        return principal
+
+    user=db.query(User.id,User.email).filter(User.email==email).first()
 
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
-    return user
\ No newline at end of file
+
+    principal=UserPrincipal(id=user.id,email=user.email)
+    _user_cache.set(email,principal)
+    return principal
@@ -1,3 +1,4 @@
+import json
 import logging
 
 logging.basicConfig(
@@ -5,4 +6,14 @@ logging.basicConfig(
     format="%(asctime)s| %(levelname)s | %(name)s | %(message)s"
 )
 
-logger=logging.getLogger("email-service")
\ No newline at end of file
+logger=logging.getLogger("email-service")
+
+
+def log_event(event: str, level: str = "info", **fields) -> None:
+    """
+    Log one structured event as a JSON object, e.g. a trace span.
+    Fields set to None are left out.
+    """
+    payload = {"event": event}
+    payload.update((key, value) for key, value in fields.items() if value is not None)
+    logger.log(logging.getLevelName(level.upper()), json.dumps(payload, default=str))
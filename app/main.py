@@ -1,22 +1,45 @@
 from fastapi import FastAPI, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from typing import List
 from datetime import datetime
+import re
+import time
 
-from app.database import SessionLocal, engine, Base
+from app.database import SessionLocal, engine, Base, get_db, track_pool_stats, pool_stats
+from app.logger import logger
 from app.models.email import Email
 from app.schemas.email_schema import EmailResponse
 from app.utils.time_filter import get_time_cutoff
-from app.ai.digest_generator import generate_digest
+from app.ai.digest_generator import generate_digest, stream_digest
 from app.ai.classifier import classify_email
+from app.ai import classifier, summarizer, analyzer
+from app.ai.result_cache import invalidate as invalidate_ai_cache
 from app.core.email_service import create_email
-from app.routes import auth, user, google_auth
+from app.core.email_queries import list_emails_page, get_email, emails_since
+from app.dependencies.auth import get_current_user, UserPrincipal
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.routes import auth, user, google_auth, gmail
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
+from app.core.digest_service import digest_event_stream
+from app.core.digest_cache import evict_digests
+from app.core.security import shutdown_hash_pool
+from app.metrics import HTTP_REQUEST_SECONDS, render_metrics
+from app.tracing import open_trace, close_trace
 
 app = FastAPI()
 
 Base.metadata.create_all(bind=engine)
 
+# Drop cached AI results produced by an older model or prompt version
+invalidate_ai_cache("classify", keep_version=classifier.CACHE_VERSION)
+invalidate_ai_cache("summarize", keep_version=summarizer.CACHE_VERSION)
+invalidate_ai_cache("analyze", keep_version=analyzer.CACHE_VERSION)
+
+# Drop expired and overflowing digest cache rows
+with SessionLocal() as db:
+    evict_digests(db)
+    db.commit()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
@@ -29,16 +52,105 @@ app.add_middleware(
 app.include_router(auth.router)
 app.include_router(user.router)
 app.include_router(google_auth.router)
+app.include_router(gmail.router)
+
+
+@app.on_event("shutdown")
+def stop_hash_pool():
+    shutdown_hash_pool()
+
+
+@app.middleware("http")
+async def record_pool_stats(request, call_next):
+    stats = track_pool_stats()
+
+    response = await call_next(request)
+
+    response.headers["X-DB-Pool-Checkouts"] = str(stats["checkouts"])
+    response.headers["X-DB-Pool-Wait-Ms"] = f"{stats['wait_seconds'] * 1000:.1f}"
+
+    if stats["exhausted"]:
+        logger.warning(
+            "DB pool exhausted during %s %s (waited %.1f ms)",
+            request.method,
+            request.url.path,
+            stats["wait_seconds"] * 1000,
+        )
+
+    return response
+
+
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Route template rather than the raw path, to bound label values
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            request.method,
+            route.path if route is not None else "unmatched",
+            str(status_code),
+        ).observe(time.perf_counter() - start)
+
+
+# Client-supplied request ids are kept only if they look like one
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+@app.middleware("http")
+async def trace_requests(request, call_next):
+    # Registered last so it wraps the other middleware too
+    request_id = request.headers.get("X-Request-ID", "")
+    if not _REQUEST_ID.match(request_id):
+        request_id = None
+
+    current = open_trace("request", request_id=request_id, method=request.method)
+    try:
+        response = await call_next(request)
+    except Exception as e:
+        close_trace(current, e)
+        raise
+
+    route = request.scope.get("route")
+    current["attrs"]["route"] = route.path if route is not None else request.url.path
+    current["attrs"]["status"] = response.status_code
+    response.headers["X-Request-ID"] = current["request_id"]
+
+    # The trace ends once the body has been sent, so streamed responses
+    # (SSE digests) are timed to their last byte
+    response.body_iterator = _close_trace_after(response.body_iterator, current)
+    return response
 
 
-def get_db():
-    db = SessionLocal()
+async def _close_trace_after(body, current: dict):
+    error = None
     try:
-        yield db
+        async for chunk in body:
+            yield chunk
+    except Exception as e:
+        error = e
+        raise
     finally:
-        db.close()
+        close_trace(current, error)
 
 
+@app.get("/db/pool")
+def get_pool_stats(
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    return pool_stats()
+
+
+@app.get("/metrics")
+def get_metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 
 
 @app.post("/emails", status_code=status.HTTP_201_CREATED)
@@ -58,21 +170,34 @@ def save_email(request: dict, db: Session = Depends(get_db)):
 
 
 
-@app.get("/emails", response_model=List[EmailResponse])
-def get_emails(db: Session = Depends(get_db)):
-    return (
-        db.query(Email)
-        .filter(Email.is_active == True)
-        .order_by(Email.received_at.desc())
-        .all()
-    )
+@app.get("/emails")
+def get_emails(
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: str | None = Query(None, description="Comma separated columns to return"),
+    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    try:
+        return list_emails_page(
+            db,
+            Email.is_active == True,
+            user_id=current_user.id,
+            cursor=cursor,
+            limit=limit,
+            fields=fields
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 
 @app.get("/emails/digest")
 def get_email_digest(
     range: str = Query("7d", description="7d | 15d | 30d"),
-    db: Session = Depends(get_db)
+    stream: bool = Query(False, description="Stream the digest as Server-Sent Events"),
+    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     try:
         cutoff = get_time_cutoff(range)
@@ -80,26 +205,35 @@ def get_email_digest(
         raise HTTPException(status_code=400, detail=str(e))
 
     emails = (
-        db.query(Email)
-        .filter(
-            Email.is_active == True,
-            Email.received_at >= cutoff
-        )
-        .order_by(Email.received_at.desc())
+        emails_since(db, user_id=current_user.id, cutoff=cutoff)
+        .filter(Email.is_active == True)
         .all()
     )
 
     summaries = []
     categories = []
+    dates = []
 
     for email in emails:
         if email.ai_reason:
             summaries.append(email.ai_reason)
             categories.append(email.email_type)
+            dates.append(email.received_at)
+
+    if stream:
+        return StreamingResponse(
+            digest_event_stream(
+                stream_digest(summaries, categories, dates),
+                range_str=range
+            ),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
 
     digest = generate_digest(
         summaries=summaries,
-        categories=categories
+        categories=categories,
+        dates=dates
     )
 
     return {
@@ -108,3 +242,17 @@ def get_email_digest(
         "digest": digest["digest"],
         "model_version": digest["model_version"]
     }
+
+
+@app.get("/emails/{email_id}", response_model=EmailResponse)
+def get_email_detail(
+    email_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    email = get_email(db, email_id, Email.is_active == True, user_id=current_user.id)
+
+    if not email:
+        raise HTTPException(status_code=404, detail="Email not found")
+
+    return email
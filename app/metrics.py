@@ -0,0 +1,185 @@
+import os
+import time
+from contextlib import contextmanager
+
+import openai
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+
+# Requests/calls finish anywhere from a few ms (DB) to tens of seconds (LLM)
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+OPENAI_REQUESTS = Counter(
+    "openai_requests_total",
+    "OpenAI API requests",
+    ["module", "model", "outcome"],
+)
+OPENAI_REQUEST_SECONDS = Histogram(
+    "openai_request_duration_seconds",
+    "OpenAI API request latency",
+    ["module", "model"],
+    buckets=LATENCY_BUCKETS,
+)
+OPENAI_TOKENS = Counter(
+    "openai_tokens_total",
+    "Tokens used by OpenAI API requests",
+    ["module", "model", "kind"],
+)
+
+# Fallback rate per function is ai_fallbacks_total / ai_results_total.
+# The label is the function that produced the result: ingestion runs
+# classify and summarize through analyze_emails (plus summarize_email for
+# emails the local classifier labelled), so its classification and
+# summary fallbacks are counted under analyze_emails, not classify_emails.
+AI_RESULTS = Counter(
+    "ai_results_total",
+    "AI results returned, fallback or not",
+    ["function"],
+)
+AI_FALLBACKS = Counter(
+    "ai_fallbacks_total",
+    "AI results replaced by the fallback result",
+    ["function"],
+)
+
+GMAIL_REQUESTS = Counter(
+    "gmail_api_requests_total",
+    "Gmail API requests",
+    ["endpoint", "status"],
+)
+GMAIL_RETRIES = Counter(
+    "gmail_api_retries_total",
+    "Gmail API requests retried, by the status (or error) that caused it",
+    ["endpoint", "reason"],
+)
+GMAIL_REQUEST_SECONDS = Histogram(
+    "gmail_api_request_duration_seconds",
+    "Gmail API request latency",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Database statement execution time",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+def _openai_outcome(error: Exception) -> str:
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(error, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection_error"
+    if isinstance(error, openai.APIStatusError):
+        return f"http_{error.status_code}"
+    return "error"
+
+
+@contextmanager
+def track_openai_call(module: str, model: str):
+    """
+    Time one OpenAI request and count it by outcome. Exceptions are
+    re-raised.
+    """
+    outcome = "ok"
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        outcome = _openai_outcome(e)
+        raise
+    finally:
+        OPENAI_REQUEST_SECONDS.labels(module, model).observe(time.perf_counter() - start)
+        OPENAI_REQUESTS.labels(module, model, outcome).inc()
+
+
+def record_openai_usage(module: str, model: str, usage) -> None:
+    if usage is None:
+        return
+    OPENAI_TOKENS.labels(module, model, "prompt").inc(usage.prompt_tokens or 0)
+    OPENAI_TOKENS.labels(module, model, "completion").inc(usage.completion_tokens or 0)
+
+
+def record_results(function: str, count: int = 1) -> None:
+    AI_RESULTS.labels(function).inc(count)
+
+
+def record_fallback(function: str) -> None:
+    AI_FALLBACKS.labels(function).inc()
+
+
+@contextmanager
+def track_gmail_call(endpoint: str):
+    """
+    Time one Gmail API request; the block yields a dict whose "status"
+    should be set to the response status code.
+    """
+    call = {"status": "error"}
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        GMAIL_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+        GMAIL_REQUESTS.labels(endpoint, str(call["status"])).inc()
+
+
+def statement_operation(statement: str) -> str:
+    verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    if verb in ("select", "insert", "update", "delete", "with"):
+        return verb
+    return "other"
+
+
+def instrument_engine(engine) -> None:
+    """
+    Record DB_QUERY_SECONDS for every statement run on a (sync) engine.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        DB_QUERY_SECONDS.labels(statement_operation(statement)).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("query_start") if context.connection else None
+        if starts:
+            starts.pop()
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Current metrics in the Prometheus text format, aggregated across
+    processes when PROMETHEUS_MULTIPROC_DIR is set.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+    return generate_latest(), CONTENT_TYPE_LATEST
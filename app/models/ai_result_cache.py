@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, func
+from app.database import Base
+
+
+class AIResultCache(Base):
+    __tablename__ = "ai_result_cache"
+
+    id = Column(Integer, primary_key=True)
+
+    # sha256 of kind + cache version + normalized body
+    cache_key = Column(String(64), nullable=False, unique=True, index=True)
+    kind = Column(String, nullable=False)  # classify / summarize
+    model_version = Column(String, nullable=False, index=True)
+    result = Column(Text, nullable=False)  # JSON
+
+    created_at = Column(
+        DateTime,
+        nullable=False,
+        server_default=func.now()
+    )
@@ -10,9 +10,12 @@ from sqlalchemy import (
     func,
     text,
     ForeignKey,
-    Text
+    Text,
+    Index
 )
+from sqlalchemy.orm import relationship
 from app.database import Base
+from app.models.email_body import EmailBody
 
 
 class Email(Base):
@@ -26,7 +29,14 @@ class Email(Base):
 
     # Email content
     email = Column(Text, nullable=False)  # sender
-    body = Column(Text, nullable=False)
+    # Compressed in email_bodies, loaded on first access of `body`
+    body_record = relationship(
+        EmailBody,
+        uselist=False,
+        lazy="select",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
     email_type = Column(String, nullable=False)
 
@@ -66,6 +76,17 @@ class Email(Base):
         index=True,
     )
 
+    @property
+    def body(self) -> str | None:
+        record = self.body_record
+        return record.text if record is not None else None
+
+    @body.setter
+    def body(self, value: str) -> None:
+        if self.body_record is None:
+            self.body_record = EmailBody()
+        self.body_record.text = value
+
     __table_args__ = (
         CheckConstraint(
             "email_type IN ('newsletter', 'support', 'marketing')",
@@ -76,4 +97,30 @@ class Email(Base):
             "gmail_message_id",
             name="user_gmail_message_unique",
         ),
+        # Every read is scoped to a user and ordered/filtered by time;
+        # id completes the keyset used for pagination.
+        Index("ix_emails_user_received", "user_id", "received_at", "id"),
+        # Work queues: only rows still waiting are indexed
+        Index(
+            "ix_emails_user_unclassified",
+            "user_id",
+            "received_at",
+            postgresql_where=text("ai_email_type IS NULL"),
+            sqlite_where=text("ai_email_type IS NULL"),
+        ),
+        Index(
+            "ix_emails_user_unsummarized",
+            "user_id",
+            "received_at",
+            postgresql_where=text("ai_summary IS NULL"),
+            sqlite_where=text("ai_summary IS NULL"),
+        ),
+        Index(
+            "ix_emails_user_needs_review",
+            "user_id",
+            "received_at",
+            "id",
+            postgresql_where=text("needs_review = true"),
+            sqlite_where=text("needs_review = 1"),
+        ),
     )
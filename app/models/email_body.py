@@ -0,0 +1,54 @@
+import zlib
+from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey
+from app.database import Base
+
+# Compression applied to new bodies; stored per row so old rows stay
+# readable if this changes.
+BODY_CODEC = "zlib"
+ZLIB_LEVEL = 6
+
+
+def encode_body(text: str) -> dict:
+    """
+    Column values for storing `text` as a compressed body.
+    """
+    raw = (text or "").encode("utf-8")
+    return {
+        "codec": BODY_CODEC,
+        "raw_size": len(raw),
+        "data": zlib.compress(raw, ZLIB_LEVEL),
+    }
+
+
+def decode_body(data: bytes, codec: str) -> str:
+    if codec == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    if codec == "raw":
+        return data.decode("utf-8")
+    raise ValueError(f"Unknown body codec: {codec}")
+
+
+class EmailBody(Base):
+    """
+    Compressed raw body of an email, kept out of the hot emails table and
+    loaded only when Email.body is accessed.
+    """
+    __tablename__ = "email_bodies"
+
+    email_id = Column(
+        Integer,
+        ForeignKey("emails.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    codec = Column(String, nullable=False)
+    raw_size = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+    @property
+    def text(self) -> str:
+        return decode_body(self.data, self.codec)
+
+    @text.setter
+    def text(self, value: str) -> None:
+        for key, column_value in encode_body(value).items():
+            setattr(self, key, column_value)
@@ -1,11 +1,17 @@
-from sqlalchemy import Column, Integer, String, DateTime, func
+from sqlalchemy import Column, Integer, String, DateTime, Date, Text, ForeignKey, UniqueConstraint, Index, func
 from app.database import Base
 
 class EmailDigest(Base):
     __tablename__ = "email_digests"
+    __table_args__ = (
+        Index("ix_email_digests_user_range", "user_id", "range", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     range = Column(String, nullable=False)  # 7d / 15d / 30d
+    # First instant covered; new mail at or after it makes the row stale
+    window_start = Column(DateTime, nullable=True)
     content = Column(String, nullable=False)
     model_version = Column(String, nullable=False)
 
@@ -14,3 +20,27 @@ class EmailDigest(Base):
         nullable=False,
         server_default=func.now()
     )
+
+
+class DailyDigest(Base):
+    """
+    Partial digest of one user's mail for one UTC day. Window digests are
+    assembled from these instead of from every summary in the window.
+    """
+    __tablename__ = "daily_digests"
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", name="uq_daily_digests_user_day"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    day = Column(Date, nullable=False)
+    content = Column(Text, nullable=False)
+    email_count = Column(Integer, nullable=False)
+    model_version = Column(String, nullable=False)
+
+    created_at = Column(
+        DateTime,
+        nullable=False,
+        server_default=func.now()
+    )
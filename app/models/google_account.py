@@ -1,5 +1,5 @@
-from sqlalchemy import Column,Integer,String,ForeignKey,DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column,Integer,String,ForeignKey,DateTime,Text
+from sqlalchemy.orm import relationship,backref
 from datetime import datetime
 
 from app.database import Base
@@ -11,6 +11,11 @@ class GoogleAccount(Base):
     user_id=Column(Integer,ForeignKey("users.id"),unique=True)
     google_user_id=Column(String,unique=True,index=True)
     email=Column(String,index=True)
+    access_token=Column(Text,nullable=True)
+
+    # Gmail mailbox cursor for incremental sync via the history API
+    history_id=Column(String,nullable=True)
+    last_synced_at=Column(DateTime,nullable=True)
+
     created_at=Column(DateTime,default=datetime.utcnow)
-    user=relationship("User",backref="google_account")
-    
\ No newline at end of file
+    user=relationship("User",backref=backref("google_account",uselist=False))
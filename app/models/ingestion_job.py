@@ -0,0 +1,57 @@
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    DateTime,
+    Text,
+    ForeignKey,
+    CheckConstraint,
+    Index,
+    func,
+    text,
+)
+from app.database import Base
+
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    google_account_id = Column(Integer, ForeignKey("google_accounts.id"), nullable=False)
+
+    kind = Column(String, nullable=False)  # sync / backfill / process_run
+    payload = Column(Text, nullable=True)  # JSON arguments for the handler
+    status = Column(
+        String,
+        nullable=False,
+        server_default=text("'queued'"),
+    )
+
+    attempts = Column(Integer, nullable=False, server_default=text("0"))
+    max_attempts = Column(Integer, nullable=False, server_default=text("5"))
+    last_error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # JSON summary from the handler
+
+    # Lease held by the worker currently running the job
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+
+    run_after = Column(DateTime, nullable=False, server_default=func.now())
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(
+        DateTime,
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        CheckConstraint(
+            "status IN ('queued', 'running', 'succeeded', 'failed')",
+            name="ingestion_job_status_check",
+        ),
+        Index("ix_ingestion_jobs_status_run_after", "status", "run_after"),
+    )
@@ -0,0 +1,53 @@
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    DateTime,
+    Float,
+    Text,
+    ForeignKey,
+    CheckConstraint,
+    func,
+    text,
+)
+from app.database import Base
+
+
+class ProcessingRun(Base):
+    __tablename__ = "processing_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+
+    kind = Column(String, nullable=False)  # classify / summarize / analyze
+    range = Column(String, nullable=False)  # 7d / 15d / 30d
+    cutoff = Column(DateTime, nullable=False)
+    # queued until a worker picks up its "process_run" job
+    status = Column(
+        String,
+        nullable=False,
+        server_default=text("'queued'"),
+    )
+
+    # Keyset position of the last committed chunk; a resumed run
+    # continues after it.
+    checkpoint_received_at = Column(DateTime, nullable=True)
+    checkpoint_id = Column(Integer, nullable=True)
+
+    total = Column(Integer, nullable=False, server_default=text("0"))
+    processed = Column(Integer, nullable=False, server_default=text("0"))
+    # Time spent processing chunks, excluding gaps between resumes
+    active_seconds = Column(Float, nullable=False, server_default=text("0"))
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        CheckConstraint(
+            "status IN ('queued', 'running', 'succeeded', 'failed')",
+            name="processing_run_status_check",
+        ),
+    )
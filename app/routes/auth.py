@@ -1,58 +1,82 @@
+import asyncio
 from fastapi import APIRouter,Depends,HTTPException,status
 from sqlalchemy.orm import Session
-from app.database import SessionLocal
+from app.database import get_db
 from app.models.user import User
 from app.schemas.user_schema import UserCreate,UserLogin,TokenResponse
 from app.core.security import (
-    hash_password,
-    verify_password,
+    hash_password_async,
+    verify_and_update_password_async,
     create_access_token
 )
 
 router=APIRouter(prefix="/auth",tags=["auth"])
 
-def get_db():
-    db=SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
-        
+# The handlers are async so a login waiting on the hashing pool holds no
+# request thread; their (sync) Session work runs via asyncio.to_thread.
+
+def _find_user(db:Session,email:str)->User | None:
+    return db.query(User).filter(User.email==email).first()
+
+
+def _create_user(db:Session,email:str,hashed_password:str)->User:
+    new_user=User(
+        email=email,
+        hashed_password=hashed_password
+    )
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
+    return new_user
+
+
+def _update_hash(db:Session,db_user:User,hashed_password:str)->None:
+    db_user.hashed_password=hashed_password
+    db.commit()
+
+
 @router.post("/signup",response_model=TokenResponse)
-def signup(user:UserCreate,db:Session=Depends(get_db)):
-    existing_user=db.query(User).filter(User.email==user.email).first()
+async def signup(user:UserCreate,db:Session=Depends(get_db)):
+    existing_user=await asyncio.to_thread(_find_user,db,user.email)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
 
-    new_user=User(
-        email=user.email,
-        hashed_password=hash_password(user.password)
-    )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    hashed_password=await hash_password_async(user.password)
+    new_user=await asyncio.to_thread(_create_user,db,user.email,hashed_password)
 
     token=create_access_token({"sub":new_user.email})
 
     return {"access_token":token}
 
 @router.post("/login", response_model=TokenResponse)
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def login(user: UserLogin, db: Session = Depends(get_db)):
+    db_user = await asyncio.to_thread(_find_user, db, user.email)
 
-    if not db_user or not verify_password(
+    if not db_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid email or password"
+        )
+
+    verified, new_hash = await verify_and_update_password_async(
         user.password,
         db_user.hashed_password
-    ):
+    )
+
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
 
+    if new_hash:
+        # Stored hash used an old cost factor
+        await asyncio.to_thread(_update_hash, db, db_user, new_hash)
+
     token = create_access_token({"sub": db_user.email})
 
     return {"access_token": token}
@@ -1,224 +1,409 @@
+import asyncio
 from fastapi import APIRouter,Depends,Query,HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.database import SessionLocal
-from app.models.user import User
+from app.database import get_db
+from app.models.google_account import GoogleAccount
 from app.models.email import Email
 from app.core.security import decode_access_token
-from app.core.gmail_client import list_messages,get_message
-from app.core.gmail_parser import parse_message
-from app.dependencies.auth import get_current_user
+from app.core.gmail_sync import sync_account,backfill_account
+from app.dependencies.auth import get_current_user,UserPrincipal
 from app.utils.time_filter import get_time_cutoff
+from app.utils.pagination import DEFAULT_PAGE_SIZE,MAX_PAGE_SIZE
+from app.core.email_queries import (
+    list_emails_page,
+    get_email,
+    user_emails,
+    REVIEW_FILTER,
+)
+from app.core.processing_runs import queue_run,resume_run,run_progress,can_resume
+from app.models.processing_run import ProcessingRun
+from app.schemas.email_schema import EmailResponse
 from datetime import datetime
-from email.utils import parsedate_to_datetime
-from app.ai.classifier import classify_email
-from app.ai.summarizer import summarize_email
-from app.ai.digest_generator import generate_digest
-from app.models.email_digest import EmailDigest
+from app.ai.result_cache import cache_stats
+from app.ai.local_classifier import local_classifier_stats
+from app.ai.preprocess import preprocess_stats
+from app.models.ingestion_job import IngestionJob
+from app.core.job_queue import enqueue_job,job_status
+from app.core.digest_service import digest_event_stream,sse_event,build_digest,stream_window_digest
+from app.core.digest_cache import digest_window_start,get_cached_digest,invalidate_for_emails
 
 
 router=APIRouter(prefix="/gmail",tags=["gmail"])
 
-def get_db():
-    db=SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+
+def _google_account(db: Session, current_user: UserPrincipal) -> GoogleAccount | None:
+    return (
+        db.query(GoogleAccount)
+        .filter(GoogleAccount.user_id == current_user.id)
+        .first()
+    )
 
 
 @router.get("/sync")
 def sync_gmail(
-    current_user: User = Depends(get_current_user),
+    mode: str = Query("incremental", description="incremental | full"),
+    current_user: UserPrincipal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    google_account = current_user.google_account
-    messages = list_messages(google_account.access_token, max_results=5)
+    google_account = _google_account(db, current_user)
 
-    parsed_emails = []
+    if google_account is None or not google_account.access_token:
+        raise HTTPException(status_code=400, detail="Google account not connected")
 
-    for msg in messages:
-        full_msg = get_message(
-            google_account.access_token,
-            msg["id"]
-        )
+    try:
+        return sync_account(db, google_account, mode=mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/backfill")
+def backfill_gmail(
+    range: str = Query("30d", description="Time range: 7d, 15d, 30d"),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    google_account = _google_account(db, current_user)
+
+    if google_account is None or not google_account.access_token:
+        raise HTTPException(status_code=400, detail="Google account not connected")
+
+    try:
+        return backfill_account(db, google_account, range_str=range)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        parsed = parse_message(full_msg)
 
-        email_obj = Email(
-            email=parsed["sender"],
-            email_type="newsletter",  # placeholder for now
-            body=parsed["body"],
-            received_at=parsedate_to_datetime(parsed["received_at"])
+@router.post("/jobs")
+def create_ingestion_job(
+    kind: str = Query("sync", description="sync | backfill"),
+    range: str = Query("30d", description="Backfill time range: 7d, 15d, 30d"),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    google_account = _google_account(db, current_user)
+
+    if google_account is None or not google_account.access_token:
+        raise HTTPException(status_code=400, detail="Google account not connected")
+
+    if kind == "sync":
+        payload = {}
+    elif kind == "backfill":
+        try:
+            get_time_cutoff(range)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        payload = {"range_str": range}
+    else:
+        raise HTTPException(status_code=400, detail="Invalid job kind")
+
+    job = enqueue_job(
+        db,
+        user_id=current_user.id,
+        google_account_id=google_account.id,
+        kind=kind,
+        payload=payload,
+    )
+
+    return job_status(job)
+
+
+@router.get("/jobs")
+def list_ingestion_jobs(
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    jobs = (
+        db.query(IngestionJob)
+        .filter(IngestionJob.user_id == current_user.id)
+        .order_by(IngestionJob.created_at.desc())
+        .limit(20)
+        .all()
+    )
+
+    return [job_status(job) for job in jobs]
+
+
+@router.get("/jobs/{job_id}")
+def get_ingestion_job(
+    job_id: int,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    job = (
+        db.query(IngestionJob)
+        .filter(
+            IngestionJob.id == job_id,
+            IngestionJob.user_id == current_user.id,
         )
+        .first()
+    )
 
-        db.add(email_obj)
-        parsed_emails.append(parsed)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
 
-    db.commit()
-    return parsed_emails
+    return job_status(job)
 
 
 @router.get("/emails")
 def get_emails_by_time(
     range:str=Query("7d",description="Time range:7d,15d,30d"),
+    cursor:str|None=Query(None,description="next_cursor from the previous page"),
+    limit:int=Query(DEFAULT_PAGE_SIZE,ge=1,le=MAX_PAGE_SIZE),
+    fields:str|None=Query(None,description="Comma separated columns to return"),
     db:Session=Depends(get_db),
-    current_user:User=Depends(get_current_user)
+    current_user:UserPrincipal=Depends(get_current_user)
 ):
     try:
         cutoff_time=get_time_cutoff(range)
+        return list_emails_page(
+            db,
+            Email.received_at>=cutoff_time,
+            user_id=current_user.id,
+            cursor=cursor,
+            limit=limit,
+            fields=fields
+        )
     except ValueError as e:
         raise HTTPException(status_code=400,detail=str(e))
-    
-    emails=(
-        db.query(Email)
-        .filter(Email.received_at>=cutoff_time)
-        .order_by(Email.received_at.desc())
-        .all()
-    )
-    return emails
 
-@router.post("/classify")
-def classify_emails(
-    range: str = Query("7d", description="Time range: 7d, 15d, 30d"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+
+@router.get("/emails/{email_id}",response_model=EmailResponse)
+def get_email_detail(
+    email_id:int,
+    db:Session=Depends(get_db),
+    current_user:UserPrincipal=Depends(get_current_user)
 ):
-    cutoff_time = get_time_cutoff(range)
+    email=get_email(db,email_id,user_id=current_user.id)
 
-    emails = (
-        db.query(Email)
-        .filter(
-            Email.received_at >= cutoff_time,
-            Email.ai_email_type.is_(None)  # re-runnable safety
-        )
-        .all()
-    )
+    if not email:
+        raise HTTPException(status_code=404,detail="Email not found")
 
-    classified_count = 0
+    return email
 
-    for email in emails:
-        result = classify_email(email.body)
+def _run(db: Session, current_user: UserPrincipal, kind: str, range: str) -> dict:
+    google_account = _google_account(db, current_user)
 
-        email.ai_email_type = result["email_type"]
-        email.confidence_score = result["confidence"]
-        email.ai_reason = result["reason"]
-        email.model_version = result["model_version"]
-        email.needs_review = result["confidence"] < 0.6
+    if google_account is None:
+        raise HTTPException(status_code=400, detail="Google account not connected")
 
-        classified_count += 1
+    # The worker (python -m app.worker) processes the run; poll
+    # /gmail/runs/{id} for progress.
+    try:
+        run = queue_run(
+            db,
+            user_id=current_user.id,
+            google_account_id=google_account.id,
+            kind=kind,
+            range_str=range,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return run_progress(db, run)
+
+
+@router.post("/classify")
+def classify_emails(
+    range: str = Query("7d", description="Time range: 7d, 15d, 30d"),
+    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    # re-runnable safety: only emails without a classification are picked up
+    return _run(db, current_user, "classify", range)
 
-    db.commit()
 
-    return {
-        "classified": classified_count
-    }
 @router.post("/summarize")
 def summarize_emails(
     range: str = Query("7d", description="Time range: 7d, 15d, 30d"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    # re-runnable safety: only emails without a summary are picked up
+    return _run(db, current_user, "summarize", range)
+
+
+@router.post("/analyze")
+def analyze_emails(
+    range: str = Query("7d", description="Time range: 7d, 15d, 30d"),
+    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    cutoff_time = get_time_cutoff(range)
+    # re-runnable safety: only emails missing either result are picked up
+    return _run(db, current_user, "analyze", range)
 
-    emails = (
-        db.query(Email)
+
+def _get_run(db: Session, current_user: UserPrincipal, run_id: int) -> ProcessingRun:
+    run = (
+        db.query(ProcessingRun)
         .filter(
-            Email.received_at >= cutoff_time,
-            Email.ai_summary.is_(None)  # re-runnable safety
+            ProcessingRun.id == run_id,
+            ProcessingRun.user_id == current_user.id
         )
+        .first()
+    )
+
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+    return run
+
+
+@router.get("/runs")
+def list_processing_runs(
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    runs = (
+        db.query(ProcessingRun)
+        .filter(ProcessingRun.user_id == current_user.id)
+        .order_by(ProcessingRun.created_at.desc(), ProcessingRun.id.desc())
+        .limit(limit)
         .all()
     )
 
-    summarized_count = 0
+    return [run_progress(db, run) for run in runs]
 
-    for email in emails:
-        result = summarize_email(email.body)
 
-        email.ai_summary = result["summary"]
-        email.model_version = result["model_version"]
+@router.get("/runs/{run_id}")
+def get_processing_run(
+    run_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    return run_progress(db, _get_run(db, current_user, run_id))
 
-        summarized_count += 1
 
-    db.commit()
+@router.post("/runs/{run_id}/resume")
+def resume_processing_run(
+    run_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    run = _get_run(db, current_user, run_id)
+
+    if not can_resume(run):
+        raise HTTPException(status_code=409, detail=f"Run is {run.status}")
+
+    google_account = _google_account(db, current_user)
+
+    if google_account is None:
+        raise HTTPException(status_code=400, detail="Google account not connected")
+
+    run = resume_run(db, run, google_account.id)
+
+    return run_progress(db, run)
+
 
-    return {
-        "summarized": summarized_count
-    }
 @router.get("/digest")
-def get_email_digest(
+async def get_email_digest(
     range: str = Query("7d", description="Time range: 7d, 15d, 30d"),
+    stream: bool = Query(False, description="Stream the digest as Server-Sent Events"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
+    try:
+        window_start = digest_window_start(range)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     # Check cached digest
-    existing = (
-        db.query(EmailDigest)
-        .filter(EmailDigest.range == range)
-        .order_by(EmailDigest.created_at.desc())
-        .first()
-    )
+    existing = await asyncio.to_thread(get_cached_digest, db, user_id=current_user.id, range_str=range)
 
     if existing:
-        return {
+        cached = {
             "range": range,
             "digest": existing.content,
             "cached": True
         }
 
-    cutoff_time = get_time_cutoff(range)
-
-    emails = (
-        db.query(Email)
-        .filter(Email.received_at >= cutoff_time)
-        .all()
-    )
-
-    summaries = [e.ai_summary for e in emails if e.ai_summary]
-    categories = [e.ai_email_type for e in emails if e.ai_summary]
-
-    result = generate_digest(summaries, categories)
+        if stream:
+            return StreamingResponse(
+                iter([sse_event("done", cached)]),
+                media_type="text/event-stream"
+            )
+
+        return cached
+
+    if stream:
+        return StreamingResponse(
+            digest_event_stream(
+                stream_window_digest(current_user.id, window_start),
+                range_str=range,
+                user_id=current_user.id,
+                window_start=window_start
+            ),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
 
-    digest = EmailDigest(
-        range=range,
-        content=result["digest"],
-        model_version=result["model_version"]
+    result = await build_digest(
+        db,
+        user_id=current_user.id,
+        range_str=range,
+        window_start=window_start
     )
 
-    db.add(digest)
-    db.commit()
-
     return {
         "range": range,
         "digest": result["digest"],
         "cached": False
     }
 
+@router.get("/ai-cache")
+def get_ai_cache_stats(
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    return cache_stats()
+
+
+@router.get("/classifier/stats")
+def get_local_classifier_stats(
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    return local_classifier_stats()
+
+
+@router.get("/preprocess/stats")
+def get_preprocess_stats(
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    return preprocess_stats()
+
+
 @router.get("/review")
 def get_emails_needing_review(
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: str | None = Query(None, description="Comma separated columns to return"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    emails = (
-        db.query(Email)
-        .filter(Email.needs_review.is_(True))
-        .order_by(Email.received_at.desc())
-        .all()
-    )
-
-    return emails
+    try:
+        return list_emails_page(
+            db,
+            REVIEW_FILTER,
+            user_id=current_user.id,
+            cursor=cursor,
+            limit=limit,
+            fields=fields
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/override/{email_id}")
 def override_email_classification(
     email_id: int,
     new_type: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     if new_type not in {"newsletter", "support", "marketing"}:
         raise HTTPException(status_code=400, detail="Invalid email type")
 
-    email = db.query(Email).filter(Email.id == email_id).first()
+    email = user_emails(db, current_user.id, Email.id == email_id).first()
 
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
@@ -227,6 +412,7 @@ def override_email_classification(
     email.needs_review = False
     email.ai_reason = "Manually overridden by user"
 
+    invalidate_for_emails(db, [email])
     db.commit()
 
     return {
@@ -16,13 +16,10 @@ from app.core.google_oauth import (
 from app.core.security import create_access_token
 from app.database import SessionLocal
 from app.models.user import User
+from app.tracing import span
 from app.models.google_account import GoogleAccount
 
-
-from app.core.gmail_client import list_messages, get_message
-from app.core.gmail_parser import parse_message
-from app.core.email_dedup import email_exists
-from app.core.email_service import create_email
+from app.core.job_queue import enqueue_job
 
 router = APIRouter(prefix="/auth/google", tags=["google-auth"])
 
@@ -47,17 +44,18 @@ def google_callback(code: str):
     db = SessionLocal()
     try:
    
-        token_response = requests.post(
-            GOOGLE_TOKEN_URL,
-            data={
-                "client_id": GOOGLE_CLIENT_ID,
-                "client_secret": GOOGLE_CLIENT_SECRET,
-                "code": code,
-                "grant_type": "authorization_code",
-                "redirect_uri": GOOGLE_REDIRECT_URI,
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-        )
+        with span("google_oauth", step="token"):
+            token_response = requests.post(
+                GOOGLE_TOKEN_URL,
+                data={
+                    "client_id": GOOGLE_CLIENT_ID,
+                    "client_secret": GOOGLE_CLIENT_SECRET,
+                    "code": code,
+                    "grant_type": "authorization_code",
+                    "redirect_uri": GOOGLE_REDIRECT_URI,
+                },
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
 
         if token_response.status_code != 200:
             raise HTTPException(
@@ -69,10 +67,11 @@ def google_callback(code: str):
         access_token = tokens["access_token"]
 
 
-        userinfo_response = requests.get(
-            GOOGLE_USERINFO_URL,
-            headers={"Authorization": f"Bearer {access_token}"},
-        )
+        with span("google_oauth", step="userinfo"):
+            userinfo_response = requests.get(
+                GOOGLE_USERINFO_URL,
+                headers={"Authorization": f"Bearer {access_token}"},
+            )
 
         if userinfo_response.status_code != 200:
             raise HTTPException(
@@ -109,39 +108,22 @@ def google_callback(code: str):
             db.add(google_account)
             db.commit()
 
-        messages = list_messages(access_token, max_results=50)
-
-        for msg in messages:
-            raw_message = get_message(access_token, msg["id"])
-            parsed = parse_message(raw_message)
-
-            gmail_message_id = parsed.get("gmail_message_id")
-            if not gmail_message_id:
-                continue
-
-
-            if email_exists(
-                db,
-                gmail_message_id=gmail_message_id,
-                user_id=user.id,
-            ):
-                continue
-
- 
-            create_email(
-                db=db,
-                user_id=user.id,
-                gmail_message_id=gmail_message_id,
-                sender=parsed["sender"],
-                body=parsed["body"],
-                received_at=parsed["received_at"],
-            )
+        google_account.access_token = access_token
+        db.commit()
 
+        # Ingestion runs in the background worker (python -m app.worker);
+        # the dashboard polls /gmail/jobs/{job_id} for progress.
+        job = enqueue_job(
+            db,
+            user_id=user.id,
+            google_account_id=google_account.id,
+            kind="sync",
+        )
 
         jwt_token = create_access_token({"sub": user.email})
 
         frontend_url = "http://localhost:3000/auth/callback"
-        params = urlencode({"token": jwt_token})
+        params = urlencode({"token": jwt_token, "job_id": job.id})
 
         return RedirectResponse(
             url=f"{frontend_url}?{params}",
@@ -1,13 +1,17 @@
 from fastapi import APIRouter, Depends
-from app.dependencies.auth import get_current_user
-from app.models.user import User
+from app.dependencies.auth import get_current_user, UserPrincipal, user_cache_stats
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/me")
-def read_current_user(current_user: User = Depends(get_current_user)):
+def read_current_user(current_user: UserPrincipal = Depends(get_current_user)):
     return {
         "id": current_user.id,
         "email": current_user.email
     }
+
+
+@router.get("/cache/stats")
+def read_user_cache_stats(current_user: UserPrincipal = Depends(get_current_user)):
+    return user_cache_stats()
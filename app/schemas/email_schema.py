@@ -9,6 +9,7 @@ class EmailResponse(BaseModel):
 
     email_type: str
     ai_email_type: Optional[str]
+    ai_summary: Optional[str]
     confidence_score: Optional[float]
     ai_reason: Optional[str]
     model_version: Optional[str]
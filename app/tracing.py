@@ -0,0 +1,304 @@
+import asyncio
+import contextvars
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app.logger import log_event
+from app.metrics import statement_operation
+
+# Log every finished span, not just the per-request summary.
+TRACE_LOG_SPANS = os.getenv("TRACE_LOG_SPANS", "false").lower() == "true"
+
+# Statements slower than this are logged with their SQL, in or out of a request.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+# Fraction of requests run under the sampling profiler (0 disables it).
+# Collapsed stacks are written to TRACE_PROFILE_DIR/<request_id>.folded,
+# ready for flamegraph.pl or speedscope. Only threads inside one of the
+# trace's spans (and a job's own thread) are sampled. The event loop
+# thread is shared by every in-flight request, so it is never sampled;
+# to profile async code on it, run a worker that serves one request at a
+# time (e.g. uvicorn --limit-concurrency 1) and a sync wrapper around it.
+TRACE_PROFILE_SAMPLE_RATE = float(os.getenv("TRACE_PROFILE_SAMPLE_RATE", "0"))
+TRACE_PROFILE_INTERVAL_MS = float(os.getenv("TRACE_PROFILE_INTERVAL_MS", "5"))
+TRACE_PROFILE_DIR = os.getenv("TRACE_PROFILE_DIR", "profiles")
+
+_trace: contextvars.ContextVar[dict | None] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar[int | None] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_request_id() -> str | None:
+    trace = _trace.get()
+    return trace["request_id"] if trace else None
+
+
+def start_span(name: str, **attrs) -> dict | None:
+    """
+    Open a span under the current one without making it current; pair
+    with end_span. Returns None outside a trace.
+    """
+    trace = _trace.get()
+    if trace is None:
+        return None
+
+    return {
+        "trace": trace,
+        "id": next(trace["ids"]),
+        "parent": _current_span.get(),
+        "name": name,
+        "attrs": attrs,
+        "thread": _enter_thread(trace),
+        "start": time.perf_counter(),
+    }
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _enter_thread(trace: dict) -> int | None:
+    """
+    Mark this thread as working for the trace until _leave_thread. The
+    event loop thread is skipped: other requests run on it meanwhile.
+    """
+    if _in_event_loop():
+        return None
+
+    ident = threading.get_ident()
+    with trace["lock"]:
+        trace["threads"][ident] += 1
+    return ident
+
+
+def _leave_thread(trace: dict, ident: int | None) -> None:
+    if ident is None:
+        return
+
+    with trace["lock"]:
+        trace["threads"][ident] -= 1
+        if trace["threads"][ident] <= 0:
+            del trace["threads"][ident]
+
+
+def end_span(span: dict | None, error: Exception | None = None) -> None:
+    if span is None:
+        return
+
+    trace = span["trace"]
+    span["duration_ms"] = (time.perf_counter() - span.pop("start")) * 1000
+    _leave_thread(trace, span["thread"])
+    if error is not None:
+        span["error"] = type(error).__name__
+
+    totals = trace["totals"].setdefault(span["name"], {"count": 0, "ms": 0.0})
+    totals["count"] += 1
+    totals["ms"] += span["duration_ms"]
+
+    if TRACE_LOG_SPANS:
+        log_event(
+            "span",
+            request_id=trace["request_id"],
+            span_id=span["id"],
+            parent_id=span["parent"],
+            name=span["name"],
+            duration_ms=round(span["duration_ms"], 2),
+            error=span.get("error"),
+            **span["attrs"],
+        )
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Record the enclosed block as a span; spans opened inside it (in this
+    task or thread) become its children.
+    """
+    current = start_span(name, **attrs)
+    if current is None:
+        yield
+        return
+
+    token = _current_span.set(current["id"])
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        end_span(current, error)
+        _current_span.reset(token)
+
+
+def in_current_trace(func):
+    """
+    Wrap func so calls on other threads (e.g. executor.map) record their
+    spans under the caller's current span.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+class _Sampler(threading.Thread):
+    """
+    Samples the stacks of the threads currently working for a trace,
+    counting each collapsed stack.
+    """
+
+    def __init__(self, trace: dict):
+        super().__init__(daemon=True)
+        self.trace = trace
+        self.stacks = Counter()
+        self.done = threading.Event()
+
+    def run(self):
+        interval = TRACE_PROFILE_INTERVAL_MS / 1000
+        while not self.done.wait(interval):
+            with self.trace["lock"]:
+                threads = list(self.trace["threads"])
+            frames = sys._current_frames()
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_collapse(frame)] += 1
+
+    def stop(self) -> str | None:
+        self.done.set()
+        self.join()
+        if not self.stacks:
+            return None
+
+        os.makedirs(TRACE_PROFILE_DIR, exist_ok=True)
+        path = os.path.join(TRACE_PROFILE_DIR, f"{self.trace['request_id']}.folded")
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def open_trace(name: str, request_id: str | None = None, **attrs) -> dict:
+    """
+    Start a trace (an HTTP request or a background job) in the current
+    context and return it. It stays open until close_trace, which may run
+    after the block that opened it, e.g. once a streamed body is sent.
+    """
+    current = {
+        "name": name,
+        "request_id": request_id or uuid.uuid4().hex,
+        "ids": itertools.count(1),
+        "threads": Counter(),
+        "lock": threading.Lock(),
+        "totals": {},
+        "attrs": attrs,
+        "start": time.perf_counter(),
+        "sampler": None,
+    }
+    _trace.set(current)
+    current["root_thread"] = _enter_thread(current)
+
+    if TRACE_PROFILE_SAMPLE_RATE > 0 and random.random() < TRACE_PROFILE_SAMPLE_RATE:
+        current["sampler"] = _Sampler(current)
+        current["sampler"].start()
+
+    return current
+
+
+def close_trace(current: dict, error: BaseException | None = None) -> None:
+    """
+    Finish a trace: stop its profiler and log the summary of time per
+    span name.
+    """
+    sampler = current["sampler"]
+    profile = sampler.stop() if sampler else None
+    _leave_thread(current, current["root_thread"])
+
+    log_event(
+        current["name"],
+        request_id=current["request_id"],
+        duration_ms=round((time.perf_counter() - current["start"]) * 1000, 2),
+        error=type(error).__name__ if error is not None else None,
+        spans={
+            span_name: {"count": totals["count"], "ms": round(totals["ms"], 2)}
+            for span_name, totals in current["totals"].items()
+        },
+        profile=profile,
+        **current["attrs"],
+    )
+
+
+@contextmanager
+def trace(name: str, request_id: str | None = None, **attrs):
+    """
+    Run the block as one trace. Yields the trace dict; its request_id is
+    logged with every span and a summary of time per span name is logged
+    when the block ends.
+    """
+    previous = _trace.get()
+    current = open_trace(name, request_id, **attrs)
+
+    error = None
+    try:
+        yield current
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _trace.set(previous)
+        close_trace(current, error)
+
+
+def trace_engine(engine) -> None:
+    """
+    Record a "db" span per statement on a (sync) engine and log statements
+    slower than SLOW_QUERY_MS.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("trace_spans", []).append(
+            (time.perf_counter(), start_span("db", operation=statement_operation(statement)))
+        )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started, current = conn.info["trace_spans"].pop()
+        end_span(current)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= SLOW_QUERY_MS:
+            log_event(
+                "slow_query",
+                level="warning",
+                request_id=current_request_id(),
+                duration_ms=round(elapsed_ms, 2),
+                statement=" ".join(statement.split())[:500],
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        pending = context.connection.info.get("trace_spans") if context.connection else None
+        if pending:
+            _, current = pending.pop()
+            end_span(current, context.original_exception)
@@ -0,0 +1,13 @@
+from itertools import islice
+
+
+def chunked(iterable, size: int):
+    """
+    Yield lists of at most `size` items, consuming the iterable lazily.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
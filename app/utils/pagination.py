@@ -0,0 +1,73 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    raw = json.dumps([sort_value.isoformat(), row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Inverse of encode_cursor. Raises ValueError for malformed cursors.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def parse_fields(fields: str | None, allowed: set, default: list) -> list:
+    """
+    Parse a comma separated `fields=` projection. Raises ValueError for
+    fields outside `allowed`.
+    """
+    if not fields:
+        return list(default)
+
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = sorted(set(requested) - allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    return list(dict.fromkeys(requested))
+
+
+def keyset_page(query, *, sort_column, id_column, cursor: str | None, limit: int):
+    """
+    One page of `query`, newest first, ordered by (sort_column, id_column).
+
+    Rows after the cursor are found with a row-value comparison, so the
+    cost of a page does not depend on how deep into the results it is.
+    The query must select both ordering columns. Returns
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        query = query.filter(
+            tuple_(sort_column, id_column) < tuple_(*decode_cursor(cursor))
+        )
+
+    rows = (
+        query
+        .order_by(sort_column.desc(), id_column.desc())
+        .limit(limit + 1)
+        .all()
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            getattr(last, sort_column.key),
+            getattr(last, id_column.key),
+        )
+
+    return rows, next_cursor
@@ -0,0 +1,40 @@
+import os
+import socket
+import time
+
+from app.database import SessionLocal, engine, Base
+from app.core.job_queue import process_next_job
+from app.logger import logger
+
+# Seconds to sleep when the queue is empty.
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+
+def run_worker(worker_id: str | None = None) -> None:
+    """
+    Poll the ingestion_jobs table and run jobs until interrupted.
+    Run with: python -m app.worker
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    logger.info("Ingestion worker %s started", worker_id)
+
+    while True:
+        db = SessionLocal()
+        try:
+            job = process_next_job(db, worker_id=worker_id)
+        except Exception:
+            logger.exception("Ingestion worker %s failed to process a job", worker_id)
+            job = None
+        finally:
+            db.close()
+
+        if job is None:
+            time.sleep(JOB_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    try:
+        run_worker()
+    except KeyboardInterrupt:
+        logger.info("Ingestion worker stopped")
@@ -0,0 +1,155 @@
+"""
+Login throughput and latency of other endpoints during a login storm.
+
+    python -m benchmarks.auth_login_storm [--logins 200] [--concurrency 32] [--workers 2]
+
+Starts the API twice, each on a throwaway SQLite database: "no pool" sets
+PASSWORD_HASH_WORKERS=0, so bcrypt runs on the event loop's default
+thread pool inside the API process, and "process pool" runs --workers
+hashing processes. While --concurrency clients log in repeatedly, a probe
+polls GET /db/pool, a sync endpoint served from the request thread pool.
+Any failed login or probe request fails the run.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+EMAIL = "storm@example.com"
+PASSWORD = "correct horse battery staple"
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGS = {
+    "no pool": 0,
+    "process pool": None,  # --workers
+}
+
+
+def _wait_ready(base_url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{base_url}/db/pool", timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError("API did not start")
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def _storm(base_url: str, token: str, logins: int, concurrency: int) -> dict:
+    login_timings = []
+    probe_timings = []
+    probe_errors = []
+    done = threading.Event()
+
+    def login(_):
+        start = time.perf_counter()
+        response = requests.post(
+            f"{base_url}/auth/login",
+            json={"email": EMAIL, "password": PASSWORD},
+        )
+        response.raise_for_status()
+        login_timings.append(time.perf_counter() - start)
+
+    def probe():
+        try:
+            while not done.is_set():
+                start = time.perf_counter()
+                response = requests.get(f"{base_url}/db/pool", headers={"Authorization": f"Bearer {token}"})
+                response.raise_for_status()
+                probe_timings.append(time.perf_counter() - start)
+                time.sleep(0.01)
+        except Exception as e:
+            # Re-raised by the main thread; timings without it would lie
+            probe_errors.append(e)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(login, range(logins)))
+    finally:
+        done.set()
+        prober.join()
+    elapsed = time.perf_counter() - start
+
+    if probe_errors:
+        raise RuntimeError("probe request failed") from probe_errors[0]
+    if not probe_timings:
+        raise RuntimeError("probe made no requests")
+
+    return {
+        "logins_per_second": logins / elapsed,
+        "login_p50_ms": _percentile(login_timings, 0.5) * 1000,
+        "login_p99_ms": _percentile(login_timings, 0.99) * 1000,
+        "probe_p50_ms": _percentile(probe_timings, 0.5) * 1000,
+        "probe_p99_ms": _percentile(probe_timings, 0.99) * 1000,
+    }
+
+
+def _run(tmp: str, name: str, workers: int, port: int, args) -> dict:
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(tmp, name.replace(' ', '_'))}.db",
+        PASSWORD_HASH_WORKERS=str(workers),
+        BCRYPT_ROUNDS=str(args.rounds),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_ready(base_url)
+        response = requests.post(
+            f"{base_url}/auth/signup",
+            json={"email": EMAIL, "password": PASSWORD},
+        )
+        response.raise_for_status()
+        return _storm(base_url, response.json()["access_token"], args.logins, args.concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            name: _run(tmp, name, args.workers if workers is None else workers, args.port + offset, args)
+            for offset, (name, workers) in enumerate(CONFIGS.items())
+        }
+
+    print(
+        f"{args.logins} logins, {args.concurrency} concurrent clients, "
+        f"bcrypt rounds {args.rounds}, {args.workers} hashing processes"
+    )
+    print(f"{'':22}" + "".join(f"{name:>14}" for name in results))
+    for key in results["no pool"]:
+        print(f"{key:22}" + "".join(f"{result[key]:>14.1f}" for result in results.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Storage size and list-query latency with inline vs compressed bodies.
+
+    python -m benchmarks.email_body_storage [--emails 5000] [--runs 200]
+
+Builds two throwaway SQLite databases with the same synthetic mailbox:
+"inline" keeps the raw body in emails (the old layout) and "compressed"
+uses the current models, with bodies in email_bodies.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine
+
+from app.database import Base
+from app.models.email_body import encode_body
+
+LIST_QUERY = (
+    "SELECT id, email, email_type, ai_summary, received_at FROM emails "
+    "WHERE user_id = 1 ORDER BY received_at DESC, id DESC LIMIT 50"
+)
+
+WORDS = (
+    "invoice order shipping account update newsletter weekly offer sale "
+    "support ticket password reset meeting schedule report release notes"
+).split()
+
+
+def _body(rng: random.Random) -> str:
+    paragraphs = [
+        "<p>" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))) + "</p>"
+        for _ in range(rng.randint(3, 12))
+    ]
+    footer = "<div>Unsubscribe | Privacy policy | You received this email because...</div>"
+    return "<html><body>" + "".join(paragraphs) + footer + "</body></html>"
+
+
+def _rows(count: int):
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1)
+    for index in range(count):
+        yield (
+            index + 1,
+            1 + index % 3,
+            f"m{index}",
+            "sender@example.com",
+            _body(rng),
+            "newsletter",
+            "Short neutral summary of the email.",
+            (start + timedelta(minutes=index)).isoformat(sep=" "),
+        )
+
+
+def _build_inline(path: str, count: int) -> None:
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE emails (id INTEGER PRIMARY KEY, user_id INTEGER, "
+        "gmail_message_id TEXT, email TEXT, body TEXT, email_type TEXT, "
+        "ai_summary TEXT, received_at TIMESTAMP)"
+    )
+    db.execute("CREATE INDEX ix_emails_user_received ON emails (user_id, received_at, id)")
+    db.executemany("INSERT INTO emails VALUES (?, ?, ?, ?, ?, ?, ?, ?)", _rows(count))
+    db.commit()
+    db.execute("VACUUM")
+    db.close()
+
+
+def _build_compressed(path: str, count: int) -> None:
+    Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+
+    db = sqlite3.connect(path)
+    for email_id, user_id, message_id, sender, body, email_type, summary, received_at in _rows(count):
+        db.execute(
+            "INSERT INTO emails (id, user_id, gmail_message_id, email, email_type, "
+            "ai_summary, received_at, is_ai_generated, needs_review, is_active, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 1, 0, 1, ?)",
+            (email_id, user_id, message_id, sender, email_type, summary, received_at, received_at),
+        )
+        encoded = encode_body(body)
+        db.execute(
+            "INSERT INTO email_bodies (email_id, codec, raw_size, data) VALUES (?, ?, ?, ?)",
+            (email_id, encoded["codec"], encoded["raw_size"], encoded["data"]),
+        )
+    db.commit()
+    db.execute("VACUUM")
+    db.close()
+
+
+def _table_bytes(db: sqlite3.Connection, table: str) -> int | None:
+    try:
+        return db.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = ?", (table,)
+        ).fetchone()[0]
+    except sqlite3.OperationalError:
+        # SQLite built without dbstat
+        return None
+
+
+def _measure(path: str, runs: int) -> dict:
+    db = sqlite3.connect(path)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        db.execute(LIST_QUERY).fetchall()
+        timings.append(time.perf_counter() - start)
+
+    scan_start = time.perf_counter()
+    db.execute("SELECT COUNT(*), SUM(LENGTH(email)) FROM emails").fetchone()
+    scan = time.perf_counter() - scan_start
+
+    stats = {
+        "file_bytes": os.path.getsize(path),
+        "emails_table_bytes": _table_bytes(db, "emails"),
+        "list_p50_ms": sorted(timings)[len(timings) // 2] * 1000,
+        "list_p95_ms": sorted(timings)[int(len(timings) * 0.95)] * 1000,
+        "emails_scan_ms": scan * 1000,
+    }
+    db.close()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--emails", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inline_path = os.path.join(tmp, "inline.db")
+        compressed_path = os.path.join(tmp, "compressed.db")
+
+        _build_inline(inline_path, args.emails)
+        _build_compressed(compressed_path, args.emails)
+
+        results = {
+            "inline": _measure(inline_path, args.runs),
+            "compressed": _measure(compressed_path, args.runs),
+        }
+
+    print(f"{args.emails} emails, {args.runs} list queries each")
+    print(f"{'':22}{'inline':>14}{'compressed':>14}")
+    for key in results["inline"]:
+        before, after = results["inline"][key], results["compressed"][key]
+        if before is None or after is None:
+            continue
+        fmt = "{:>14,.0f}" if key.endswith("bytes") else "{:>14.3f}"
+        print(f"{key:22}" + fmt.format(before) + fmt.format(after))
+
+
+if __name__ == "__main__":
+    main()
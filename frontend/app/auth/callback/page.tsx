@@ -2,7 +2,7 @@
 
 import { useEffect } from "react"
 import { useSearchParams,useRouter } from "next/navigation"
-import { setToken } from "@/app/utils/auth"
+import { setToken, INGEST_JOB_KEY } from "@/app/utils/auth"
 
 export default function AuthCallBackPage(){
     const searchParams=useSearchParams()
@@ -13,6 +13,10 @@ useEffect(()=>{
     const token =searchParams.get("token")
     if(token){
         setToken(token)
+        const jobId=searchParams.get("job_id")
+        if(jobId){
+            localStorage.setItem(INGEST_JOB_KEY,jobId)
+        }
         router.push("/dashboard")
     }
         else{
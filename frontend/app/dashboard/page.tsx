@@ -2,30 +2,69 @@
 
 import { useEffect, useState } from "react";
 import { useRouter } from "next/navigation";
-import { isLoggedIn, clearToken, getAuthHeader } from "@/app/utils/auth";
+import { isLoggedIn, clearToken, getAuthHeader, INGEST_JOB_KEY } from "@/app/utils/auth";
 
 
 type Email = {
   id: number;
   email: string;              // sender
-  body: string;               // raw email body (HTML)
   email_type: string;         // marketing | support | newsletter
+  ai_summary: string | null;  // body is only served by /emails/{id}
   confidence_score: number;
   needs_review: boolean;
-  created_at: string;
+  received_at: string;
+};
+
+type EmailPage = {
+  items: Email[];
+  next_cursor: string | null;
 };
 
 
-const stripHtml = (html: string) =>
-  html.replace(/<[^>]*>?/gm, "");
+const emailsUrl = (cursor: string | null) =>
+  "http://localhost:8000/emails?limit=50" +
+  (cursor ? `&cursor=${encodeURIComponent(cursor)}` : "");
 
 
 export default function DashboardPage() {
   const router = useRouter();
 
   const [emails, setEmails] = useState<Email[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState("");
+  const [syncing, setSyncing] = useState(false);
+  const [reloadKey, setReloadKey] = useState(0);
+
+
+  // Poll the background ingestion job started by the Google login
+  useEffect(() => {
+    const jobId = localStorage.getItem(INGEST_JOB_KEY);
+    if (!jobId) return;
+
+    setSyncing(true);
+
+    const timer = setInterval(() => {
+      fetch(`http://localhost:8000/gmail/jobs/${jobId}`, {
+        headers: {
+          ...getAuthHeader(),
+        },
+      })
+        .then((res) => (res.ok ? res.json() : { status: "failed" }))
+        .then((job: { status: string }) => {
+          if (job.status === "succeeded" || job.status === "failed") {
+            clearInterval(timer);
+            localStorage.removeItem(INGEST_JOB_KEY);
+            setSyncing(false);
+            setReloadKey((key) => key + 1);
+          }
+        })
+        .catch(() => {});
+    }, 2000);
+
+    return () => clearInterval(timer);
+  }, []);
 
 
   useEffect(() => {
@@ -34,7 +73,7 @@ export default function DashboardPage() {
       return;
     }
 
-    fetch("http://localhost:8000/emails", {
+    fetch(emailsUrl(null), {
       headers: {
         ...getAuthHeader(),
       },
@@ -43,8 +82,9 @@ export default function DashboardPage() {
         if (!res.ok) throw new Error("Failed to fetch emails");
         return res.json();
       })
-      .then((data: Email[]) => {
-        setEmails(data);
+      .then((data: EmailPage) => {
+        setEmails(data.items);
+        setNextCursor(data.next_cursor);
       })
       .catch(() => {
         setError("Could not load emails");
@@ -52,7 +92,34 @@ export default function DashboardPage() {
       .finally(() => {
         setLoading(false);
       });
-  }, [router]);
+  }, [router, reloadKey]);
+
+
+  const loadMore = () => {
+    if (!nextCursor) return;
+
+    setLoadingMore(true);
+
+    fetch(emailsUrl(nextCursor), {
+      headers: {
+        ...getAuthHeader(),
+      },
+    })
+      .then((res) => {
+        if (!res.ok) throw new Error("Failed to fetch emails");
+        return res.json();
+      })
+      .then((data: EmailPage) => {
+        setEmails((current) => [...current, ...data.items]);
+        setNextCursor(data.next_cursor);
+      })
+      .catch(() => {
+        setError("Could not load emails");
+      })
+      .finally(() => {
+        setLoadingMore(false);
+      });
+  };
 
  
   const logout = () => {
@@ -73,8 +140,12 @@ export default function DashboardPage() {
         <button onClick={logout}>Logout</button>
       </div>
 
+      {syncing && (
+        <p>Syncing your inbox…</p>
+      )}
+
       {/* Empty State */}
-      {emails.length === 0 && (
+      {emails.length === 0 && !syncing && (
         <p>No emails ingested yet.</p>
       )}
 
@@ -94,7 +165,7 @@ export default function DashboardPage() {
 
             {/* Preview */}
             <p style={{ margin: "8px 0" }}>
-              {stripHtml(email.body).slice(0, 150)}…
+              {email.ai_summary ?? "No summary yet."}
             </p>
 
             {/* Meta */}
@@ -113,6 +184,12 @@ export default function DashboardPage() {
           </li>
         ))}
       </ul>
+
+      {nextCursor && (
+        <button onClick={loadMore} disabled={loadingMore}>
+          {loadingMore ? "Loading…" : "Load more"}
+        </button>
+      )}
     </div>
   );
 }
@@ -1,4 +1,5 @@
 export const TOKEN_KEY="auth_token"
+export const INGEST_JOB_KEY="ingest_job_id"
 
 export function setToken(token:string){
     localStorage.setItem(TOKEN_KEY,token)
@@ -0,0 +1,4 @@
+-- Incremental Gmail sync state on google_accounts.
+ALTER TABLE google_accounts ADD COLUMN IF NOT EXISTS access_token TEXT;
+ALTER TABLE google_accounts ADD COLUMN IF NOT EXISTS history_id VARCHAR;
+ALTER TABLE google_accounts ADD COLUMN IF NOT EXISTS last_synced_at TIMESTAMP;
@@ -0,0 +1,21 @@
+-- Per-user digest cache built from daily partial digests.
+ALTER TABLE email_digests ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id);
+ALTER TABLE email_digests ADD COLUMN IF NOT EXISTS window_start TIMESTAMP;
+
+-- Rows from the old shared cache belong to no user and are never served.
+DELETE FROM email_digests WHERE user_id IS NULL;
+
+CREATE INDEX IF NOT EXISTS ix_email_digests_user_id ON email_digests (user_id);
+CREATE INDEX IF NOT EXISTS ix_email_digests_user_range ON email_digests (user_id, range, created_at);
+
+CREATE TABLE IF NOT EXISTS daily_digests (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    day DATE NOT NULL,
+    content TEXT NOT NULL,
+    email_count INTEGER NOT NULL,
+    model_version VARCHAR NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    CONSTRAINT uq_daily_digests_user_day UNIQUE (user_id, day)
+);
+CREATE INDEX IF NOT EXISTS ix_daily_digests_user_id ON daily_digests (user_id);
@@ -0,0 +1,16 @@
+-- User-scoped composite and partial indexes on emails.
+-- CONCURRENTLY cannot run inside a transaction block; apply with autocommit.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_emails_user_received
+    ON emails (user_id, received_at, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_emails_user_unclassified
+    ON emails (user_id, received_at)
+    WHERE ai_email_type IS NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_emails_user_unsummarized
+    ON emails (user_id, received_at)
+    WHERE ai_summary IS NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_emails_user_needs_review
+    ON emails (user_id, received_at, id)
+    WHERE needs_review = true;
@@ -0,0 +1,11 @@
+-- Compressed email bodies in a side table.
+-- After applying, run `python -m app.core.body_backfill`, then 0005.
+CREATE TABLE IF NOT EXISTS email_bodies (
+    email_id INTEGER PRIMARY KEY REFERENCES emails(id) ON DELETE CASCADE,
+    codec VARCHAR NOT NULL,
+    raw_size INTEGER NOT NULL,
+    data BYTEA NOT NULL
+);
+
+-- New rows no longer write the inline column.
+ALTER TABLE emails ALTER COLUMN body DROP NOT NULL;
@@ -0,0 +1,2 @@
+-- Run only after `python -m app.core.body_backfill` has finished.
+ALTER TABLE emails DROP COLUMN IF EXISTS body;
@@ -0,0 +1,21 @@
+-- Checkpointed classify/summarize/analyze runs.
+CREATE TABLE IF NOT EXISTS processing_runs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    kind VARCHAR NOT NULL,
+    range VARCHAR NOT NULL,
+    cutoff TIMESTAMP NOT NULL,
+    status VARCHAR NOT NULL DEFAULT 'running',
+    checkpoint_received_at TIMESTAMP,
+    checkpoint_id INTEGER,
+    total INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    active_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP NOT NULL DEFAULT now(),
+    finished_at TIMESTAMP,
+    CONSTRAINT processing_run_status_check CHECK (status IN ('running', 'succeeded', 'failed'))
+);
+CREATE INDEX IF NOT EXISTS ix_processing_runs_id ON processing_runs (id);
+CREATE INDEX IF NOT EXISTS ix_processing_runs_user_id ON processing_runs (user_id);
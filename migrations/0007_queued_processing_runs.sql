@@ -0,0 +1,6 @@
+-- Processing runs are queued for the job worker before they start.
+ALTER TABLE processing_runs DROP CONSTRAINT IF EXISTS processing_run_status_check;
+ALTER TABLE processing_runs
+    ADD CONSTRAINT processing_run_status_check
+    CHECK (status IN ('queued', 'running', 'succeeded', 'failed'));
+ALTER TABLE processing_runs ALTER COLUMN status SET DEFAULT 'queued';
@@ -0,0 +1,43 @@
+from app.ai.batching import estimate_tokens, pack_batches, run_batched
+
+
+def test_pack_batches_respects_item_and_token_limits():
+    texts = ["a" * 40, "b" * 40, "c" * 400, "d" * 40]
+
+    batches = pack_batches(texts, max_tokens=50, max_items=2)
+
+    assert batches == [[0, 1], [2], [3]]
+    assert estimate_tokens("") == 0
+
+
+def test_run_batched_retries_only_failed_items():
+    calls = []
+
+    def request_batch(batch):
+        calls.append(list(batch))
+        return [
+            None if text == "bad" and len(calls) == 1 else text.upper()
+            for text in batch
+        ]
+
+    results = run_batched(
+        ["one", "bad", "two"],
+        request_batch,
+        max_tokens=1000,
+        max_items=10,
+    )
+
+    assert results == ["ONE", "BAD", "TWO"]
+    assert calls == [["one", "bad", "two"], ["bad"]]
+
+
+def test_run_batched_gives_up_after_max_retries():
+    results = run_batched(
+        ["x", "y"],
+        lambda batch: [None] * len(batch),
+        max_tokens=1000,
+        max_items=10,
+        max_retries=1,
+    )
+
+    assert results == [None, None]
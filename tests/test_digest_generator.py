@@ -0,0 +1,49 @@
+from app.ai import digest_generator
+from app.ai.batching import estimate_tokens
+from app.ai.digest_generator import (
+    DIGEST_CONTEXT_TOKEN_BUDGET,
+    PARTIAL_ITEM_TOKEN_BUDGET,
+    PARTIAL_MIN_ITEM_TOKEN_BUDGET,
+)
+
+LONG = "word " * 2000
+
+
+def _context_tokens(inputs) -> int:
+    return estimate_tokens(digest_generator._context(*inputs))
+
+
+def test_final_inputs_keep_partials_that_fit():
+    partials = [("support, 2024-01-01", "- a bullet"), ("marketing, 2024-01-02", "- another")]
+
+    texts, labels, item_budget = digest_generator._final_inputs(partials)
+
+    assert texts == ["- a bullet", "- another"]
+    assert labels == ["support, 2024-01-01", "marketing, 2024-01-02"]
+    assert item_budget == PARTIAL_ITEM_TOKEN_BUDGET
+
+
+def test_final_inputs_truncate_partials_to_the_budget():
+    partials = [("newsletter", LONG) for _ in range(40)]
+
+    inputs = digest_generator._final_inputs(partials)
+
+    assert len(inputs[0]) == 40
+    assert PARTIAL_MIN_ITEM_TOKEN_BUDGET <= inputs[2] < PARTIAL_ITEM_TOKEN_BUDGET
+    assert _context_tokens(inputs) <= DIGEST_CONTEXT_TOKEN_BUDGET
+
+
+def test_final_inputs_leave_out_partials_that_cannot_fit():
+    # Labels alone exceed what a reduce pass could ever shrink
+    partials = [("x" * 2000, LONG) for _ in range(20)]
+
+    inputs = digest_generator._final_inputs(partials)
+
+    assert 0 < len(inputs[0]) < 20
+    assert inputs[2] == PARTIAL_MIN_ITEM_TOKEN_BUDGET
+    assert _context_tokens(inputs) <= DIGEST_CONTEXT_TOKEN_BUDGET
+
+
+def test_final_inputs_none_without_partials():
+    assert digest_generator._final_inputs([]) is None
+    assert digest_generator._final_inputs(None) is None
@@ -53,12 +53,14 @@ def test_duplicate_email():
 
 
 def test_update_email_unauthorized():
+    # /emails/{email_id} is read-only (GET); corrections go through
+    # /gmail/override/{email_id}, so a PATCH is rejected as not allowed
     response = client.patch(
         "/emails/1",
         json={"email_type": "support"}
     )
 
-    assert response.status_code == 401
+    assert response.status_code == 405
 
 
 def test_delete_email():
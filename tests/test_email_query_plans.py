@@ -0,0 +1,83 @@
+import os
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.email import Email
+from app.core import email_queries
+
+
+CUTOFF = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    # Most mail is already processed; the planner needs statistics to
+    # prefer the partial indexes, as it has on a real mailbox.
+    session.add_all(
+        Email(
+            user_id=1 + index % 4,
+            gmail_message_id=str(index),
+            email="sender@example.com",
+            body="body",
+            email_type="newsletter",
+            ai_email_type=None if index % 50 == 0 else "newsletter",
+            ai_summary=None if index % 40 == 0 else "summary",
+            needs_review=index % 30 == 0,
+            received_at=CUTOFF + timedelta(hours=index),
+        )
+        for index in range(400)
+    )
+    session.commit()
+    session.execute(text("ANALYZE"))
+
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _plan(db, query) -> str:
+    statement = query.statement.compile(
+        dialect=db.get_bind().dialect,
+        compile_kwargs={"literal_binds": True},
+    )
+    rows = db.execute(text(f"EXPLAIN QUERY PLAN {statement}")).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+QUERIES = {
+    "window": lambda db: email_queries.emails_since(db, user_id=1, cutoff=CUTOFF),
+    "unclassified": lambda db: email_queries.unclassified_emails(db, user_id=1, cutoff=CUTOFF),
+    "unsummarized": lambda db: email_queries.unsummarized_emails(db, user_id=1, cutoff=CUTOFF),
+    "unanalyzed": lambda db: email_queries.unanalyzed_emails(db, user_id=1, cutoff=CUTOFF),
+    "review": lambda db: email_queries.user_emails(db, 1, email_queries.REVIEW_FILTER)
+        .order_by(Email.received_at.desc(), Email.id.desc()),
+    "detail": lambda db: email_queries.user_emails(db, 1, Email.id == 5),
+}
+
+EXPECTED_INDEXES = {
+    "unclassified": ["ix_emails_user_unclassified"],
+    "unsummarized": ["ix_emails_user_unsummarized"],
+    # The OR is answered by combining both work-queue indexes
+    "unanalyzed": ["ix_emails_user_unclassified", "ix_emails_user_unsummarized"],
+    "review": ["ix_emails_user_needs_review"],
+}
+
+
+@pytest.mark.parametrize("name", sorted(QUERIES))
+def test_email_queries_use_an_index(db, name):
+    plan = _plan(db, QUERIES[name](db))
+
+    assert "SCAN emails" not in plan, plan
+    for index in EXPECTED_INDEXES.get(name, []):
+        assert index in plan, plan
@@ -0,0 +1,170 @@
+import json
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from app.core import gmail_client
+from app.core.gmail_client import AdaptiveConcurrency, UserQuota
+
+
+class Clock:
+    """
+    Fake monotonic clock; sleeping advances it instead of blocking.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        if len(self.sleeps) > 100:
+            raise AssertionError("waited forever")
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(gmail_client.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(gmail_client.time, "sleep", clock.sleep)
+    return clock
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body
+
+    def json(self):
+        if self._body is None:
+            raise json.JSONDecodeError("Expecting value", "", 0)
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise AssertionError(self.status_code)
+
+
+def _error(reason):
+    return {"error": {"errors": [{"reason": reason}]}}
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    earlier = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=30), usegmt=True)
+
+    assert gmail_client._retry_after(FakeResponse(429, headers={"Retry-After": "7"})) == 7.0
+    assert 28 <= gmail_client._retry_after(FakeResponse(429, headers={"Retry-After": later})) <= 30
+    assert gmail_client._retry_after(FakeResponse(429, headers={"Retry-After": earlier})) == 0.0
+    assert gmail_client._retry_after(FakeResponse(429, headers={"Retry-After": "soon"})) is None
+    assert gmail_client._retry_after(FakeResponse(429)) is None
+
+
+def test_retry_after_is_capped():
+    response = FakeResponse(429, headers={"Retry-After": "86400"})
+
+    assert gmail_client._retry_after(response) == gmail_client.GMAIL_RETRY_AFTER_MAX
+
+
+def test_is_throttled_only_for_rate_limit_reasons():
+    assert gmail_client._is_throttled(FakeResponse(429))
+    assert gmail_client._is_throttled(FakeResponse(403, _error("userRateLimitExceeded")))
+    assert gmail_client._is_throttled(FakeResponse(403, _error("rateLimitExceeded")))
+
+    assert not gmail_client._is_throttled(FakeResponse(403, _error("insufficientPermissions")))
+    assert not gmail_client._is_throttled(FakeResponse(403))
+    assert not gmail_client._is_throttled(FakeResponse(500, _error("rateLimitExceeded")))
+
+
+def test_concurrency_halves_once_per_cooldown(clock):
+    concurrency = AdaptiveConcurrency(8, cooldown=1.0)
+
+    concurrency.throttled()
+    concurrency.throttled()
+    assert int(concurrency.limit) == 4
+
+    clock.now += 1.0
+    concurrency.throttled()
+    assert int(concurrency.limit) == 2
+
+    clock.now += 1.0
+    concurrency.throttled()
+    concurrency.throttled()
+    clock.now += 1.0
+    concurrency.throttled()
+    assert concurrency.limit == concurrency.minimum
+
+
+def test_concurrency_grows_back_on_success(clock):
+    concurrency = AdaptiveConcurrency(8, cooldown=1.0)
+    concurrency.throttled()
+
+    # Roughly one step per `limit` successes: 4 + 5 + 6 + 7 back to 8
+    for _ in range(30):
+        concurrency.acquire()
+        concurrency.release(succeeded=True)
+
+    assert int(concurrency.limit) == 8
+    assert concurrency.in_flight == 0
+
+
+def test_quota_waits_for_units(clock):
+    quota = UserQuota(10)
+
+    quota.acquire(10)
+    assert clock.sleeps == []
+
+    quota.acquire(5)
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+
+def test_quota_call_larger_than_rate_waits_for_full_bucket(clock):
+    quota = UserQuota(2)
+
+    quota.acquire(5)
+    quota.acquire(5)
+
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+
+def test_quota_waits_out_pause(clock):
+    quota = UserQuota(10)
+
+    quota.pause(3)
+    quota.acquire(1)
+
+    assert sum(clock.sleeps) == pytest.approx(3.0)
+
+
+def test_throttled_request_pauses_quota_and_retries(clock, monkeypatch):
+    responses = [
+        FakeResponse(429, headers={"Retry-After": "2"}),
+        FakeResponse(200, {"id": "m1"}),
+    ]
+
+    class Session:
+        def get(self, url, **kwargs):
+            return responses.pop(0)
+
+    monkeypatch.setattr(gmail_client, "_session", Session())
+    monkeypatch.setattr(gmail_client, "_user_states", gmail_client.TTLCache(maxsize=10, ttl=60))
+
+    assert gmail_client.get_message("token", "m1", user_id=1) == {"id": "m1"}
+
+    state = gmail_client._user_state(1)
+    assert state.quota.paused_until == pytest.approx(1002.0)
+    assert int(state.concurrency.limit) == gmail_client.GMAIL_FETCH_CONCURRENCY // 2
+    assert clock.sleeps == [2.0]
+
+
+def test_state_is_shared_across_token_refreshes(monkeypatch):
+    monkeypatch.setattr(gmail_client, "_user_states", gmail_client.TTLCache(maxsize=10, ttl=60))
+
+    assert gmail_client.concurrency_for(1) is gmail_client.concurrency_for(1)
+    assert gmail_client.concurrency_for(1) is not gmail_client.concurrency_for(2)
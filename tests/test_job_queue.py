@@ -0,0 +1,91 @@
+import os
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.ingestion_job import IngestionJob
+from app.core import job_queue
+from app.core.job_queue import LeaseLostError
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _expire_lease(db, job):
+    job.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+
+def _queued(db):
+    return job_queue.enqueue_job(db, user_id=1, google_account_id=1, kind="backfill")
+
+
+def test_renew_lease_extends_the_owners_lease(db):
+    _queued(db)
+    job = job_queue.claim_next_job(db, worker_id="a")
+    first = job.lease_expires_at
+
+    assert job_queue.renew_lease(db, job.id, "a")
+    db.refresh(job)
+    assert job.lease_expires_at >= first
+
+    assert not job_queue.renew_lease(db, job.id, "b")
+
+
+def test_renewed_job_is_not_claimed_twice(db):
+    _queued(db)
+    job = job_queue.claim_next_job(db, worker_id="a")
+    _expire_lease(db, job)
+
+    job_queue.job_heartbeat(db, job)()
+
+    assert job_queue.claim_next_job(db, worker_id="b") is None
+
+
+def test_worker_that_lost_the_lease_stops_and_cannot_finish(db):
+    _queued(db)
+    job = job_queue.claim_next_job(db, worker_id="a")
+    heartbeat = job_queue.job_heartbeat(db, job)
+    _expire_lease(db, job)
+
+    taken = job_queue.claim_next_job(db, worker_id="b")
+    assert taken.id == job.id
+
+    with pytest.raises(LeaseLostError):
+        heartbeat()
+    assert not job_queue.complete_job(db, job, {"fetched": 1}, worker_id="a")
+    assert not job_queue.fail_job(db, job, "boom", worker_id="a")
+
+    db.refresh(taken)
+    assert taken.status == "running"
+    assert taken.lease_owner == "b"
+
+    assert job_queue.complete_job(db, taken, {"fetched": 2}, worker_id="b")
+    db.refresh(taken)
+    assert taken.status == "succeeded"
+    assert taken.lease_owner is None
+
+
+def test_failed_attempt_is_requeued_by_its_owner(db):
+    _queued(db)
+    job = job_queue.claim_next_job(db, worker_id="a")
+
+    assert job_queue.fail_job(db, job, "boom", worker_id="a")
+
+    db.refresh(job)
+    assert job.status == "queued"
+    assert job.last_error == "boom"
+    assert job.run_after > datetime.utcnow()
@@ -0,0 +1,63 @@
+import json
+import os
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.ai import local_classifier
+
+
+def test_rules_route_obvious_marketing_locally():
+    local_classifier.set_model(None)
+
+    result = local_classifier.predict("Flash sale: 40% off everything, shop now!")
+
+    assert result["email_type"] == "marketing"
+    assert result["confidence"] >= 0.9
+    assert result["model_version"] == local_classifier.RULES_MODEL_VERSION
+
+
+def test_no_signal_is_forwarded_to_llm():
+    local_classifier.set_model(None)
+
+    assert local_classifier.predict("Hi, see you at lunch tomorrow.") is None
+    assert local_classifier.classify_local("Hi, see you at lunch tomorrow.") is None
+
+
+def test_trained_model_learns_from_examples():
+    examples = [
+        ("our weekly roundup of engineering articles and release notes", "newsletter", 1),
+        ("monthly roundup articles from the community blog", "newsletter", 1),
+        ("my invoice is wrong and the dashboard shows an error", "support", 1),
+        ("the app shows an error when I upload my invoice", "support", 3),
+    ] * 5
+
+    model = local_classifier.train(examples)
+    local_classifier.set_model(model)
+
+    try:
+        result = local_classifier.predict("weekly roundup of articles")
+        assert result["email_type"] == "newsletter"
+        assert result["model_version"] == local_classifier.LINEAR_MODEL_VERSION
+
+        result = local_classifier.predict("upload error on my invoice")
+        assert result["email_type"] == "support"
+    finally:
+        local_classifier.set_model(None)
+
+
+def test_model_file_is_reloaded_when_it_changes(tmp_path, monkeypatch):
+    path = tmp_path / "model.json"
+    monkeypatch.setattr(local_classifier, "LOCAL_MODEL_PATH", str(path))
+    monkeypatch.setattr(local_classifier, "LOCAL_MODEL_CHECK_SECONDS", 0)
+    local_classifier.set_model(None)
+
+    model = local_classifier.train([
+        ("weekly roundup of engineering articles", "newsletter", 1),
+        ("the app shows an error on upload", "support", 1),
+    ] * 5)
+    path.write_text(json.dumps(model))
+
+    try:
+        local_classifier.classify_local("weekly roundup")
+        assert local_classifier.local_classifier_stats()["model_version"] == local_classifier.LINEAR_MODEL_VERSION
+    finally:
+        local_classifier.set_model(None)
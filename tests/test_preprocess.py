@@ -0,0 +1,99 @@
+from app.ai.preprocess import preprocess_body
+
+
+def test_strips_quoted_history_signature_and_footer():
+    body = "\n".join([
+        "Hi team,",
+        "The export job fails with a timeout: https://status.example.com/incidents/123?utm_source=x",
+        "",
+        "--",
+        "Jane Doe | Example Corp",
+        "On Mon, Jan 1, 2024 at 10:00 AM Bob <bob@example.com> wrote:",
+        "> earlier message",
+    ])
+
+    result = preprocess_body(body)
+
+    assert result["text"] == (
+        "Hi team,\n"
+        "The export job fails with a timeout: [link: status.example.com]"
+    )
+    assert result["tokens_saved"] > 0
+
+
+def test_html_and_boilerplate_are_removed():
+    body = (
+        "<html><style>p{color:red}</style><body><p>Big launch today&amp;more</p>"
+        "<p>Click here to unsubscribe</p></body></html>"
+    )
+
+    result = preprocess_body(body)
+
+    assert result["text"] == "Big launch today&more"
+
+
+def test_truncates_to_budget_keeping_head_and_tail():
+    body = "HEAD " + "filler words " * 2000 + " TAIL"
+
+    result = preprocess_body(body, token_budget=100)
+
+    assert result["truncated"] is True
+    assert result["text"].startswith("HEAD")
+    assert result["text"].endswith("TAIL")
+    assert result["final_tokens"] <= 101
+
+
+def test_forwarded_message_is_kept():
+    body = "\n".join([
+        "FYI, see below.",
+        "",
+        "---------- Forwarded message ---------",
+        "From: Billing <billing@example.com>",
+        "Date: Mon, Jan 1, 2024",
+        "Subject: Your invoice",
+        "",
+        "Your invoice #123 is overdue.",
+    ])
+
+    result = preprocess_body(body)
+
+    assert "Your invoice #123 is overdue." in result["text"]
+    assert "From: Billing" in result["text"]
+
+
+def test_mid_body_separator_is_not_a_signature():
+    body = "\n".join(
+        ["Release notes"]
+        + ["Intro paragraph."]
+        + ["__________"]
+        + [f"Change {index}: fixed something." for index in range(12)]
+    )
+
+    result = preprocess_body(body)
+
+    assert "Change 11: fixed something." in result["text"]
+
+
+def test_unsubscribe_complaint_is_kept():
+    body = "\n".join([
+        "Hello,",
+        "I can't unsubscribe from your mailing list, the link is broken.",
+        "Please remove me.",
+    ])
+
+    result = preprocess_body(body)
+
+    assert "I can't unsubscribe from your mailing list" in result["text"]
+
+
+def test_reply_header_without_quote_is_kept():
+    body = "\n".join([
+        "Minutes:",
+        "On Monday, the design team wrote:",
+        "- a migration plan",
+        "Next steps are below.",
+    ])
+
+    result = preprocess_body(body)
+
+    assert "Next steps are below." in result["text"]
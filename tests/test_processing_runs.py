@@ -0,0 +1,119 @@
+import os
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.email import Email
+from app.core import job_queue, processing_runs
+from app.core.job_queue import LeaseLostError
+from app.core.processing_runs import RunInProgressError
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    # A file database: process_run uses its sessions from worker threads
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'runs.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    # WAL lets the writer commit while the reader's cursor is open
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    # process_run reads through its own session
+    monkeypatch.setattr(processing_runs, "SessionLocal", Session)
+    session = Session()
+
+    now = datetime.utcnow()
+    session.add_all(
+        Email(
+            user_id=1,
+            gmail_message_id=str(index),
+            email="sender@example.com",
+            body="body",
+            email_type="newsletter",
+            received_at=now - timedelta(hours=index + 1),
+        )
+        for index in range(5)
+    )
+    session.commit()
+
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def handled(monkeypatch):
+    # Stand-in for the AI chunk handler: records chunks, writes nothing
+    chunks = []
+
+    async def handle(emails):
+        chunks.append([email.id for email in emails])
+        return []
+
+    work_queue, _ = processing_runs.RUN_KINDS["classify"]
+    monkeypatch.setitem(processing_runs.RUN_KINDS, "classify", (work_queue, handle))
+    monkeypatch.setattr(processing_runs, "PROCESSING_CHUNK_SIZE", 2)
+    return chunks
+
+
+def _queued_run(db):
+    return processing_runs.queue_run(
+        db, user_id=1, google_account_id=1, kind="classify", range_str="7d"
+    )
+
+
+def test_lease_is_renewed_per_chunk(db, handled):
+    run = _queued_run(db)
+    job = job_queue.claim_next_job(db, worker_id="a")
+    renewals = []
+
+    def heartbeat():
+        renewals.append(job_queue.renew_lease(db, job.id, "a"))
+
+    processing_runs.run_queued(db, run.id, heartbeat=heartbeat)
+
+    assert run.status == "succeeded"
+    assert len(handled) == 3
+    assert renewals == [True, True, True]
+
+
+def test_lost_lease_stops_the_run_without_failing_it(db, handled):
+    run = _queued_run(db)
+
+    def heartbeat():
+        raise LeaseLostError("taken over")
+
+    with pytest.raises(LeaseLostError):
+        processing_runs.run_queued(db, run.id, heartbeat=heartbeat)
+
+    db.refresh(run)
+    assert len(handled) == 1
+    assert run.status == "running"
+    assert run.processed == 2
+
+
+def test_run_with_recent_progress_is_not_started_again(db, handled):
+    run = _queued_run(db)
+    run.status = "running"
+    run.updated_at = datetime.utcnow()
+    db.commit()
+
+    with pytest.raises(RunInProgressError):
+        processing_runs.run_queued(db, run.id)
+    assert handled == []
+
+    run.updated_at = datetime.utcnow() - timedelta(seconds=processing_runs.PROCESSING_STALE_SECONDS + 1)
+    db.commit()
+
+    processing_runs.run_queued(db, run.id)
+    assert run.status == "succeeded"
+    assert len(handled) == 3
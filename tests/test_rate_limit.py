@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.ai import rate_limit
+from app.ai.rate_limit import SharedTokenBuckets, INTERACTIVE, BULK
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def buckets(tmp_path):
+    # 1 request and 10 tokens per second; full buckets hold 10 and 100
+    return SharedTokenBuckets(
+        str(tmp_path / "limits.json"),
+        requests_per_minute=60,
+        tokens_per_minute=600,
+        burst_seconds=10,
+        bulk_reserve=0.2,
+    )
+
+
+def test_buckets_refill_over_time(buckets, clock):
+    assert buckets.try_acquire(100, INTERACTIVE) == 0
+
+    assert buckets.try_acquire(10, INTERACTIVE) == pytest.approx(1.0)
+
+    clock.advance(1.0)
+    assert buckets.try_acquire(10, INTERACTIVE) == 0
+
+
+def test_bulk_cannot_use_the_reserve(buckets, clock):
+    assert buckets.try_acquire(80, BULK) == 0
+
+    assert buckets.try_acquire(1, BULK) > 0
+    assert buckets.try_acquire(20, INTERACTIVE) == 0
+
+
+def test_waiting_interactive_caller_holds_back_bulk(buckets, clock):
+    assert buckets.try_acquire(100, INTERACTIVE) == 0
+    assert buckets.try_acquire(50, INTERACTIVE) == pytest.approx(5.0)
+
+    # Enough tokens for this bulk request, but the interactive one is first
+    clock.advance(3.0)
+    assert buckets.try_acquire(1, BULK) == pytest.approx(2.0)
+
+    # Once it is served bulk only waits for tokens above the reserve
+    clock.advance(2.0)
+    assert buckets.try_acquire(50, INTERACTIVE) == 0
+    assert buckets.try_acquire(1, BULK) == pytest.approx(2.1)
+
+
+def test_pause_stops_every_caller(buckets, clock):
+    buckets.pause(5.0)
+
+    assert buckets.try_acquire(1, INTERACTIVE) == pytest.approx(5.0)
+    assert buckets.try_acquire(1, BULK) == pytest.approx(5.0)
+
+    clock.advance(5.0)
+    assert buckets.try_acquire(1, INTERACTIVE) == 0
+
+
+def test_refund_returns_unused_tokens(buckets, clock):
+    assert buckets.try_acquire(100, INTERACTIVE) == 0
+
+    buckets.refund(60)
+    assert buckets.try_acquire(60, INTERACTIVE) == 0
+
+    # Refunds never overfill the bucket
+    buckets.refund(1000)
+    assert buckets.try_acquire(100, INTERACTIVE) == 0
+    assert buckets.try_acquire(1, INTERACTIVE) > 0
+
+
+def test_state_is_shared_through_the_file(buckets, clock, tmp_path):
+    other = SharedTokenBuckets(
+        buckets.path,
+        requests_per_minute=60,
+        tokens_per_minute=600,
+        burst_seconds=10,
+    )
+
+    assert buckets.try_acquire(100, INTERACTIVE) == 0
+    assert other.try_acquire(10, INTERACTIVE) > 0
+
+
+def test_acquire_async_takes_the_file_lock_off_the_event_loop(buckets, clock, monkeypatch):
+    threads = []
+    try_acquire = buckets.try_acquire
+
+    def recording(tokens, priority):
+        threads.append(threading.get_ident())
+        return try_acquire(tokens, priority)
+
+    monkeypatch.setattr(buckets, "try_acquire", recording)
+
+    async def main():
+        await buckets.acquire_async(10, INTERACTIVE)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+
+    assert threads and loop_thread not in threads
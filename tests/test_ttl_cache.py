@@ -0,0 +1,32 @@
+import time
+
+from app.utils.ttl_cache import TTLCache
+
+
+def test_entries_expire_and_count_as_misses():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["expired"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_least_recently_used_entry_is_evicted_when_full():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.invalidate("c") is True
+    assert cache.get("c") is None
+    assert cache.stats()["evicted"] == 1